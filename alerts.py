@@ -0,0 +1,268 @@
+"""
+Precomputed expiry and stock alerts.
+
+``compute_alerts()`` scans medicines and inventory once, writes one document per
+alerting item to the ``alerts`` collection (removing alerts that no longer
+apply) and a summary to ``stats/alerts``. The dashboard, the inventory page and
+the header notifications bell read the summary instead of rescanning both
+collections on every page view.
+
+Run it from cron with ``flask --app app compute-alerts`` or set
+ALERTS_INTERVAL_SECONDS to recompute in-process.
+
+Environment:
+    ALERTS_INTERVAL_SECONDS   in-process recompute interval; 0 disables (default 0)
+    ALERTS_MAX_AGE_SECONDS    older summaries are ignored by the pages (default 3600)
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from counters import COUNTERS_COLLECTION
+import sharded_counter
+import watermarks
+
+logger = logging.getLogger(__name__)
+
+ALERTS_COLLECTION = 'alerts'
+ALERTS_SUMMARY_DOC = 'alerts'
+EXPIRY_HORIZON_DAYS = 30
+TOP_ALERTS = 10
+BATCH_LIMIT = 400
+# The header bell reads the summary on every page; keep it per process briefly
+SUMMARY_CACHE_SECONDS = 60
+
+# Most severe first; an item gets a single alert of its most severe kind
+SEVERITY = {'expired': 0, 'out_of_stock': 1, 'critical': 2, 'expiring': 3, 'low_stock': 4}
+
+
+def summary_ref(db):
+    return db.collection(COUNTERS_COLLECTION).document(ALERTS_SUMMARY_DOC)
+
+
+def _expiry_date(data):
+    expiry = data.get('expiry') or data.get('expiration')
+    if isinstance(expiry, datetime):
+        return expiry.date()
+    if isinstance(expiry, str):
+        try:
+            return datetime.strptime(expiry[:10], '%Y-%m-%d').date()
+        except Exception:
+            return None
+    return None
+
+
+def _int_or_none(val):
+    try:
+        return int(val) if val is not None and str(val) != '' else None
+    except Exception:
+        return None
+
+
+def stock_level(stock, min_i):
+    """'out_of_stock', 'critical', 'low_stock' or None, using the inventory page thresholds."""
+    if stock <= 0:
+        return 'out_of_stock'
+    if min_i is not None and stock < min_i:
+        # critical: below half of min (at least threshold 1)
+        return 'critical' if stock < max(min_i // 2, 1) else 'low_stock'
+    return None
+
+
+def _scan(db, today, horizon):
+    counts = {
+        'total_medicines': 0,
+        'expiring_soon': 0,
+        'expired': 0,
+        'inventory_items': 0,
+        'low_stock': 0,
+        'critical': 0,
+        'out_of_stock': 0,
+    }
+    found = {}
+
+    for d in db.collection('medicines').stream():
+        counts['total_medicines'] += 1
+        data = d.to_dict() or {}
+        exp = _expiry_date(data)
+        if not exp or exp > horizon:
+            continue
+        kind = 'expired' if exp < today else 'expiring'
+        counts['expiring_soon' if kind == 'expiring' else 'expired'] += 1
+        found[f'medicines_{d.id}'] = {
+            'kind': kind,
+            'source': 'medicines',
+            'item_id': d.id,
+            'name': data.get('name') or d.id,
+            'expiry': exp.isoformat(),
+            'days_left': (exp - today).days,
+        }
+
+    inventory = [(it.id, it.to_dict() or {}) for it in db.collection('inventory').stream()]
+    shard_sums = sharded_counter.shard_sums(db, [(item_id, sharded_counter.shard_count(data))
+                                                 for item_id, data in inventory if data.get('stock_shards')])
+    for item_id, data in inventory:
+        counts['inventory_items'] += 1
+        try:
+            stock = int(data.get('stock') or 0) + shard_sums.get(item_id, 0)
+        except Exception:
+            stock = 0
+        min_i = _int_or_none(data.get('min'))
+        level = stock_level(stock, min_i)
+        # Same counting rules as the inventory page: critical items are also low
+        if stock <= 0:
+            counts['out_of_stock'] += 1
+        if min_i is not None and stock < min_i:
+            counts['low_stock'] += 1
+            if stock < max(min_i // 2, 1):
+                counts['critical'] += 1
+        if level:
+            found[f'inventory_{item_id}'] = {
+                'kind': level,
+                'source': 'inventory',
+                'item_id': item_id,
+                'name': data.get('name') or item_id,
+                'stock': stock,
+                'min': min_i,
+            }
+    return counts, found
+
+
+def _alert_sort_key(alert):
+    return (SEVERITY.get(alert['kind'], 99), alert.get('days_left', 0), alert.get('stock', 0), alert['name'])
+
+
+def compute_alerts(db, horizon_days=EXPIRY_HORIZON_DAYS):
+    """Recompute all alerts and the summary document; returns the summary."""
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    counts, found = _scan(db, today, today + timedelta(days=horizon_days))
+
+    # Only write alerts that changed, and delete the ones that cleared
+    existing = {d.id: (d.to_dict() or {}) for d in db.collection(ALERTS_COLLECTION).stream()}
+    ops = []
+    for alert_id, alert in found.items():
+        old = existing.get(alert_id)
+        if old is None or any(old.get(k) != v for k, v in alert.items()):
+            ops.append(('set', alert_id, {**alert, 'severity': SEVERITY[alert['kind']], 'computed_at': now}))
+    for alert_id in existing:
+        if alert_id not in found:
+            ops.append(('delete', alert_id, None))
+
+    coll = db.collection(ALERTS_COLLECTION)
+    for start in range(0, len(ops), BATCH_LIMIT):
+        batch = db.batch()
+        for op, alert_id, data in ops[start:start + BATCH_LIMIT]:
+            if op == 'set':
+                batch.set(coll.document(alert_id), data)
+            else:
+                batch.delete(coll.document(alert_id))
+        batch.commit()
+
+    top = sorted(found.values(), key=_alert_sort_key)[:TOP_ALERTS]
+    summary = {
+        **counts,
+        'total_alerts': len(found),
+        'top': top,
+        'horizon_days': horizon_days,
+        'computed_at': now,
+    }
+    batch = db.batch()
+    batch.set(summary_ref(db), summary)
+    if ops:
+        # Pages showing alerts are only stale when an alert changed, not on every recompute
+        watermarks.bump(batch, db, ALERTS_COLLECTION)
+    batch.commit()
+    _cache['summary'], _cache['at'] = summary, time.monotonic()
+    return summary
+
+
+def _max_age():
+    return int(os.environ.get('ALERTS_MAX_AGE_SECONDS', '3600'))
+
+
+def read_summary(db, max_age=None, timeout=None):
+    """The stored summary, or None if it is missing or older than ``max_age`` seconds."""
+    snap = summary_ref(db).get(timeout=timeout)
+    if not snap.exists:
+        return None
+    summary = snap.to_dict() or {}
+    computed = summary.get('computed_at')
+    if not isinstance(computed, datetime):
+        return None
+    if computed.tzinfo is None:
+        computed = computed.replace(tzinfo=timezone.utc)
+    age = (datetime.now(timezone.utc) - computed).total_seconds()
+    if age > (max_age if max_age is not None else _max_age()):
+        return None
+    return summary
+
+
+_cache = {'summary': None, 'at': None, 'refreshing': False}
+_cache_lock = threading.Lock()
+
+
+def cached_summary(db, read, refresh=True):
+    """read_summary() memoized for SUMMARY_CACHE_SECONDS; for the header bell.
+
+    ``read(fn, *args)`` runs the read (the connection manager's ``read``, so it
+    goes through the circuit breaker, retries and the request deadline). No lock
+    is held while reading: one caller refreshes an expired summary and the others
+    get the last one meanwhile. With ``refresh`` false (Firestore degraded, the
+    request budget spent) the last summary is returned without reading.
+    """
+    with _cache_lock:
+        fresh = _cache['at'] is not None and time.monotonic() - _cache['at'] < SUMMARY_CACHE_SECONDS
+        if fresh or not refresh or _cache['refreshing']:
+            return _cache['summary']
+        _cache['refreshing'] = True
+    summary = _cache['summary']
+    try:
+        summary = read(read_summary, db)
+    except Exception as e:
+        logger.warning("Could not read alert summary: %s", e)
+    finally:
+        with _cache_lock:
+            _cache['summary'], _cache['at'], _cache['refreshing'] = summary, time.monotonic(), False
+    return summary
+
+
+class AlertScheduler:
+    """Recomputes alerts every ``interval`` seconds in a daemon thread.
+
+    Every web process runs its own scheduler, so a run is skipped when another
+    process has already refreshed the summary within the interval.
+    """
+
+    def __init__(self, get_db, interval=None):
+        self._get_db = get_db
+        self._interval = int(interval if interval is not None else os.environ.get('ALERTS_INTERVAL_SECONDS', '0'))
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._interval > 0
+
+    def ensure_started(self):
+        # Started on first request so forking servers never inherit the thread
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name='alert-scheduler', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            db = self._get_db()
+            if db is not None:
+                try:
+                    if read_summary(db, max_age=self._interval * 0.9) is None:
+                        compute_alerts(db)
+                except Exception as e:
+                    logger.exception("Scheduled alert computation failed")
+            time.sleep(self._interval)
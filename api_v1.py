@@ -0,0 +1,329 @@
+"""
+Versioned JSON API for POS terminals and scripts: ``/api/v1/<resource>``.
+
+Resources are ``medicines``, ``inventory``, ``orders``, ``suppliers`` and
+``reports``. Requests need a signed-in session (the same cookie
+``/verify-token`` sets); without one they get a 401 JSON error.
+
+    GET /api/v1/inventory?category=Antibiotics&fields=name,stock&limit=100
+    GET /api/v1/orders?status__in=pending,approved&sort=-date
+    GET /api/v1/orders?date__gte=2024-01-01&cursor=<next_cursor>
+    GET /api/v1/medicines/<id>?fields=name,expiry
+
+List responses are ``{"data": [...], "next_cursor": ...}``; pass
+``next_cursor`` back as ``cursor`` for the next page (null on the last one).
+Pages are read with ``start_after`` on the sort order, so a page costs one
+document read per row however deep it is. ``fields=`` becomes a Firestore
+``select()``, so only the named fields are transferred (``id`` is always
+included).
+
+Filters are limited to each resource's ``filters`` below: ``field=value``
+and ``field__in=a,b`` for equality, and ``__gt``/``__gte``/``__lt``/``__lte``
+on at most one range field, which is then also the sort field. ``sort=``
+(``-`` for descending) accepts the range fields. Combinations Firestore has no
+composite index for are answered with a 400 naming the missing index.
+
+Inventory ``stock`` is the summed total for items with sharded stock
+(sharded_counter.py); ``stock`` filters and sorting see only the item
+document's own ``stock`` field for those items.
+
+Every response carries an ETag of its body; a matching ``If-None-Match`` gets
+a 304 without the body.
+
+Environment:
+    API_PAGE_SIZE       rows per page when ``limit`` is not given (default 50)
+    API_MAX_PAGE_SIZE   largest accepted ``limit`` (default 500)
+"""
+import base64
+import json
+import logging
+import os
+from datetime import date, datetime, timezone
+
+from flask import Blueprint, jsonify, request, session
+
+import records
+import sharded_counter
+from firebase_config import get_db, manager as fs, CircuitOpenError
+from request_deadline import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+RANGE_OPS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+MAX_IN_VALUES = 30
+
+# Resource -> fields clients may select, and the filterable (indexed) fields with their value type.
+# Equality filters are single-field indexes; ``range`` fields can also be sorted on.
+RESOURCES = {
+    'medicines': {
+        'fields': records.Medicine.fields(),
+        'equality': {'category': str, 'supplier': str, 'code': str},
+        'range': {'stock': int, 'expiry': str, 'updated_at': datetime},
+    },
+    'inventory': {
+        'fields': records.InventoryItem.fields(),
+        'equality': {'category': str, 'supplier': str, 'code': str, 'active': bool},
+        'range': {'stock': int, 'expiry': str, 'updated_at': datetime},
+    },
+    'orders': {
+        'fields': records.Order.fields(),
+        'equality': {'status': str, 'supplier': str, 'created_by': str},
+        'range': {'date': datetime, 'total': float, 'updated_at': datetime},
+    },
+    'suppliers': {
+        'fields': records.Supplier.fields(),
+        'equality': {'status': str, 'payment_terms': str},
+        'range': {'created_at': datetime, 'updated_at': datetime},
+    },
+    'reports': {
+        'fields': ['id', 'title', 'type', 'status', 'progress', 'export_format', 'output', 'error',
+                   'created_by', 'created_at', 'finished_at', 'updated_at'],
+        'equality': {'status': str, 'type': str, 'created_by': str},
+        'range': {'created_at': datetime, 'updated_at': datetime},
+    },
+}
+
+
+class ApiError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@bp.errorhandler(ApiError)
+def _api_error(e):
+    return jsonify({'error': str(e)}), e.status
+
+
+@bp.before_request
+def _require_session():
+    if 'user' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+
+
+def _resource(name):
+    spec = RESOURCES.get(name)
+    if spec is None:
+        raise ApiError(f'Unknown resource: {name}', status=404)
+    return spec
+
+
+def page_size_limits():
+    return int(os.environ.get('API_PAGE_SIZE', '50')), int(os.environ.get('API_MAX_PAGE_SIZE', '500'))
+
+
+# -- values --
+def _parse_value(raw, kind, name):
+    try:
+        if kind is bool:
+            if raw.lower() not in ('true', 'false', '1', '0'):
+                raise ValueError(raw)
+            return raw.lower() in ('true', '1')
+        if kind is datetime:
+            value = datetime.fromisoformat(raw.replace('Z', '+00:00'))
+            return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return kind(raw)
+    except ValueError:
+        raise ApiError(f'Invalid value for {name}: {raw!r}') from None
+
+
+def _jsonable(value):
+    """Firestore values as JSON: timestamps as ISO 8601, references as their path."""
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if hasattr(value, 'path'):
+        return value.path
+    if hasattr(value, 'latitude'):
+        return {'latitude': value.latitude, 'longitude': value.longitude}
+    return str(value)
+
+
+def encode_cursor(values):
+    """Opaque page cursor for the sort values of the last row (datetimes tagged so they round-trip)."""
+    tagged = [{'$dt': _jsonable(v)} if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(tagged, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, expected):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != expected:
+            raise ValueError(cursor)
+        return [datetime.fromisoformat(v['$dt']) if isinstance(v, dict) and '$dt' in v else v
+                for v in values]
+    except (ValueError, TypeError, KeyError):
+        raise ApiError('Invalid cursor') from None
+
+
+# -- query parameters --
+def _selected_fields(spec):
+    """Requested fields (always with 'id'), or None for whole documents."""
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    names = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in names if f not in spec['fields']]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}; available: {', '.join(spec['fields'])}")
+    return list(dict.fromkeys(['id', *names]))
+
+
+def _filters(spec):
+    """(field, op, value) triples from the query string; at most one range field."""
+    filters = []
+    for key, raw in request.args.items(multi=True):
+        if key in ('fields', 'limit', 'cursor', 'sort'):
+            continue
+        field, _, op = key.partition('__')
+        if not op and field in spec['equality']:
+            filters.append((field, '==', _parse_value(raw, spec['equality'][field], key)))
+        elif op == 'in' and field in spec['equality']:
+            values = [_parse_value(v, spec['equality'][field], key) for v in raw.split(',') if v]
+            if not values or len(values) > MAX_IN_VALUES:
+                raise ApiError(f'{key} takes 1 to {MAX_IN_VALUES} values')
+            filters.append((field, 'in', values))
+        elif op in RANGE_OPS and field in spec['range']:
+            filters.append((field, RANGE_OPS[op], _parse_value(raw, spec['range'][field], key)))
+        else:
+            raise ApiError(f"Unsupported filter: {key}; equality: {', '.join(spec['equality'])}; "
+                           f"range (__gt, __gte, __lt, __lte): {', '.join(spec['range'])}")
+    range_fields = {f for f, op, _ in filters if op in RANGE_OPS.values()}
+    if len(range_fields) > 1:
+        raise ApiError(f"Range filters on more than one field: {', '.join(sorted(range_fields))}")
+    return filters, next(iter(range_fields), None)
+
+
+def _sort(spec, range_field):
+    """[(field, direction)] ending in __name__, so every row has a unique position for cursors."""
+    raw = request.args.get('sort') or ''
+    field, direction = (raw[1:], 'DESCENDING') if raw.startswith('-') else (raw, 'ASCENDING')
+    if field and field not in spec['range']:
+        raise ApiError(f"Cannot sort on {field}; sortable: {', '.join(spec['range'])}")
+    # Firestore requires the first sort field to be the one with the range filter
+    if range_field and field and field != range_field:
+        raise ApiError(f'With a range filter on {range_field} the results can only be sorted on {range_field}')
+    field = field or range_field
+    return ([(field, direction)] if field else []) + [('__name__', direction)]
+
+
+def _limit():
+    default, maximum = page_size_limits()
+    raw = request.args.get('limit')
+    if raw is None:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= maximum:
+        raise ApiError(f'limit must be between 1 and {maximum}')
+    return limit
+
+
+def _rows(resource, snaps, fields):
+    rows = [{'id': snap.id, **(snap.to_dict() or {})} for snap in snaps]
+    if resource == 'inventory':
+        # Items with sharded stock (sharded_counter.py) report the summed total
+        rows = fs.call(sharded_counter.overlay, get_db(), rows)
+    if fields is not None:
+        rows = [{f: row[f] for f in fields if f in row} for row in rows]
+    return [_jsonable(row) for row in rows]
+
+
+def _conditional(payload):
+    response = jsonify(payload)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def _run(fn):
+    """Map Firestore failures to JSON errors."""
+    from google.api_core import exceptions
+    if get_db() is None:
+        raise ApiError('Firestore client is not initialized', status=503)
+    try:
+        return fn()
+    except exceptions.FailedPrecondition as e:
+        # Raised with a console link when a filter/sort combination lacks a composite index
+        raise ApiError(f'This filter and sort combination needs a composite index: {e.message}') from None
+    except (CircuitOpenError, DeadlineExceededError):
+        raise ApiError('Firestore is unavailable, retry shortly', status=503) from None
+
+
+# -- routes --
+@bp.route('/<resource>')
+def list_resource(resource):
+    spec = _resource(resource)
+    fields = _selected_fields(spec)
+    filters, range_field = _filters(spec)
+    orders = _sort(spec, range_field)
+    limit = _limit()
+    cursor = request.args.get('cursor')
+
+    def read():
+        db = get_db()
+        query = db.collection(resource)
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        for field, direction in orders:
+            query = query.order_by(field, direction=direction)
+        if fields is not None:
+            # The sort fields are needed for the next cursor even when not requested
+            sort_fields = [f for f, _ in orders if f != '__name__']
+            extra = ['stock_shards'] if resource == 'inventory' and 'stock' in fields else []
+            query = query.select([f for f in dict.fromkeys(fields + sort_fields + extra) if f != 'id'])
+        if cursor:
+            values = decode_cursor(cursor, len(orders))
+            query = query.start_after({field: value for (field, _), value in zip(orders, values)})
+        # One extra row tells whether there is a next page
+        docs = fs.stream(query.limit(limit + 1))
+        return docs, _rows(resource, docs[:limit], fields)
+
+    try:
+        docs, data = _run(read)
+    except ApiError:
+        raise
+    except Exception:
+        logger.exception("API list of %s failed", resource)
+        return jsonify({'error': f'Failed to list {resource}'}), 500
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor([last.id if f == '__name__' else last.get(f) for f, _ in orders])
+    return _conditional({'data': data, 'next_cursor': next_cursor})
+
+
+@bp.route('/<resource>/<doc_id>')
+def get_resource(resource, doc_id):
+    spec = _resource(resource)
+    fields = _selected_fields(spec)
+
+    def read():
+        snap = fs.get(get_db().collection(resource).document(doc_id))
+        return snap, _rows(resource, [snap], fields)[0] if snap.exists else None
+
+    try:
+        snap, data = _run(read)
+    except ApiError:
+        raise
+    except Exception:
+        logger.exception("API read of %s/%s failed", resource, doc_id)
+        return jsonify({'error': f'Failed to read {resource}/{doc_id}'}), 500
+    if not snap.exists:
+        return jsonify({'error': f'Not found: {resource}/{doc_id}'}), 404
+    return _conditional({'data': data})
@@ -1,32 +1,109 @@
 import os
 import json
+import logging
+import click
 import base64
 from datetime import datetime, timezone, timedelta
 from functools import wraps
-from flask import Flask, render_template, redirect, url_for, session, flash, request, jsonify, make_response, g
-from flask_cors import CORS
+from flask import Flask, render_template, redirect, url_for, session, flash, request, jsonify, make_response, g, send_file, Response, stream_with_context
+from flask.cli import AppGroup
+from werkzeug.utils import secure_filename
 from translations import get_translation
-from firebase_admin import auth, credentials, firestore
-from firebase_config import initialize_firebase
+from lazy_imports import lazy_module
+from firebase_config import get_clients, get_db, get_bucket, manager as fs, CircuitOpenError
+from order_workflow import transition_order, next_statuses, OrderTransitionError
+import counters
+from report_jobs import ReportJobRunner, FINAL_STATUSES
+import report_storage
+import alerts
+import order_archive
+import request_deadline
+import profiling
+import logging_setup
+import compression
+import assets
+import local_auth
+import api_v1
+import watermarks
+import stock_adjust
+import sharded_counter
+import idempotency
+import sqlite_replica
+import sales_series
+import records
+import inventory_stats
+from stats_cache import StatsCache
+from collection_mirror import CollectionMirror
 from dotenv import load_dotenv
-from google.oauth2 import id_token as google_id_token
-from google.auth.transport import requests as google_requests
+
+# Heavy SDK modules are imported on first use (see lazy_imports.py) to keep worker boot fast
+auth = lazy_module('firebase_admin.auth')
+firestore = lazy_module('firebase_admin.firestore')
+google_id_token = lazy_module('google.oauth2.id_token')
+google_requests = lazy_module('google.auth.transport.requests')
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env if present (dev convenience)
 load_dotenv()
 
-# Initialize Firebase using environment configuration (safe for open source)
-try:
-    db, bucket = initialize_firebase()
-except Exception as e:
-    print(f"Firebase initialization warning: {str(e)}")
-    db, bucket = (None, None)
 
-app = Flask(__name__, static_folder='static', template_folder='templates')
-# Read from environment; provide a dev default that should be changed in production
-app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-change-me')  # Set FLASK_SECRET_KEY in your environment
+class _Routes:
+    """Page routes and request hooks, recorded at import and attached to the app in create_app().
+
+    Used like the Flask methods of the same name. Unlike a blueprint it keeps the
+    endpoint names unprefixed, so url_for('dashboard') and REQUEST_DEADLINES
+    keys stay as they are.
+    """
+
+    def __init__(self):
+        self._setup = []
+
+    def route(self, rule, **options):
+        def decorator(f):
+            self._setup.append(lambda app: app.route(rule, **options)(f))
+            return f
+        return decorator
+
+    def before_request(self, f):
+        self._setup.append(lambda app: app.before_request(f))
+        return f
+
+    def context_processor(self, f):
+        self._setup.append(lambda app: app.context_processor(f))
+        return f
+
+    def init_app(self, app):
+        for setup in self._setup:
+            setup(app)
+
+
+routes = _Routes()
+# Maintenance commands (`flask rebuild-counters`, ...); added to app.cli by create_app()
+cli = AppGroup('app')
+
+# Background report generation; resolves the clients when each job runs
+report_runner = ReportJobRunner(get_clients)
+# Optional in-process alert recomputation (ALERTS_INTERVAL_SECONDS); cron can use `flask compute-alerts`
+alert_scheduler = alerts.AlertScheduler(get_db)
+# Stale-while-revalidate cache for the dashboard/inventory/orders/suppliers stats (STATS_CACHE_*)
+page_stats = StatsCache()
+# Optional listener-fed copy of medicines/inventory/suppliers for the list pages (FIRESTORE_MIRROR)
+mirror = CollectionMirror(get_db)
+
+
+def _watermarks_moved(collections):
+    if 'inventory' in collections:
+        # Stock changed, possibly on another worker: re-read sharded totals so the page matches its ETag
+        sharded_counter.cache.invalidate()
 
-@app.before_request
+
+# ETags from per-collection change watermarks; unchanged list pages are answered with 304 (see watermarks.py)
+pages = watermarks.ConditionalPages(get_db, fs.get_all, stats_cache=page_stats, mirror=mirror,
+                                    page_state=lambda: page_state(), on_change=_watermarks_moved,
+                                    degraded=lambda: fs.breaker.state != 'closed')
+
+@routes.before_request
 def before_request():
     # Set language from session, cookie, or default to English
     g.lang = session.get('language', request.cookies.get('language', 'en'))
@@ -38,52 +115,118 @@ def before_request():
     # Set translation function
     g._ = lambda key: get_translation(key, g.lang)
     g.now = datetime.now()
+    alert_scheduler.ensure_started()
+    mirror.ensure_started()
     # Set response headers for language
     response = make_response()
     response.set_cookie('language', g.lang, max_age=60*60*24*30)  # 30 days
 
-@app.context_processor
+@routes.context_processor
 def inject_translations():
     # Use session directly to avoid relying on setup order
     lang = session.get('language', 'en')
     return dict(
         _=lambda key: get_translation(key, lang),
         gettext=lambda key: get_translation(key, lang),
-        now=datetime.now()
+        now=datetime.now(),
+        alerts_summary=alert_summary() if session.get('user') else None,
+        firestore_degraded=fs.breaker.state != 'closed',
     )
 
-# Use dev-friendly cookies locally; secure settings in production
-# Flask 3 removed app.config['ENV'], so detect development using env vars or FLASK_DEBUG
-_env = os.environ.get('FLASK_ENV') or os.environ.get('ENV')
-_is_dev = (_env == 'development') or (os.environ.get('FLASK_DEBUG') == '1')
-
-if _is_dev:
-    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-    app.config['SESSION_COOKIE_SECURE'] = False
-else:
-    app.config['SESSION_COOKIE_SAMESITE'] = 'None'
-    app.config['SESSION_COOKIE_SECURE'] = True
-
-# Enable CORS
-CORS(app, resources={
-    r"/*": {
-        "origins": ["http://localhost:5000", "http://127.0.0.1:5000"],
-        "supports_credentials": True
+def alert_summary():
+    """The header bell's alert summary; the last one read is reused while Firestore is degraded or the request budget is spent."""
+    db = get_db()
+    if db is None:
+        return None
+    deadline = request_deadline.current()
+    spent = deadline is not None and (deadline.exceeded or deadline.remaining() <= 0)
+    return alerts.cached_summary(db, fs.read, refresh=fs.breaker.state == 'closed' and not spent)
+
+def page_state():
+    """What every page shows besides its own data (header alert bell, degraded banner); part of page ETags."""
+    summary = alert_summary()
+    return {
+        'alerts': {k: v for k, v in summary.items() if k != 'computed_at'} if summary else None,
+        'degraded': fs.breaker.state != 'closed',
     }
-})
+
+
+def create_app():
+    """Application factory used by gunicorn (`gunicorn 'app:create_app()'`).
+
+    Builds the Flask app with CORS, the request hooks, the API blueprint, the
+    page routes and the CLI commands. flask_cors is imported here, and Firebase
+    clients are created on first use, so importing this module stays cheap.
+    The module attribute ``app`` (for `flask run` and `python app.py`) is
+    built by this factory the first time it is looked up.
+    """
+    from flask_cors import CORS
+
+    # Firebase is initialized lazily by firebase_config.get_clients() on first use,
+    # using environment configuration (safe for open source)
+    app = Flask(__name__, static_folder='static', template_folder='templates')
+    CORS(app, resources={
+        r"/*": {
+            "origins": ["http://localhost:5000", "http://127.0.0.1:5000"],
+            "supports_credentials": True
+        }
+    })
+    # Read from environment; provide a dev default that should be changed in production
+    app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-change-me')  # Set FLASK_SECRET_KEY in your environment
+
+    # Use dev-friendly cookies locally; secure settings in production
+    # Flask 3 removed app.config['ENV'], so detect development using env vars or FLASK_DEBUG
+    env = os.environ.get('FLASK_ENV') or os.environ.get('ENV')
+    if env == 'development' or os.environ.get('FLASK_DEBUG') == '1':
+        app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+        app.config['SESSION_COOKIE_SECURE'] = False
+    else:
+        app.config['SESSION_COOKIE_SAMESITE'] = 'None'
+        app.config['SESSION_COOKIE_SECURE'] = True
+
+    # JSON logs through a background writer, with request ids and slow-request dumps (see logging_setup.py)
+    logging_setup.init_app(app)
+    # Time budget for the Firestore calls of each request (see request_deadline.py)
+    request_deadline.init_app(app)
+    # gzip/brotli for text responses, optional HTML minification (see compression.py)
+    compression.init_app(app)
+    # Hashed CSS/JS bundles from `flask build-assets`, linked with asset_url() (see assets.py)
+    assets.init_app(app)
+    # idempotency_key() for forms; keyed creates are written once however often they are submitted (see idempotency.py)
+    idempotency.init_app(app)
+    # Analytics replica file under the instance folder (see sqlite_replica.py)
+    sqlite_replica.init_app(app)
+    # Opt-in profiling for admins (X-Profile header) or a sampled share of requests (see profiling.py)
+    profiling.init_app(app)
+    # JSON API for POS terminals and scripts: /api/v1/<resource> with cursors, fields= and ETags (see api_v1.py)
+    app.register_blueprint(api_v1.bp)
+    routes.init_app(app)
+    for command in cli.commands.values():
+        app.cli.add_command(command)
+    return app
+
+
+def __getattr__(name):
+    # `flask --app app run` looks up `app`; build it on that first lookup, not at import
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Firebase Authentication and Database Functions
 def get_user_by_email(email):
+    db = get_db()
     try:
         users_ref = db.collection('users')
         query = users_ref.where('email', '==', email).limit(1)
-        results = query.stream()
+        results = fs.stream(query)
         
         for user in results:
             return user.to_dict()
         return None
     except Exception as e:
-        print(f"Error getting user: {str(e)}")
+        logger.exception("Error getting user")
         return None
 
 def verify_password(user_data, password):
@@ -91,14 +234,24 @@ def verify_password(user_data, password):
     # This is a simplified example - use Firebase Auth in production
     return user_data.get('password') == password
 
-def get_collection(collection_name):
-    try:
+def stream_collection(db, collection_name):
+    """All documents of a collection as records (records.py), from the in-process mirror when it is warm."""
+    docs = mirror.get(collection_name)
+    if docs is None:
         if db is None:
             raise RuntimeError('Firestore client is not initialized')
-        col_ref = db.collection(collection_name).stream()
-        return [{'id': doc.id, **doc.to_dict()} for doc in col_ref]
+        docs = [records.make(collection_name, doc.id, doc.to_dict()) for doc in fs.stream(db.collection(collection_name))]
+    if collection_name == 'inventory' and db is not None:
+        # Items with sharded stock show their summed total
+        docs = fs.call(sharded_counter.overlay, db, docs)
+    return docs
+
+def get_collection(collection_name):
+    db = get_db()
+    try:
+        return stream_collection(db, collection_name)
     except Exception as e:
-        print(f"Error fetching collection {collection_name}: {str(e)}")
+        logger.exception("Error fetching collection %s", collection_name)
         return []
 
 def login_required(f):
@@ -112,20 +265,32 @@ def login_required(f):
     return decorated_function
 
 
-@app.route('/login')
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if (session.get('user') or {}).get('role') != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@routes.route('/login')
+@compression.cached_page
 def login():
     if 'user' in session:
         return redirect(url_for('dashboard'))
     return render_template('login.html')
 
-@app.route('/signup')
+@routes.route('/signup')
+@compression.cached_page
 def signup():
     if 'user' in session:
         return redirect(url_for('dashboard'))
     return render_template('signup.html')
 
-@app.route('/verify-token', methods=['POST', 'OPTIONS'])
+@routes.route('/verify-token', methods=['POST', 'OPTIONS'])
 def verify_token():
+    db = get_db()
     if request.method == 'OPTIONS':
         response = make_response()
         response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
@@ -148,52 +313,57 @@ def verify_token():
                 return base64.urlsafe_b64decode(b.encode('utf-8')).decode('utf-8')
             header = json.loads(b64url_decode(header_b64))
             payload = json.loads(b64url_decode(payload_b64))
-            print(f"[verify-token] Token claims preview: aud={payload.get('aud')}, iss={payload.get('iss')}, sub={payload.get('sub')}")
+            logger.debug("Token claims preview: aud=%s, iss=%s, sub=%s", payload.get('aud'), payload.get('iss'), payload.get('sub'))
         except Exception as decode_err:
-            print(f"[verify-token] Failed to decode token (non-fatal): {decode_err}")
+            logger.debug("Failed to decode token (non-fatal): %s", decode_err)
 
         # Verify the ID token
         decoded_token = None
         uid = None
-        try:
-            # Prefer Admin SDK when initialized
-            clock_skew = int(os.environ.get('AUTH_CLOCK_SKEW_SECONDS', '300'))
-            decoded_token = auth.verify_id_token(id_token, clock_skew_seconds=clock_skew)
-            uid = decoded_token.get('uid') or decoded_token.get('sub')
-        except Exception as admin_verify_err:
-            # Fallback: verify using google-auth without requiring Admin app
+        # Locally signed test tokens (load tests on the in-memory backend, see local_auth.py)
+        decoded_token = local_auth.verify_test_token(id_token)
+        if decoded_token is not None:
+            uid = decoded_token.get('sub')
+        else:
             try:
-                aud = os.environ.get('FIREBASE_PROJECT_ID') or os.environ.get('GCLOUD_PROJECT')
-                if not aud:
-                    try:
-                        header_b64, payload_b64, _sig = id_token.split('.')
-                        def b64url_decode(b):
-                            b += '=' * (-len(b) % 4)
-                            return base64.urlsafe_b64decode(b.encode('utf-8')).decode('utf-8')
-                        payload = json.loads(b64url_decode(payload_b64))
-                        aud = payload.get('aud')
-                    except Exception:
-                        aud = None
-                req = google_requests.Request()
+                # Prefer Admin SDK when initialized
                 clock_skew = int(os.environ.get('AUTH_CLOCK_SKEW_SECONDS', '300'))
-                try:
-                    decoded_token = google_id_token.verify_firebase_token(id_token, req, audience=aud, clock_skew_in_seconds=clock_skew)
-                except TypeError:
-                    # Older google-auth versions may not support clock_skew_in_seconds
-                    decoded_token = google_id_token.verify_firebase_token(id_token, req, audience=aud)
+                decoded_token = auth.verify_id_token(id_token, clock_skew_seconds=clock_skew)
                 uid = decoded_token.get('uid') or decoded_token.get('sub')
-            except Exception as e2:
-                print(f"[verify-token] Token verification failed: {e2}")
-                raise
+            except Exception as admin_verify_err:
+                # Fallback: verify using google-auth without requiring Admin app
+                try:
+                    aud = os.environ.get('FIREBASE_PROJECT_ID') or os.environ.get('GCLOUD_PROJECT')
+                    if not aud:
+                        try:
+                            header_b64, payload_b64, _sig = id_token.split('.')
+                            def b64url_decode(b):
+                                b += '=' * (-len(b) % 4)
+                                return base64.urlsafe_b64decode(b.encode('utf-8')).decode('utf-8')
+                            payload = json.loads(b64url_decode(payload_b64))
+                            aud = payload.get('aud')
+                        except Exception:
+                            aud = None
+                    req = google_requests.Request()
+                    clock_skew = int(os.environ.get('AUTH_CLOCK_SKEW_SECONDS', '300'))
+                    try:
+                        decoded_token = google_id_token.verify_firebase_token(id_token, req, audience=aud, clock_skew_in_seconds=clock_skew)
+                    except TypeError:
+                        # Older google-auth versions may not support clock_skew_in_seconds
+                        decoded_token = google_id_token.verify_firebase_token(id_token, req, audience=aud)
+                    uid = decoded_token.get('uid') or decoded_token.get('sub')
+                except Exception as e2:
+                    logger.warning("Token verification failed: %s", e2)
+                    raise
         if not uid:
             return jsonify({'error': 'Authentication failed'}), 401
-        print(f"[verify-token] Token verified for uid={uid}")
+        logger.info("Token verified for uid=%s", uid)
         
         # Get or create the user's data in Firestore (if available); otherwise minimal session only
         user_data = None
         if db is not None:
             user_ref = db.collection('users').document(uid)
-            user_doc = user_ref.get()
+            user_doc = fs.get(user_ref)
 
             if not user_doc.exists:
                 # Auto-provision a minimal user profile if none exists
@@ -207,11 +377,11 @@ def verify_token():
                     'created_at': firestore.SERVER_TIMESTAMP,
                     'last_login_at': firestore.SERVER_TIMESTAMP,
                 }
-                user_ref.set(user_data, merge=True)
+                fs.call(user_ref.set, user_data, merge=True, idempotent=False)
             else:
                 user_data = user_doc.to_dict()
                 # Update last login time
-                user_ref.update({'last_login_at': firestore.SERVER_TIMESTAMP})
+                fs.call(user_ref.update, {'last_login_at': firestore.SERVER_TIMESTAMP}, idempotent=False)
         else:
             # DB not configured; create minimal user data from token claims
             default_name = (decoded_token.get('name')
@@ -237,43 +407,82 @@ def verify_token():
         response.headers.add('Access-Control-Allow-Credentials', 'true')
         return response
         
+    except local_auth.InvalidTestToken as e:
+        logger.warning("Invalid test token: %s", e)
+        return jsonify({'error': 'Invalid token'}), 401
     except auth.ExpiredIdTokenError as e:
-        print(f"[verify-token] Token expired: {e}")
+        logger.info("Token expired: %s", e)
         return jsonify({'error': 'Token expired'}), 401
     except auth.InvalidIdTokenError as e:
-        print(f"[verify-token] Invalid token: {e}")
+        logger.warning("Invalid token: %s", e)
         return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
-        print(f"[verify-token] Token verification error (unexpected): {str(e)}")
+        logger.exception("Token verification error (unexpected)")
         return jsonify({'error': 'Authentication failed'}), 500
 
-@app.route('/logout')
+@routes.route('/logout')
 def logout():
     session.pop('user', None)
     return redirect(url_for('login'))
 
-@app.route('/set_language/<lang>')
+@routes.route('/set_language/<lang>')
 def set_language(lang):
-    print(f"Setting language to: {lang}")  # Debug log
-    print(f"Session before: {dict(session)}")  # Debug log
-    
+    logger.debug("Setting language to %s (was %s)", lang, session.get('language'))
+
     if lang in ['en', 'ar']:
         session['language'] = lang
         session.modified = True  # Ensure session is saved
-        print(f"Session after: {dict(session)}")  # Debug log
         response = jsonify({'status': 'success', 'language': lang})
         response.set_cookie('language', lang, max_age=60*60*24*30)  # 30 days
         return response
     return jsonify({'status': 'error', 'message': 'Invalid language'}), 400
 
-@app.route('/')
+@routes.route('/')
 def index():
     return redirect(url_for('login'))
 
-@app.route('/dashboard')
+@routes.route('/healthz')
+@request_deadline.budget(3)
+def healthz():
+    """Health probe: Firestore circuit state; `?deep=1` also times a one-document read."""
+    deep = request.args.get('deep') in ('1', 'true', 'yes')
+    info = fs.health(deep=deep)
+    if mirror.enabled:
+        info['mirror'] = mirror.status()
+    healthy = info['circuit']['state'] != 'open' and info.get('read_ok', True)
+    return jsonify({'status': 'ok' if healthy else 'degraded', 'firestore': info}), (200 if healthy else 503)
+
+@routes.route('/metrics/cache')
 @login_required
-def dashboard():
-    # Compute real-time dashboard stats and chart data from Firestore
+@admin_required
+def cache_metrics():
+    """Hit/miss counters and entry ages of the page stats cache, and the conditional GET counters."""
+    return jsonify({**page_stats.metrics(), 'conditional_pages': pages.metrics()})
+
+@routes.route('/admin/profiles')
+@login_required
+@admin_required
+def admin_profiles():
+    """Saved request profiles, newest first (see profiling.py)."""
+    return jsonify([
+        {**p, 'created': p['created'].isoformat(),
+         'urls': [url_for('admin_profile_file', filename=f) for f in sorted(p['files'])]}
+        for p in profiling.list_profiles()
+    ])
+
+@routes.route('/admin/profiles/<filename>')
+@login_required
+@admin_required
+def admin_profile_file(filename):
+    path = profiling.profile_path(filename)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    if filename.endswith('.prof'):
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=filename)
+    return send_file(path, mimetype='text/plain')
+
+def compute_dashboard_stats(db):
+    """Dashboard stats and chart data from Firestore; returns (result, complete) for stats_cache."""
     stats = {
         'total_medicines': 0,
         'expiring_soon': 0,
@@ -281,44 +490,57 @@ def dashboard():
         'low_inventory': 0,
     }
     chart_data = { 'months': [], 'sales': [] }
+    complete = True
     try:
         if db is None:
             raise RuntimeError('Firestore client is not initialized')
 
+        # Precomputed alert summary (see alerts.py) replaces the medicine and inventory scans
+        try:
+            alert_summary = fs.read(alerts.read_summary, db)
+        except Exception as e:
+            logger.exception("Error reading alert summary")
+            alert_summary = None
+            complete = False
+
         # 1) Total medicines
-        meds_iter = db.collection('medicines').stream()
-        total_meds = 0
-        expiring = 0
-        from datetime import date
-        today = datetime.now(timezone.utc).date()
-        horizon = today + timedelta(days=30)
-        for d in meds_iter:
-            total_meds += 1
-            data = d.to_dict() or {}
-            expiry = data.get('expiry') or data.get('expiration')
-            exp_date = None
-            if expiry is not None:
-                if isinstance(expiry, datetime):
-                    exp_date = expiry.date()
-                elif isinstance(expiry, str):
-                    try:
-                        exp_date = datetime.strptime(expiry[:10], '%Y-%m-%d').date()
-                    except Exception:
-                        exp_date = None
-            if exp_date and today <= exp_date <= horizon:
-                expiring += 1
-        stats['total_medicines'] = total_meds
-        stats['expiring_soon'] = expiring
+        if alert_summary:
+            stats['total_medicines'] = alert_summary.get('total_medicines', 0)
+            stats['expiring_soon'] = alert_summary.get('expiring_soon', 0)
+        else:
+            meds_iter = fs.stream(db.collection('medicines'))
+            total_meds = 0
+            expiring = 0
+            from datetime import date
+            today = datetime.now(timezone.utc).date()
+            horizon = today + timedelta(days=30)
+            for d in meds_iter:
+                total_meds += 1
+                data = d.to_dict() or {}
+                expiry = data.get('expiry') or data.get('expiration')
+                exp_date = None
+                if expiry is not None:
+                    if isinstance(expiry, datetime):
+                        exp_date = expiry.date()
+                    elif isinstance(expiry, str):
+                        try:
+                            exp_date = datetime.strptime(expiry[:10], '%Y-%m-%d').date()
+                        except Exception:
+                            exp_date = None
+                if exp_date and today <= exp_date <= horizon:
+                    expiring += 1
+            stats['total_medicines'] = total_meds
+            stats['expiring_soon'] = expiring
 
         # 2) Active prescriptions (if collection exists), otherwise 0
         try:
             active_statuses = ['active', 'processing', 'قيد التنفيذ']
-            pres_q = db.collection('prescriptions').where('status', 'in', active_statuses).stream()
+            pres_q = fs.stream(db.collection('prescriptions').where('status', 'in', active_statuses))
             stats['active_prescriptions'] = sum(1 for _ in pres_q)
         except Exception:
             # Fallback scan
             try:
-                pres_all = db.collection('prescriptions').stream()
+                pres_all = fs.stream(db.collection('prescriptions'))
                 c = 0
                 for p in pres_all:
                     s = (p.to_dict() or {}).get('status', '')
@@ -327,32 +549,33 @@ def dashboard():
                 stats['active_prescriptions'] = c
             except Exception:
                 stats['active_prescriptions'] = 0
+                complete = False
 
         # 3) Low inventory (stock < min)
-        try:
-            inv_iter = db.collection('inventory').stream()
-            low = 0
-            for it in inv_iter:
-                data = it.to_dict() or {}
-                try:
-                    stock = int(data.get('stock') or 0)
-                except Exception:
-                    stock = 0
-                minv = data.get('min')
-                try:
-                    min_i = int(minv) if minv is not None and str(minv) != '' else None
-                except Exception:
-                    min_i = None
-                if (min_i is not None) and (stock < min_i):
-                    low += 1
-            stats['low_inventory'] = low
-        except Exception:
-            stats['low_inventory'] = 0
+        if alert_summary:
+            stats['low_inventory'] = alert_summary.get('low_stock', 0)
+        else:
+            try:
+                inv_rows = [{'id': it.id, **(it.to_dict() or {})} for it in fs.stream(db.collection('inventory'))]
+                low = 0
+                for data in fs.call(sharded_counter.overlay, db, inv_rows):
+                    try:
+                        stock = int(data.get('stock') or 0)
+                    except Exception:
+                        stock = 0
+                    minv = data.get('min')
+                    try:
+                        min_i = int(minv) if minv is not None and str(minv) != '' else None
+                    except Exception:
+                        min_i = None
+                    if (min_i is not None) and (stock < min_i):
+                        low += 1
+                stats['low_inventory'] = low
+            except Exception:
+                stats['low_inventory'] = 0
+                complete = False
 
-        # 4) Chart data: last 6 months revenue from orders.total
-        # Build month labels
-        def month_key(dt: datetime):
-            return (dt.year, dt.month)
+        # 4) Chart data: last 6 months of sales from the daily series (see sales_series.py), archive included
         # Start from 5 months ago
         base = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         months = []
@@ -369,55 +592,31 @@ def dashboard():
         import calendar
         labels = [calendar.month_abbr[m] for (_, m) in months]
         totals_by_month = { (y, m): 0.0 for (y, m) in months }
-        start_ym = months[0]
-        start_dt = datetime(start_ym[0], start_ym[1], 1, tzinfo=timezone.utc)
-        # end = first day of next month after last
-        last_ym = months[-1]
-        if last_ym[1] == 12:
-            end_dt = datetime(last_ym[0] + 1, 1, 1, tzinfo=timezone.utc)
-        else:
-            end_dt = datetime(last_ym[0], last_ym[1] + 1, 1, tzinfo=timezone.utc)
-        try:
-            q = db.collection('orders').where(filter=firestore.And(firestore.FieldFilter('date', '>=', start_dt), firestore.FieldFilter('date', '<', end_dt))).stream()
-        except Exception:
-            q = db.collection('orders').stream()
-        for doc in q:
-            data = doc.to_dict() or {}
-            dt = data.get('date')
-            if not isinstance(dt, datetime):
-                continue
-            # normalize tz
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            key = month_key(dt)
-            if key not in totals_by_month:
-                continue
-            val = data.get('total')
-            amt = None
-            if isinstance(val, (int, float)):
-                amt = float(val)
-            elif isinstance(val, str):
-                cleaned = ''.join(ch for ch in val if ch.isdigit() or ch in ['.', ','])
-                cleaned = cleaned.replace(',', '')
-                try:
-                    amt = float(cleaned) if cleaned else None
-                except Exception:
-                    amt = None
-            if amt is not None:
-                totals_by_month[key] += amt
+        start_day = datetime(months[0][0], months[0][1], 1, tzinfo=timezone.utc).date()
+        for day, data in fs.read(sales_series.read_days, db, start_day, datetime.now(timezone.utc).date()):
+            if (day.year, day.month) in totals_by_month:
+                totals_by_month[(day.year, day.month)] += float(data.get('amount') or 0)
         chart_data['months'] = labels
         chart_data['sales'] = [ round(totals_by_month[(y, m)], 2) for (y, m) in months ]
 
     except Exception as e:
-        print(f"Error fetching dashboard data: {str(e)}")
-        # keep defaults (zeros, empty chart)
-    return render_template('index.html', active='dashboard', stats=stats, chart_data=chart_data)
+        logger.exception("Error fetching dashboard data")
+        # keep what was computed so far (zeros, empty chart otherwise)
+        complete = False
+    return {'stats': stats, 'chart_data': chart_data}, complete
+
 
 
-@app.route('/inventory')
+@routes.route('/dashboard')
 @login_required
-def inventory():
-    inv_stats = {
+def dashboard():
+    db = get_db()
+    result = page_stats.get('dashboard', lambda: compute_dashboard_stats(db))
+    return render_template('index.html', active='dashboard', stats=result['stats'], chart_data=result['chart_data'])
+
+
+def empty_inventory_stats():
+    return {
         'total_items': 0,
         'active_items': 0,
         'low_stock': 0,
@@ -429,71 +628,29 @@ def inventory():
         'low_pct': 0,
         'on_order_pct': 0,
     }
+
+
+def compute_inventory_stats(db, items):
+    """Inventory page stats for the loaded items; returns (inv_stats, complete) for stats_cache."""
+    inv_stats = empty_inventory_stats()
+    inv_stats['total_items'] = len(items)
+    complete = True
     try:
-        if db is None:
-            raise RuntimeError('Firestore client is not initialized')
-        # Load inventory items
-        items_ref = db.collection('inventory').stream()
-        items = [{'id': item.id, **item.to_dict()} for item in items_ref]
+        # Counts and stock value from columns (inventory_stats.py); the mirror keeps them current when enabled
+        # The mirror's columns hold each document's own stock, not the total of sharded items
+        columns = None if any(it.get('stock_shards') for it in items) else mirror.column_stats('inventory')
+        counts = columns or inventory_stats.InventoryColumns.from_items(items).stats()
+        # Every card comes from these live counts; the alert summary can be an hour old
+        inv_stats.update(counts)
         inv_stats['total_items'] = len(items)
 
-        # Compute per-item stats
-        total_value = 0.0
-        low_count = 0
-        critical_count = 0
-        active_count = 0
-        out_count = 0
-        for it in items:
-            stock = 0
-            try:
-                stock = int(it.get('stock') or 0)
-            except Exception:
-                stock = 0
-            price_val = it.get('price')
-            price = None
-            if isinstance(price_val, (int, float)):
-                price = float(price_val)
-            elif isinstance(price_val, str):
-                cleaned = ''.join(ch for ch in price_val if ch.isdigit() or ch in ['.', ','])
-                cleaned = cleaned.replace(',', '')
-                try:
-                    price = float(cleaned) if cleaned else None
-                except Exception:
-                    price = None
-            if price is not None:
-                total_value += price * stock
-
-            # thresholds
-            min_val = it.get('min')
-            try:
-                min_i = int(min_val) if min_val is not None and str(min_val) != '' else None
-            except Exception:
-                min_i = None
-
-            if stock > 0 and (it.get('active', True) is not False):
-                active_count += 1
-            if stock <= 0:
-                out_count += 1
-            if (min_i is not None) and (stock < min_i):
-                low_count += 1
-                # critical: below half of min (at least threshold 1)
-                threshold = max(min_i // 2, 1)
-                if stock < threshold:
-                    critical_count += 1
-
-        inv_stats['inventory_value'] = round(total_value, 2)
-        inv_stats['low_stock'] = low_count
-        inv_stats['critical'] = critical_count
-        inv_stats['active_items'] = active_count
-        inv_stats['out_of_stock'] = out_count
-
         # On-order items: count distinct item_ids in pending/processing orders
         pending_statuses = ['pending', 'processing', 'in_transit', 'قيد الانتظار', 'قيد المعالجة']
         on_order_ids = set()
         try:
-            ord_q = db.collection('orders').where('status', 'in', pending_statuses).stream()
+            ord_q = fs.stream(db.collection('orders').where('status', 'in', pending_statuses))
         except Exception:
-            ord_q = db.collection('orders').stream()
+            ord_q = fs.stream(db.collection('orders'))
         for o in ord_q:
             data = o.to_dict() or {}
             its = data.get('items') or []
@@ -512,53 +669,173 @@ def inventory():
             inv_stats['on_order_pct'] = round((inv_stats['on_order'] / total) * 100)
 
     except Exception as e:
-        print(f"Error fetching inventory: {str(e)}")
+        logger.exception("Error computing inventory stats")
+        complete = False
+    return inv_stats, complete
+
+
+@routes.route('/inventory')
+@login_required
+@pages.conditional('inventory', 'orders', 'alerts', stats_keys=('inventory',))
+def inventory():
+    db = get_db()
+    inv_stats = empty_inventory_stats()
+    try:
+        if db is None:
+            raise RuntimeError('Firestore client is not initialized')
+        # Load inventory items
+        items = stream_collection(db, 'inventory')
+        inv_stats = page_stats.get('inventory', lambda: compute_inventory_stats(db, items))
+    except Exception as e:
+        logger.exception("Error fetching inventory")
         items = []
         flash('An error occurred while fetching inventory', 'error')
     return render_template('inventory.html', active='inventory', items=items, inv_stats=inv_stats)
 
 
-@app.route('/medicines')
+@routes.route('/inventory/adjust', methods=['GET'])
+@login_required
+def stock_adjust_form():
+    return render_template('stock_adjust.html', active='inventory', report=None, errors=None)
+
+
+@routes.route('/inventory/adjust', methods=['POST'])
 @login_required
+@request_deadline.budget(120)  # thousands of rows are several read/commit rounds
+def stock_adjust_submit():
+    """Apply bulk stock corrections (see stock_adjust.py): JSON in and out, or the stock check form."""
+    db = get_db()
+    wants_json = request.is_json
+    pasted = request.form.get('rows') or ''
+    try:
+        if db is None:
+            raise RuntimeError('Firestore client is not initialized')
+        if wants_json:
+            payload = request.get_json(silent=True)
+            rows = stock_adjust.parse_json(payload)
+            dry_run = bool(payload.get('dry_run')) if isinstance(payload, dict) else False
+        else:
+            upload = request.files.get('file')
+            text = upload.read().decode('utf-8-sig') if upload and upload.filename else pasted
+            rows = stock_adjust.parse_csv(text)
+            dry_run = request.form.get('action') != 'apply'
+        adjustments, errors = stock_adjust.validate(rows)
+        if errors:
+            # Nothing is written unless every row is valid
+            if wants_json:
+                return jsonify({'error': 'Invalid rows', 'errors': errors}), 400
+            return render_template('stock_adjust.html', active='inventory', report=None, errors=errors, pasted=pasted)
+        report = stock_adjust.apply_adjustments(db, adjustments, dry_run=dry_run, call=fs.call)
+    except (stock_adjust.AdjustmentError, UnicodeDecodeError) as e:
+        if wants_json:
+            return jsonify({'error': str(e)}), 400
+        flash(str(e), 'error')
+        return render_template('stock_adjust.html', active='inventory', report=None, errors=None, pasted=pasted)
+    except Exception as e:
+        logger.exception("Error adjusting stock")
+        if wants_json:
+            return jsonify({'error': 'Failed to adjust stock'}), 500
+        flash('An error occurred while adjusting stock', 'error')
+        return render_template('stock_adjust.html', active='inventory', report=None, errors=None, pasted=pasted)
+    if report['batches']:
+        page_stats.invalidate('inventory', 'dashboard')
+        logger.info("Stock adjusted by %s: %d items, %+d units in %d batches",
+                    session['user'].get('email'), report['changed'], report['units_delta'], report['batches'])
+    if wants_json:
+        return jsonify(report), (500 if report['error'] else 200)
+    return render_template('stock_adjust.html', active='inventory', report=report, errors=None, pasted=pasted)
+
+
+@routes.route('/medicines')
+@login_required
+@pages.conditional('medicines')
 def medicines():
+    db = get_db()
     try:
         if db is None:
             raise RuntimeError('Firestore client is not initialized')
-        meds_ref = db.collection('medicines').stream()
-        meds = [{'id': med.id, **med.to_dict()} for med in meds_ref]
+        meds = stream_collection(db, 'medicines')
     except Exception as e:
-        print(f"Error fetching medicines: {str(e)}")
+        logger.exception("Error fetching medicines")
         meds = []
         flash('An error occurred while loading medicines', 'error')
     return render_template('medicines.html', active='medicines', meds=meds)
 
-@app.route('/medicines/add', methods=['GET'])
+@routes.route('/medicines/add', methods=['GET'])
 def add_medicine_form():
     return render_template('add_medicine.html', active='medicines')
 
-@app.route('/medicines/add', methods=['POST'])
+@routes.route('/medicines/add', methods=['POST'])
 def add_medicine_submit():
+    db = get_db()
     data = {
         'name': request.form.get('name'),
         'category': request.form.get('category'),
         'stock': int(request.form.get('stock') or 0),
         'expiry': request.form.get('expiry'),
-        'price': request.form.get('price')
+        'price': request.form.get('price'),
+        'updated_at': firestore.SERVER_TIMESTAMP
     }
     try:
         if db is None:
             raise RuntimeError('Firestore client is not initialized')
-        db.collection('medicines').add(data)
+        attempt = idempotency.from_request(db, 'medicines', owner=(session.get('user') or {}).get('uid'))
+        # A repeated submit is answered from the idempotency record without writing again
+        if attempt is None or attempt.prior(fs.get) is None:
+            batch = db.batch()
+            if attempt is None:
+                batch.set(db.collection('medicines').document(), data)
+            else:
+                batch.create(attempt.document('medicines'), data)
+                attempt.stage(batch, {'id': attempt.id})
+            watermarks.bump(batch, db, 'medicines')
+            if not idempotency.commit(batch, attempt, fs.call):
+                logger.info("Duplicate medicine submit %s ignored", attempt.id)
+            page_stats.invalidate('dashboard')
         flash('تمت إضافة الدواء بنجاح', 'success')
+    except (idempotency.InvalidKey, idempotency.KeyReused) as e:
+        flash(str(e), 'error')
     except Exception as e:
-        print(f"Error adding medicine: {str(e)}")
+        logger.exception("Error adding medicine")
         flash('An error occurred while adding medicine', 'error')
     return redirect(url_for('medicines'))
 
 
-@app.route('/orders')
+def compute_order_stats(db):
+    """Order page stats from the aggregate counters and the daily sales series; returns (stats, complete)."""
+    stats = {
+        'total_orders': 0,
+        'pending': 0,
+        'month_total': 0.0,
+        'avg_order_value': None,
+    }
+    try:
+        if db is None:
+            raise RuntimeError('Firestore client is not initialized')
+        # Counters cover live and archived orders (see counters.py); no scan of `orders`
+        order_counters, _ = fs.read(counters.read_counters, db)
+        if not order_counters:
+            logger.warning("Order counters are missing; run `flask rebuild-counters`")
+            return stats, False
+        stats['total_orders'] = int(order_counters.get('total') or 0)
+        stats['pending'] = int((order_counters.get('by_status') or {}).get('pending') or 0)
+        amount_count = int(order_counters.get('amount_count') or 0)
+        if amount_count > 0:
+            stats['avg_order_value'] = round(float(order_counters.get('amount_sum') or 0.0) / amount_count, 2)
+        # This month's sales from the daily series (see sales_series.py)
+        today = datetime.now(timezone.utc).date()
+        days = fs.read(sales_series.read_days, db, today.replace(day=1), today)
+        stats['month_total'] = round(sum(float(data.get('amount') or 0) for _, data in days), 2)
+    except Exception as e:
+        logger.exception("Error computing order stats")
+        return stats, False
+    return stats, True
+
+
+@routes.route('/orders')
 @login_required
 def orders():
+    db = get_db()
     stats = {
         'total_orders': 0,
         'pending': 0,
@@ -569,85 +846,39 @@ def orders():
         if db is None:
             raise RuntimeError('Firestore client is not initialized')
         # Recent orders for table
-        orders_ref = db.collection('orders').order_by('date', direction='DESCENDING').limit(50).stream()
-        orders = [{'id': order.id, **order.to_dict()} for order in orders_ref]
-
-        # Full scan for stats (small to medium datasets). For very large datasets, consider aggregation queries.
-        # Total count, pending count, average order value, and this month's total amount.
-        now = datetime.now(timezone.utc)
-        start_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
-        next_month = (start_month.replace(day=28) + timedelta(days=4)).replace(day=1)
-        total_sum_all = 0.0
-        total_count_all = 0
-
-        all_orders_iter = db.collection('orders').stream()
-        for d in all_orders_iter:
-            data = d.to_dict() or {}
-            stats['total_orders'] += 1
-            # Pending count (Arabic + English)
-            st = data.get('status', '')
-            if isinstance(st, str):
-                st_l = st.lower()
-                if ('pend' in st_l) or (st in ['قيد الانتظار']):
-                    stats['pending'] += 1
-            # Totals
-            val = data.get('total')
-            amt = None
-            if isinstance(val, (int, float)):
-                amt = float(val)
-            elif isinstance(val, str):
-                cleaned = ''.join(ch for ch in val if ch.isdigit() or ch in ['.', ','])
-                cleaned = cleaned.replace(',', '')
-                try:
-                    amt = float(cleaned) if cleaned else None
-                except Exception:
-                    amt = None
-            if amt is not None:
-                total_sum_all += amt
-                total_count_all += 1
-            # Month total
-            created = data.get('date')
-            try:
-                if isinstance(created, datetime):
-                    # Ensure tz-aware comparison by converting naive to UTC if needed
-                    if created.tzinfo is None:
-                        created = created.replace(tzinfo=timezone.utc)
-                    if start_month <= created < next_month and amt is not None:
-                        stats['month_total'] += amt
-            except Exception:
-                pass
-
-        if total_count_all > 0:
-            stats['avg_order_value'] = round(total_sum_all / total_count_all, 2)
-
+        orders_ref = fs.stream(db.collection('orders').order_by('date', direction='DESCENDING').limit(50))
+        orders = [records.make('orders', order.id, order.to_dict()) for order in orders_ref]
+        for o in orders:
+            o['next_statuses'] = next_statuses(o.get('status'))
+        stats = page_stats.get('orders', lambda: compute_order_stats(db))
     except Exception as e:
-        print(f"Error fetching orders: {str(e)}")
+        logger.exception("Error fetching orders")
         orders = []
         flash('An error occurred while loading orders', 'error')
     return render_template('orders.html', active='orders', orders=orders, stats=stats)
 
 
-@app.route('/orders/create', methods=['GET'])
+@routes.route('/orders/create', methods=['GET'])
 @login_required
 def create_order():
+    db = get_db()
     try:
         if db is None:
             raise RuntimeError('Firestore client is not initialized')
-        items_ref = db.collection('inventory').stream()
-        items = [{'id': item.id, **item.to_dict()} for item in items_ref]
-        suppliers_ref = db.collection('suppliers').stream()
-        suppliers = [{'id': s.id, **s.to_dict()} for s in suppliers_ref]
+        items = stream_collection(db, 'inventory')
+        suppliers = stream_collection(db, 'suppliers')
     except Exception as e:
-        print(f"Error preparing create order: {str(e)}")
+        logger.exception("Error preparing create order")
         items = []
         suppliers = []
         flash('An error occurred while preparing the create order page', 'error')
     return render_template('create_order.html', active='inventory', items=items, suppliers=suppliers)
 
 
-@app.route('/orders/create', methods=['POST'])
+@routes.route('/orders/create', methods=['POST'])
 @login_required
 def create_order_submit():
+    db = get_db()
     supplier = request.form.get('supplier') or request.form.get('supplier_text')
     item_ids = request.form.getlist('item_id[]')
     qtys = request.form.getlist('quantity[]')
@@ -664,29 +895,89 @@ def create_order_submit():
         'items': items,
         'status': 'pending',
         'created_by': session.get('user', {}).get('email'),
-        'date': firestore.SERVER_TIMESTAMP
+        'date': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP
     }
     try:
         if db is None:
             raise RuntimeError('Firestore client is not initialized')
-        db.collection('orders').add(order)
+        attempt = idempotency.from_request(db, 'orders', owner=(session.get('user') or {}).get('uid'))
+        # A repeated submit is answered from the idempotency record without writing again
+        if attempt is None or attempt.prior(fs.get) is None:
+            # Stored on the order so a cancellation subtracts exactly what was added to the series
+            order['sales'] = fs.call(sales_series.order_contribution, db, order)
+            # Write the order, its counter updates and its day in the sales series atomically
+            batch = db.batch()
+            if attempt is None:
+                batch.set(db.collection('orders').document(), order)
+            else:
+                # create(): a racing duplicate fails as a whole, counters and series included
+                batch.create(attempt.document('orders'), order)
+                attempt.stage(batch, {'id': attempt.id})
+            counters.order_created(batch, db, amount=order_archive.parse_amount(order.get('total')))
+            sales_series.record(batch, db, order['sales'])
+            watermarks.bump(batch, db, 'orders')
+            if not idempotency.commit(batch, attempt, fs.call):
+                logger.info("Duplicate order submit %s ignored", attempt.id)
+            page_stats.invalidate('orders', 'suppliers', 'inventory', 'dashboard')
         flash('تم إنشاء الطلب بنجاح', 'success')
+    except (idempotency.InvalidKey, idempotency.KeyReused) as e:
+        flash(str(e), 'error')
     except Exception as e:
-        print(f"Error creating order: {str(e)}")
+        logger.exception("Error creating order")
         flash('An error occurred while creating the order', 'error')
     return redirect(url_for('orders'))
 
 
-@app.route('/suppliers/add', methods=['GET'])
+@routes.route('/orders/<order_id>/status', methods=['POST'])
+@login_required
+def update_order_status(order_id):
+    """Move an order to the next status in its workflow (see order_workflow.py)."""
+    db = get_db()
+    payload = request.get_json(silent=True) or request.form
+    new_status = payload.get('status')
+    wants_json = request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    try:
+        if db is None:
+            raise RuntimeError('Firestore client is not initialized')
+        if not new_status:
+            raise OrderTransitionError('No status provided')
+        result = fs.call(transition_order, db, order_id, new_status, actor=session.get('user', {}).get('email'), idempotent=False)
+        # Status changes move stock and order totals behind every stats page
+        page_stats.invalidate()
+        if wants_json:
+            return jsonify({'success': True, **result})
+        if result['missing']:
+            flash(f"Order marked {result['to']}; {len(result['missing'])} item(s) no longer in inventory were skipped", 'error')
+        else:
+            flash(f"Order marked {result['to']}", 'success')
+    except OrderTransitionError as e:
+        if wants_json:
+            return jsonify({'success': False, 'error': str(e)}), 409
+        flash(str(e), 'error')
+    except CircuitOpenError as e:
+        if wants_json:
+            return jsonify({'success': False, 'error': str(e)}), 503
+        flash(g._('database_unavailable'), 'error')
+    except Exception as e:
+        logger.exception("Error updating order status")
+        if wants_json:
+            return jsonify({'success': False, 'error': 'Failed to update order status'}), 500
+        flash('An error occurred while updating the order status', 'error')
+    return redirect(url_for('orders'))
+
+
+@routes.route('/suppliers/add', methods=['GET'])
 @login_required
 def add_supplier():
     """Display the form to add a new supplier"""
     return render_template('add_supplier.html', active='suppliers')
 
-@app.route('/suppliers/add', methods=['POST'])
+@routes.route('/suppliers/add', methods=['POST'])
 @login_required
 def add_supplier_submit():
     """Process the new supplier form submission"""
+    db = get_db()
     try:
         supplier_data = {
             'name': request.form.get('name'),
@@ -702,43 +993,38 @@ def add_supplier_submit():
         }
         
         # Add the new supplier to Firestore
-        doc_ref = db.collection('suppliers').document()
-        doc_ref.set(supplier_data)
+        batch = db.batch()
+        batch.set(db.collection('suppliers').document(), supplier_data)
+        watermarks.bump(batch, db, 'suppliers')
+        fs.call(batch.commit, idempotent=False)
         
         flash('Supplier added successfully!', 'success')
         return redirect(url_for('suppliers'))
         
     except Exception as e:
-        print(f"Error adding supplier: {str(e)}")
+        logger.exception("Error adding supplier")
         flash('An error occurred while adding the supplier', 'error')
         return redirect(url_for('add_supplier'))
 
-@app.route('/suppliers')
-@login_required
-def suppliers():
-    suppliers = []
+def compute_supplier_stats(db):
+    """Order figures for the suppliers page; returns (stats, complete) for stats_cache."""
     stats = {
-        'total_suppliers': 0,
         'active_orders': 0,
         'expenses_month': 0.0,
         'avg_delivery_days': None,
     }
+    complete = True
     try:
         if db is None:
             raise RuntimeError('Firestore client is not initialized')
-        # Suppliers list
-        suppliers_ref = db.collection('suppliers').stream()
-        suppliers = [{'id': sup.id, **sup.to_dict()} for sup in suppliers_ref]
-        stats['total_suppliers'] = len(suppliers)
-
         # Active orders count (pending/processing/in transit/shipped)
         active_statuses = ['pending', 'processing', 'in_transit', 'shipped', 'قيد الانتظار', 'قيد المعالجة', 'تم الشحن']
         try:
-            active_q = db.collection('orders').where('status', 'in', active_statuses).stream()
+            active_q = fs.stream(db.collection('orders').where('status', 'in', active_statuses))
             stats['active_orders'] = sum(1 for _ in active_q)
         except Exception:
             # Fallback: count by scanning
-            all_orders = db.collection('orders').stream()
+            all_orders = fs.stream(db.collection('orders'))
             cnt = 0
             for o in all_orders:
                 st = (o.to_dict() or {}).get('status', '')
@@ -751,7 +1037,7 @@ def suppliers():
         start_month = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
         next_month = (start_month.replace(day=28) + timedelta(days=4)).replace(day=1)
         try:
-            month_q = db.collection('orders').where(filter=firestore.And(firestore.FieldFilter('date', '>=', start_month), firestore.FieldFilter('date', '<', next_month))).stream()
+            month_q = fs.stream(db.collection('orders').where('date', '>=', start_month).where('date', '<', next_month))
             total_sum = 0.0
             for d in month_q:
                 val = (d.to_dict() or {}).get('total')
@@ -768,11 +1054,20 @@ def suppliers():
             stats['expenses_month'] = round(total_sum, 2)
         except Exception:
             stats['expenses_month'] = 0.0
+            complete = False
+
+        # Archived orders (see order_archive.py) are only counted through their rollup
+        try:
+            archived = fs.read(order_archive.read_rollup, db)
+        except Exception:
+            archived = {}
+            complete = False
+        stats['expenses_month'] = round(stats['expenses_month'] + order_archive.rollup_month(archived, now.year, now.month)[1], 2)
 
         # Average delivery time (days) for delivered orders with delivered_at
         delivered_statuses = ['delivered', 'تم التسليم']
         try:
-            del_q = db.collection('orders').where('status', 'in', delivered_statuses).stream()
+            del_q = fs.stream(db.collection('orders').where('status', 'in', delivered_statuses))
             times = []
             for d in del_q:
                 data = d.to_dict() or {}
@@ -781,39 +1076,86 @@ def suppliers():
                 if created and delivered_at and hasattr(delivered_at, 'timestamp') and hasattr(created, 'timestamp'):
                     delta = delivered_at - created
                     times.append(delta.total_seconds() / 86400.0)
-            if times:
-                stats['avg_delivery_days'] = round(sum(times) / len(times), 1)
+            days_sum = sum(times) + float(archived.get('delivered_days_sum') or 0.0)
+            timed = len(times) + int(archived.get('delivered_timed') or 0)
+            if timed:
+                stats['avg_delivery_days'] = round(days_sum / timed, 1)
         except Exception:
-            pass
+            complete = False
 
     except Exception as e:
-        print(f"Error fetching suppliers: {str(e)}")
+        logger.exception("Error computing supplier stats")
+        complete = False
+    return stats, complete
+
+
+@routes.route('/suppliers')
+@login_required
+@pages.conditional('suppliers', 'orders', stats_keys=('suppliers',))
+def suppliers():
+    db = get_db()
+    suppliers = []
+    stats = {
+        'total_suppliers': 0,
+        'active_orders': 0,
+        'expenses_month': 0.0,
+        'avg_delivery_days': None,
+    }
+    try:
+        if db is None:
+            raise RuntimeError('Firestore client is not initialized')
+        # Suppliers list
+        suppliers = stream_collection(db, 'suppliers')
+        # Copy: the cached dict is shared between requests
+        stats = dict(page_stats.get('suppliers', lambda: compute_supplier_stats(db)))
+        stats['total_suppliers'] = len(suppliers)
+    except Exception as e:
+        logger.exception("Error fetching suppliers")
         suppliers = []
         flash('An error occurred while loading suppliers', 'error')
     return render_template('suppliers.html', active='suppliers', suppliers=suppliers, stats=stats)
 
 
-@app.route('/reports')
+@routes.route('/reports')
 @login_required
 def reports():
+    db = get_db()
     try:
         if db is None:
             raise RuntimeError('Firestore client is not initialized')
         # Prefer created_at if present; fall back to date
         try:
-            reports_ref = db.collection('reports').order_by('created_at', direction='DESCENDING').limit(10).stream()
+            reports_ref = fs.stream(db.collection('reports').order_by('created_at', direction='DESCENDING').limit(10))
         except Exception:
-            reports_ref = db.collection('reports').order_by('date', direction='DESCENDING').limit(10).stream()
+            reports_ref = fs.stream(db.collection('reports').order_by('date', direction='DESCENDING').limit(10))
         reports = [{'id': report.id, **report.to_dict()} for report in reports_ref]
     except Exception as e:
-        print(f"Error fetching reports: {str(e)}")
+        logger.exception("Error fetching reports")
         reports = []
         flash('حدث خطأ أثناء تحميل التقارير', 'error')
-    return render_template('reports.html', active='reports', reports=reports)
 
-@app.route('/reports/create', methods=['GET', 'POST'])
+    # Sales for the selected period, from the daily series (see sales_series.py)
+    period = request.args.get('period') or sales_series.DEFAULT_PERIOD
+    category = request.args.get('category') or None
+    sales = None
+    try:
+        try:
+            start, end = sales_series.resolve_period(period, start=request.args.get('start'), end=request.args.get('end'))
+        except ValueError as e:
+            flash(str(e), 'error')
+            period = sales_series.DEFAULT_PERIOD
+            start, end = sales_series.resolve_period(period)
+        if db is not None:
+            sales = fs.read(sales_series.summarize, db, start, end, category=category)
+    except Exception as e:
+        logger.exception("Error summarizing sales")
+    return render_template('reports.html', active='reports', reports=reports, sales=sales,
+                           periods=sales_series.PERIODS, period=period, category=category)
+
+@routes.route('/reports/create', methods=['GET', 'POST'])
 @login_required
 def reports_create():
+    db = get_db()
     try:
         if db is None:
             raise RuntimeError('Firestore client is not initialized')
@@ -828,70 +1170,300 @@ def reports_create():
             include_pricing = 'include_pricing' in request.form
             export_format = request.form.get('export_format', 'pdf')
             
-            # Get medicine details for the report
-            medicines_data = []
-            for med_id in selected_medicines:
-                med_doc = db.collection('medicines').document(med_id).get()
-                if med_doc.exists:
-                    med_data = med_doc.to_dict()
-                    medicines_data.append({
-                        'id': med_id,
-                        'name': med_data.get('name', 'Unnamed Medicine'),
-                        'stock': med_data.get('stock', 0),
-                        'price': med_data.get('price', 0),
-                        'category': med_data.get('category', 'Uncategorized')
-                    })
-            
-            # Create report document
+            # Create the report document; the background runner reads the selected
+            # medicines and builds the export so the request returns immediately
             report_data = {
                 'title': title,
                 'type': report_type,
                 'content': report_content,
-                'medicines': medicines_data,
+                'selected_medicines': selected_medicines,
                 'include_stock': include_stock,
                 'include_pricing': include_pricing,
                 'export_format': export_format,
-                'status': 'draft',
+                'status': 'queued',
+                'progress': 0,
                 'created_at': firestore.SERVER_TIMESTAMP,
-                'created_by': session.get('user_id'),
+                'created_by': session.get('user', {}).get('uid'),
                 'updated_at': firestore.SERVER_TIMESTAMP
             }
-            
-            # Add report to Firestore
-            db.collection('reports').add(report_data)
-            flash(_('report_created_success'), 'success')
+
+            _, report_ref = fs.call(db.collection('reports').add, report_data, idempotent=False)
+            if report_runner.submit(report_ref.id):
+                flash(g._('report_created_success'), 'success')
+            else:
+                # Left queued; the next worker start-up sweep picks it up
+                flash(g._('report_queue_busy'), 'error')
             return redirect(url_for('reports'))
             
         else:
             # GET request - show the form
             # Fetch all medicines for the selection modal
-            medicines_ref = db.collection('medicines')\
-                            .where('stock', '>', 0)\
-                            .order_by('name')\
-                            .stream()
+            # Sorted locally: Firestore requires the first order_by to match the inequality field
+            medicines_ref = fs.stream(db.collection('medicines').where('stock', '>', 0))
             
             medicines = []
             for med in medicines_ref:
                 med_data = med.to_dict()
                 med_data['id'] = med.id
                 medicines.append(med_data)
+            medicines.sort(key=lambda m: str(m.get('name') or '').lower())
                 
             return render_template('create_report.html', 
                                  medicines=medicines,
                                  active='reports')
             
     except Exception as e:
-        print(f"Error in create_report: {str(e)}")
-        flash(_('error_creating_report'), 'error')
+        logger.exception("Error in create_report")
+        flash(g._('error_creating_report'), 'error')
         return redirect(url_for('reports'))
 
 
-@app.route('/contact')
+@routes.route('/reports/status')
+@login_required
+def reports_status():
+    """Live status for the reports list: ?ids=a,b,c -> {id: {status, progress, error}}."""
+    db = get_db()
+    ids = [i for i in (request.args.get('ids') or '').split(',') if i][:50]
+    result = {}
+    try:
+        if db is None:
+            raise RuntimeError('Firestore client is not initialized')
+        refs = [db.collection('reports').document(i) for i in ids]
+        for snap in fs.get_all(refs):
+            if not snap.exists:
+                continue
+            data = snap.to_dict() or {}
+            result[snap.id] = {
+                'status': data.get('status'),
+                'progress': data.get('progress'),
+                'error': data.get('error'),
+                'final': data.get('status') in FINAL_STATUSES,
+            }
+    except Exception as e:
+        logger.exception("Error fetching report status")
+        return jsonify({'error': 'Failed to fetch report status'}), 500
+    return jsonify(result)
+
+
+@routes.route('/reports/<report_id>/download')
+@login_required
+@request_deadline.budget(None)  # the response streams for as long as the download takes
+def reports_download(report_id):
+    """Serve a generated report file; supports HTTP Range requests for resumable downloads."""
+    db = get_db()
+    bucket = get_bucket()
+    try:
+        if db is None:
+            raise RuntimeError('Firestore client is not initialized')
+        snap = fs.get(db.collection('reports').document(report_id))
+        data = (snap.to_dict() or {}) if snap.exists else {}
+    except Exception as e:
+        logger.exception("Error loading report %s", report_id)
+        return jsonify({'error': 'Failed to load report'}), 500
+    output = data.get('output') or {}
+    if data.get('status') != 'ready' or not output:
+        return jsonify({'error': 'Report not available'}), 404
+
+    download_name = f"{secure_filename(data.get('title') or '') or report_id}.{output.get('format', 'bin')}"
+    mimetype = output.get('content_type') or 'application/octet-stream'
+
+    path = report_storage.local_path(output)
+    if path:
+        # conditional=True makes Werkzeug answer Range / If-Range / If-Modified-Since
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name, conditional=True)
+
+    if output.get('backend') != 'gcs' or bucket is None:
+        return jsonify({'error': 'Report file not found'}), 404
+    try:
+        reader, size = report_storage.open_blob(bucket, output)
+    except Exception as e:
+        logger.exception("Error opening report blob %s", output.get('path'))
+        return jsonify({'error': 'Report file not found'}), 404
+
+    start, stop, status = 0, size, 200
+    if request.range is not None:
+        rng = request.range.range_for_length(size)
+        if rng is None:
+            reader.close()
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+        start, stop = rng
+        status = 206
+
+    def generate():
+        try:
+            reader.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                chunk = reader.read(min(report_storage.CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            reader.close()
+
+    response = Response(stream_with_context(generate()), status=status, mimetype=mimetype)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Length'] = str(stop - start)
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    return response
+
+
+@routes.route('/analytics/<query>')
+@login_required
+def analytics(query):
+    """Indexed SQL aggregations over the local SQLite replica (see sqlite_replica.py)."""
+    try:
+        result = sqlite_replica.run_query(query, request.args)
+    except KeyError:
+        return jsonify({'error': f'Unknown analytics query: {query}',
+                        'queries': sorted(sqlite_replica.QUERIES)}), 404
+    except Exception as e:
+        logger.exception("Error running analytics query %s", query)
+        return jsonify({'error': 'Failed to run analytics query'}), 500
+    if result is None:
+        return jsonify({'error': 'Analytics replica has not been synced; run `flask sync-replica`'}), 503
+    return jsonify({'query': query, **result})
+
+
+@routes.route('/contact')
 @login_required
 def contact():
     """Render the contact page with contact information and form."""
     return render_template('contact.html', active='contact')
 
 
+@cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Recompute the aggregate counters in the stats collection from a full scan."""
+    db = get_db()
+    if db is None:
+        raise SystemExit('Firestore client is not initialized')
+    orders_c, inventory_c = counters.rebuild_counters(db)
+    print(f"Counters rebuilt: {orders_c['total']} orders, {inventory_c['items']} inventory items")
+
+
+@cli.command('compute-alerts')
+def compute_alerts_command():
+    """Recompute expiry and stock alerts and the stats/alerts summary; run it from cron."""
+    db = get_db()
+    if db is None:
+        raise SystemExit('Firestore client is not initialized')
+    summary = alerts.compute_alerts(db)
+    print(f"Alerts computed: {summary['total_alerts']} alerts "
+          f"({summary['expiring_soon']} expiring, {summary['low_stock']} low stock, "
+          f"{summary['critical']} critical, {summary['out_of_stock']} out of stock)")
+
+
+@cli.command('archive-orders')
+@click.option('--older-than-days', type=int, default=None, help='Minimum order age (default ARCHIVE_AFTER_DAYS or 180).')
+@click.option('--max-chunks', type=int, default=None, help='Stop after this many chunks; the next run resumes.')
+def archive_orders_command(older_than_days, max_chunks):
+    """Move old delivered/cancelled orders to orders_archive and fold them into the rollup."""
+    db = get_db()
+    if db is None:
+        raise SystemExit('Firestore client is not initialized')
+    result = order_archive.archive_orders(db, older_than_days=older_than_days, max_chunks=max_chunks)
+    state = 'complete' if result['complete'] else 'paused, run again to resume'
+    print(f"Archived {result['archived']} of {result['scanned']} orders dated before "
+          f"{result['cutoff']:%Y-%m-%d} ({state})")
+
+
+@cli.command('sync-replica')
+@click.option('--full', is_flag=True, help='Rebuild every table from a complete scan (picks up deletions).')
+def sync_replica_command(full):
+    """Copy Firestore collections into the local SQLite analytics replica."""
+    db = get_db()
+    if db is None:
+        raise SystemExit('Firestore client is not initialized')
+    written = sqlite_replica.sync_replica(db, full=full)
+    mode = 'Full resync' if full else 'Incremental sync'
+    print(f"{mode} of {sqlite_replica.replica_path()}: "
+          + ', '.join(f'{name} {count}' for name, count in written.items()))
+
+
+@cli.command('rebuild-sales-series')
+def rebuild_sales_series_command():
+    """Recompute the sales_daily series from live and archived orders."""
+    db = get_db()
+    if db is None:
+        raise SystemExit('Firestore client is not initialized')
+    days = sales_series.rebuild_series(db)
+    print(f"Sales series rebuilt: {days} days with sales")
+
+
+@cli.command('bump-watermarks')
+@click.argument('collections', nargs=-1)
+def bump_watermarks_command(collections):
+    """Mark collections as changed after edits made outside the app (default: all watched ones)."""
+    db = get_db()
+    if db is None:
+        raise SystemExit('Firestore client is not initialized')
+    collections = collections or ('medicines', 'inventory', 'suppliers', 'orders', 'alerts')
+    watermarks.bump_now(db, *collections)
+    print(f"Watermarks bumped: {', '.join(collections)}")
+
+
+@cli.command('adjust-stock')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Report the changes without writing them.')
+@click.option('--report', 'report_path', type=click.Path(dir_okay=False), default=None,
+              help='Write the per-item diff to this CSV file.')
+def adjust_stock_command(path, dry_run, report_path):
+    """Apply a CSV or JSON file of {item_id, delta} or {item_id, counted} rows to inventory stock."""
+    db = get_db()
+    if db is None:
+        raise SystemExit('Firestore client is not initialized')
+    with open(path, encoding='utf-8-sig') as f:
+        text = f.read()
+    try:
+        rows = stock_adjust.parse_json(json.loads(text)) if path.lower().endswith('.json') else stock_adjust.parse_csv(text)
+        adjustments, errors = stock_adjust.validate(rows)
+    except (stock_adjust.AdjustmentError, ValueError) as e:
+        raise SystemExit(str(e))
+    if errors:
+        for e in errors[:20]:
+            print(f"row {e['row']}: {e.get('item_id', '')} {e['error']}")
+        raise SystemExit(f"{len(errors)} invalid row(s); nothing was applied")
+    report = stock_adjust.apply_adjustments(db, adjustments, dry_run=dry_run)
+    if report_path:
+        with open(report_path, 'w', newline='', encoding='utf-8') as f:
+            f.write(stock_adjust.report_csv(report))
+    print(f"{'Dry run' if dry_run else 'Applied'}: {report['changed']} changed, {report['unchanged']} unchanged, "
+          f"{len(report['missing'])} unknown item(s), {report['units_delta']:+d} units in {report['batches']} batch(es)")
+    if report['error']:
+        raise SystemExit(f"Stopped: {report['error']}; {len(report['not_applied'])} item(s) not applied")
+
+
+@cli.command('shard-stock')
+@click.argument('item_id')
+@click.option('--shards', type=click.IntRange(0, sharded_counter.MAX_SHARDS), required=True,
+              help='Number of stock shards; 0 folds them back into the item document.')
+def shard_stock_command(item_id, shards):
+    """Switch an inventory item's stock to a sharded counter (or back) for high-contention items."""
+    db = get_db()
+    if db is None:
+        raise SystemExit('Firestore client is not initialized')
+    try:
+        stock, previous = sharded_counter.reshard(db, item_id, shards)
+    except KeyError:
+        raise SystemExit(f'Inventory item {item_id} not found')
+    print(f"{item_id}: stock {stock}, shards {previous} -> {shards}")
+
+
+@cli.command('build-assets')
+@click.option('--download', is_flag=True, help='Fetch the Tailwind CLI, Chart.js, Alpine.js and fonts first.')
+def build_assets_command(download):
+    """Build the purged CSS bundle and hashed vendor files into static/dist/."""
+    try:
+        outputs = assets.build(download=download)
+    except assets.AssetBuildError as e:
+        raise SystemExit(str(e))
+    for name, (hashed, data) in sorted(outputs.items()):
+        print(f"{name:<28} static/dist/{hashed} ({len(data) / 1024:.1f} KB)")
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
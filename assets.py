@@ -0,0 +1,288 @@
+"""
+Prebuilt static assets: one purged CSS bundle and vendored scripts and fonts.
+
+``flask build-assets`` compiles the Tailwind classes the templates actually
+use (assets/app.css lists the sources) with the Tailwind 4 standalone CLI,
+minified, prepends the vendored Inter and Material Symbols font faces, and
+copies Chart.js, Alpine.js and the font files next to it. Every output is
+written to static/dist/ under a content-hashed name (``app.3f9c2a71b0de.css``)
+and recorded in static/dist/manifest.json; files from earlier builds are
+removed. The CSS and scripts are also written gzipped (``.gz``) and, when the
+``brotli`` package is installed, as ``.br``; the static route sends the one
+the browser accepts, so they go out compressed without being compressed per
+request. Templates link the files with ``asset_url('app.css')``, and the
+hashed files are served with a one-year cache lifetime.
+
+The third-party files and the built bundle are committed (assets/vendor/,
+static/dist/), so a checkout renders without any network access. The CLI is
+the ``tailwindcss-bin`` wheel or the binary ``--download`` fetches; only
+``--download`` (which also refreshes assets/vendor/) needs the network. A
+missing bundle is an error: ``asset_url()`` raises AssetBuildError, and
+``init_app`` logs it at startup.
+
+Environment:
+    TAILWIND_BIN   Tailwind standalone CLI to run (default: tailwindcss on PATH,
+                   then the copy --download stores under instance/)
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import platform
+import re
+import shutil
+import stat
+import subprocess
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(ROOT, 'assets')
+VENDOR_DIR = os.path.join(SOURCE_DIR, 'vendor')
+FONTS_DIR = os.path.join(VENDOR_DIR, 'fonts')
+DIST_DIR = os.path.join(ROOT, 'static', 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+TAILWIND_VERSION = 'v4.3.3'
+# Logical name -> (file in assets/vendor/, pinned source URL)
+VENDOR_SCRIPTS = {
+    'chart.js': ('chart.umd.min.js', 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js'),
+    'alpine.js': ('alpine.min.js', 'https://cdn.jsdelivr.net/npm/alpinejs@3.14.9/dist/cdn.min.js'),
+}
+FONT_FAMILIES = {
+    'inter': 'https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap',
+    'material-symbols': 'https://fonts.googleapis.com/css2?family=Material+Symbols+Outlined',
+}
+# Google Fonts only serves woff2 to browsers it recognizes
+_FONT_USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                    '(KHTML, like Gecko) Chrome/124.0 Safari/537.36')
+_CSS_URL = re.compile(r'url\(\s*[\'"]?([^\'")]+)[\'"]?\s*\)')
+# Hashed names are immutable, so browsers may keep them for a year
+HASHED_MAX_AGE = 365 * 24 * 3600
+# Written next to each text output; (Content-Encoding, suffix) in order of preference
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+_TEXT_EXTENSIONS = ('.css', '.js')
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+class AssetBuildError(RuntimeError):
+    """A build input (CLI binary, vendored file) is missing or the Tailwind CLI failed."""
+
+
+# -- lookup --
+def manifest():
+    """Logical name -> hashed file name under static/dist/ ({} before the first build)."""
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                try:
+                    with open(MANIFEST_PATH) as f:
+                        _manifest = json.load(f)
+                except (OSError, ValueError):
+                    _manifest = {}
+    return _manifest
+
+
+def asset_url(name):
+    """URL of the built asset ``name`` (e.g. 'app.css'); AssetBuildError when it has not been built."""
+    from flask import url_for
+    filename = manifest().get(name)
+    if not filename:
+        raise AssetBuildError(f'{name} is not in static/dist/manifest.json; run flask build-assets')
+    return url_for('static', filename=f'dist/{filename}')
+
+
+def _hashed_file(filename):
+    """The name under static/dist/ when ``filename`` (relative to static/) is a built file, else None."""
+    filename = (filename or '').replace('\\', '/')
+    if filename.startswith('dist/') and filename[5:] in set(manifest().values()):
+        return filename[5:]
+    return None
+
+
+def init_app(app):
+    app.jinja_env.globals['asset_url'] = asset_url
+    if not manifest():
+        logger.error('No built assets in %s: pages cannot render until flask build-assets has run',
+                     os.path.relpath(DIST_DIR, ROOT))
+    default_max_age = app.get_send_file_max_age
+
+    def get_send_file_max_age(filename):
+        if _hashed_file(filename):
+            return HASHED_MAX_AGE
+        return default_max_age(filename)
+
+    app.get_send_file_max_age = get_send_file_max_age
+    send_static = app.view_functions['static']
+
+    def static(filename):
+        """Built CSS/JS in the encoding the browser accepts, from the files written at build time."""
+        from flask import request, send_from_directory
+        hashed = _hashed_file(filename)
+        if hashed is None or not hashed.endswith(_TEXT_EXTENSIONS):
+            return send_static(filename=filename)
+        for encoding, suffix in PRECOMPRESSED:
+            if request.accept_encodings.quality(encoding) and os.path.isfile(os.path.join(DIST_DIR, hashed + suffix)):
+                response = send_from_directory(DIST_DIR, hashed + suffix, mimetype=mimetypes.guess_type(hashed)[0],
+                                               max_age=HASHED_MAX_AGE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_static(filename=filename)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = static
+
+
+# -- build --
+def _fetch(url, user_agent=None):
+    import requests
+    response = requests.get(url, headers={'User-Agent': user_agent} if user_agent else None, timeout=60)
+    response.raise_for_status()
+    return response.content
+
+
+def _tailwind_download_url():
+    system = {'Linux': 'linux', 'Darwin': 'macos', 'Windows': 'windows'}.get(platform.system())
+    machine = platform.machine().lower()
+    arch = 'arm64' if machine in ('arm64', 'aarch64') else 'x64'
+    if system is None:
+        raise AssetBuildError(f'No Tailwind standalone CLI for {platform.system()}; set TAILWIND_BIN')
+    suffix = '.exe' if system == 'windows' else ''
+    return (f'https://github.com/tailwindlabs/tailwindcss/releases/download/{TAILWIND_VERSION}/'
+            f'tailwindcss-{system}-{arch}{suffix}')
+
+
+def _local_tailwind_path():
+    return os.path.join(ROOT, 'instance', 'bin', f'tailwindcss-{TAILWIND_VERSION}'
+                        + ('.exe' if platform.system() == 'Windows' else ''))
+
+
+def tailwind_binary(download=False):
+    candidates = [os.environ.get('TAILWIND_BIN'), shutil.which('tailwindcss'), _local_tailwind_path()]
+    for path in candidates:
+        if path and os.path.isfile(path):
+            return path
+    if not download:
+        raise AssetBuildError('Tailwind standalone CLI not found; set TAILWIND_BIN or run with --download')
+    path = _local_tailwind_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(_fetch(_tailwind_download_url()))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def download_vendor():
+    """Fetch the pinned scripts and the font files into assets/vendor/ (the only step needing network)."""
+    os.makedirs(FONTS_DIR, exist_ok=True)
+    for filename, url in VENDOR_SCRIPTS.values():
+        with open(os.path.join(VENDOR_DIR, filename), 'wb') as f:
+            f.write(_fetch(url))
+    css_parts = []
+    for family, url in FONT_FAMILIES.items():
+        css = _fetch(url, user_agent=_FONT_USER_AGENT).decode('utf-8')
+        files = {}
+        for n, font_url in enumerate(dict.fromkeys(_CSS_URL.findall(css))):
+            local = f'{family}-{n}{os.path.splitext(font_url.split("?")[0])[1] or ".woff2"}'
+            with open(os.path.join(FONTS_DIR, local), 'wb') as f:
+                f.write(_fetch(font_url, user_agent=_FONT_USER_AGENT))
+            files[font_url] = local
+        css_parts.append(_CSS_URL.sub(lambda m: f'url({files[m.group(1)]})', css))
+    with open(os.path.join(FONTS_DIR, 'fonts.css'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(css_parts))
+
+
+def _missing_vendor_files():
+    paths = [os.path.join(VENDOR_DIR, filename) for filename, _ in VENDOR_SCRIPTS.values()]
+    paths.append(os.path.join(FONTS_DIR, 'fonts.css'))
+    return [p for p in paths if not os.path.isfile(p)]
+
+
+def _hashed_name(name, data):
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def _compile_css(binary):
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'app.css')
+        cmd = [binary, '--input', os.path.join(SOURCE_DIR, 'app.css'), '--output', out, '--minify']
+        proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0 or not os.path.isfile(out):
+            raise AssetBuildError(f'Tailwind CLI failed ({proc.returncode}): {proc.stderr.strip()[-2000:]}')
+        with open(out, 'rb') as f:
+            return f.read()
+
+
+def _precompressed(hashed, data):
+    """[(file name, bytes)] of the compressed copies to write next to ``hashed``."""
+    if not hashed.endswith(_TEXT_EXTENSIONS):
+        return []
+    # mtime=0: the same input always gives the same bytes
+    out = [(hashed + '.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+    except ImportError:
+        return out
+    out.insert(0, (hashed + '.br', brotli.compress(data, quality=11)))
+    return out
+
+
+def build(download=False):
+    """Build static/dist/ and its manifest; returns {logical name: (hashed name, bytes)}."""
+    global _manifest
+    binary = tailwind_binary(download=download)
+    if download:
+        download_vendor()
+    missing = _missing_vendor_files()
+    if missing:
+        raise AssetBuildError('Missing vendored files (run with --download once): '
+                              + ', '.join(os.path.relpath(p, ROOT) for p in missing))
+
+    outputs = {}
+    # Font files first: the CSS refers to their hashed names
+    with open(os.path.join(FONTS_DIR, 'fonts.css'), encoding='utf-8') as f:
+        fonts_css = f.read()
+    font_names = {}
+    for local in dict.fromkeys(_CSS_URL.findall(fonts_css)):
+        with open(os.path.join(FONTS_DIR, local), 'rb') as f:
+            data = f.read()
+        font_names[local] = _hashed_name(local, data)
+        outputs[f'fonts/{local}'] = (font_names[local], data)
+    fonts_css = _CSS_URL.sub(lambda m: f'url({font_names[m.group(1)]})', fonts_css)
+    # In the base layer, so utilities (text-base on an icon) still override .material-symbols-outlined
+    css = b'@layer base{' + fonts_css.encode('utf-8') + b'}\n' + _compile_css(binary)
+    outputs['app.css'] = (_hashed_name('app.css', css), css)
+    for name, (filename, _url) in VENDOR_SCRIPTS.items():
+        with open(os.path.join(VENDOR_DIR, filename), 'rb') as f:
+            data = f.read()
+        outputs[name] = (_hashed_name(name, data), data)
+
+    os.makedirs(DIST_DIR, exist_ok=True)
+    written = set()
+    for hashed, data in outputs.values():
+        for filename, body in [(hashed, data)] + _precompressed(hashed, data):
+            with open(os.path.join(DIST_DIR, filename), 'wb') as f:
+                f.write(body)
+            written.add(filename)
+    new_manifest = {name: hashed for name, (hashed, _) in outputs.items()}
+    tmp = MANIFEST_PATH + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(new_manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
+    keep = written | {'manifest.json'}
+    for filename in os.listdir(DIST_DIR):
+        if filename not in keep:
+            os.remove(os.path.join(DIST_DIR, filename))
+    with _manifest_lock:
+        _manifest = new_manifest
+    return outputs
@@ -0,0 +1,77 @@
+"""
+Bytes-on-the-wire benchmark for a large inventory page.
+
+Renders ``/inventory`` with N inventory items (default 10,000) on the
+in-memory Firestore stand-in and reports the body size and the time to
+produce each variant the compression middleware can send:
+
+    identity            the rendered HTML as is
+    minified            after MINIFY_HTML's whitespace stripping
+    gzip / brotli       compressed at COMPRESS_LEVEL / COMPRESS_BROTLI_QUALITY
+    ... + minified      both
+
+Brotli rows appear when the ``brotli`` package is installed. One request is
+also made through the middleware with ``Accept-Encoding: gzip`` to check that
+what it sends matches the gzip row.
+
+    python benchmarks/compression_bytes.py [--items 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=10_000)
+    args = parser.parse_args()
+
+    os.environ.update(FIRESTORE_BACKEND='memory', FIRESTORE_MEMORY_SEED=str(args.items),
+                      LOG_LEVEL='WARNING', LOG_SLOW_REQUEST_MS='0', MINIFY_HTML='0')
+    import app as appmod  # noqa: E402  (reads the environment above)
+    import compression  # noqa: E402
+
+    client = appmod.app.test_client()
+    with client.session_transaction() as s:
+        s['user'] = {'uid': 'bench', 'email': 'bench@example.com', 'name': 'Bench', 'role': 'admin'}
+    client.get('/inventory', headers={'Accept-Encoding': 'identity'})  # seeds the store
+    response, render_ms = timed(client.get, '/inventory')
+    response = client.get('/inventory', headers={'Accept-Encoding': 'identity'})
+    html = response.get_data()
+    assert response.status_code == 200 and b'<table' in html, response.status_code
+
+    minified, minify_ms = timed(compression.minify_html, html)
+    rows = [('identity', html, 0.0), ('minified', minified, minify_ms)]
+    for encoding in compression.available_encodings():
+        label = 'brotli' if encoding == 'br' else encoding
+        body, ms = timed(compression.compress, html, encoding)
+        rows.append((label, body, ms))
+        body, ms = timed(compression.compress, minified, encoding)
+        rows.append((f'{label} + minified', body, ms + minify_ms))
+
+    wire = client.get('/inventory', headers={'Accept-Encoding': 'gzip'})
+    assert wire.headers.get('Content-Encoding') == 'gzip'
+    gzip_size = next(len(body) for label, body, _ in rows if label == 'gzip')
+
+    print(f'/inventory with {args.items:,} items (rendered in {render_ms:.0f} ms)')
+    print(f"  {'variant':<20} {'bytes':>12} {'of identity':>12} {'extra ms':>9}")
+    for label, body, ms in rows:
+        print(f'  {label:<20} {len(body):>12,} {len(body) / len(html) * 100:>11.1f}% {ms:>9.1f}')
+    print(f'  middleware (gzip)    {len(wire.data):>12,}   (gzip row: {gzip_size:,})')
+    if 'br' not in compression.available_encodings():
+        print('  (brotli not installed; pip install brotli to measure it)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Inventory statistics benchmark: per-item loop versus the columnar engine.
+
+Generates N synthetic inventory rows (default 1,000,000) shaped like Firestore
+documents, with a mix of numeric and string stock/price values, and times:
+
+    loop       the per-item Python loop the inventory page used to run
+    build      InventoryColumns.from_items() (parsing every row once)
+    stats      InventoryColumns.stats() on the built columns
+    update     InventoryColumns.update() for single changed items (the first
+               one also builds the id index)
+
+for the NumPy columns (when installed) and the ``array`` fallback, and checks
+that every variant produces the same figures.
+
+    python benchmarks/inventory_stats_1m.py [--items 1000000] [--updates 10000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inventory_stats  # noqa: E402
+from order_archive import parse_amount  # noqa: E402
+
+
+def loop_stats(items):
+    """The inventory page's original per-item loop."""
+    total_value = 0.0
+    low_count = critical_count = active_count = out_count = 0
+    for it in items:
+        try:
+            stock = int(it.get('stock') or 0)
+        except Exception:
+            stock = 0
+        price = parse_amount(it.get('price'))
+        if price is not None:
+            total_value += price * stock
+        min_val = it.get('min')
+        try:
+            min_i = int(min_val) if min_val is not None and str(min_val) != '' else None
+        except Exception:
+            min_i = None
+        if stock > 0 and (it.get('active', True) is not False):
+            active_count += 1
+        if stock <= 0:
+            out_count += 1
+        if (min_i is not None) and (stock < min_i):
+            low_count += 1
+            if stock < max(min_i // 2, 1):
+                critical_count += 1
+    return {'total_items': len(items), 'active_items': active_count, 'out_of_stock': out_count,
+            'low_stock': low_count, 'critical': critical_count, 'inventory_value': round(total_value, 2)}
+
+
+def make_item(rng, i):
+    item = {'id': f'item{i:08d}', 'name': f'Medicine {i}',
+            'stock': rng.choice((0, 3, 12, 40, 250, '18')),
+            'price': rng.choice((2.5, 9.75, 14, '1,250.00 SAR', None))}
+    if rng.random() < 0.8:
+        item['min'] = rng.choice((5, 10, 20, '15'))
+    if rng.random() < 0.05:
+        item['active'] = False
+    return item
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=1_000_000)
+    parser.add_argument('--updates', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    items = [make_item(rng, i) for i in range(args.items)]
+    expected, loop_ms = timed(loop_stats, items)
+    print(f'{args.items:,} items')
+    print(f'  loop                 {loop_ms:9.1f} ms')
+
+    engines = [('array', False)]
+    if inventory_stats._np() is not None:
+        engines.insert(0, ('numpy', True))
+    else:
+        print('  (numpy not installed; only the array fallback is measured)')
+
+    for label, use_numpy in engines:
+        cols, build_ms = timed(inventory_stats.InventoryColumns.from_items, items, use_numpy)
+        result, stats_ms = timed(cols.stats)
+        assert result == expected, (label, result, expected)
+
+        changes = [(f'item{rng.randrange(args.items):08d}', make_item(rng, 0)) for _ in range(args.updates)]
+        # The first update builds the id -> row index
+        _, index_ms = timed(cols.update, *changes.pop())
+        start = time.perf_counter()
+        for item_id, data in changes:
+            cols.update(item_id, data)
+        update_us = (time.perf_counter() - start) * 1e6 / max(len(changes), 1)
+
+        print(f'  {label:<6} build        {build_ms:9.1f} ms')
+        print(f'  {label:<6} stats        {stats_ms:9.1f} ms   ({loop_ms / stats_ms:.0f}x the loop)')
+        print(f'  {label:<6} first update {index_ms:9.1f} ms   (builds the id index)')
+        print(f'  {label:<6} update       {update_us:9.2f} us per item')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
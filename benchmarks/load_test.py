@@ -0,0 +1,314 @@
+"""
+Load test: how many concurrent pharmacists one instance supports.
+
+Starts the app under gunicorn on the in-memory Firestore stand-in
+(FIRESTORE_BACKEND=memory, seeded with --items items in every worker) for each
+workers x threads configuration, and runs --users virtual users against it.
+Each user signs in through ``/verify-token`` with a locally signed test token
+(local_auth.py) and then repeats a weighted mix of actions:
+
+    login          POST /verify-token (a fresh sign-in)
+    dashboard      GET  /dashboard
+    inventory      GET  /inventory
+    medicines      GET  /medicines
+    orders         GET  /orders
+    order_form     GET  /orders/create
+    create_order   POST /orders/create (1-4 seeded items)
+    reports        GET  /reports
+    create_report  POST /reports/create (a CSV export, generated in the background)
+
+Requests issued during the --warmup period (first requests seed each worker)
+are not counted. For every configuration it prints throughput, latency
+percentiles and the error rate, overall and per action.
+
+    python benchmarks/load_test.py                                   # 1x4, 2x4, 4x4
+    python benchmarks/load_test.py --configs 2x8,4x8 --users 50 --duration 60
+    python benchmarks/load_test.py --mix dashboard=1,inventory=1 --latency-ms 20
+    python benchmarks/load_test.py --url http://127.0.0.1:5000      # an already running app
+
+With --url the target must run with FIRESTORE_BACKEND=memory, the same
+AUTH_TEST_TOKEN_SECRET as this script (--secret) and FLASK_ENV=development
+(so the session cookie is sent over plain HTTP). Each gunicorn worker has its
+own in-memory store, so orders created in one worker are not seen by others.
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests  # noqa: E402
+
+import firestore_memory  # noqa: E402
+import local_auth  # noqa: E402
+
+DEFAULT_MIX = ('login=2,dashboard=25,inventory=20,medicines=10,orders=12,order_form=8,create_order=10,'
+               'reports=8,create_report=5')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ACTIONS:
+            raise SystemExit(f'Unknown action {name!r}; choose from {", ".join(ACTIONS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_configs(text):
+    configs = []
+    for part in text.split(','):
+        workers, _, threads = part.lower().partition('x')
+        configs.append((int(workers), int(threads or 1)))
+    return configs
+
+
+class User:
+    def __init__(self, base_url, n, args, rng):
+        self.base_url = base_url
+        self.n = n
+        self.args = args
+        self.rng = rng
+        self.http = requests.Session()
+
+    def url(self, path):
+        return self.base_url + path
+
+    def expect(self, response, status):
+        if response.status_code != status:
+            return f'HTTP {response.status_code}'
+        # A lost session shows up as a redirect to the login page
+        if status == 302 and '/login' in response.headers.get('Location', ''):
+            return 'redirected to login'
+        return None
+
+    def login(self):
+        token = local_auth.issue_test_token(f'loadtest-{self.n}', email=f'loadtest{self.n}@example.com',
+                                            name=f'Load test {self.n}', secret=self.args.secret)
+        return self.expect(self.http.post(self.url('/verify-token'), json={'token': token},
+                                          timeout=self.args.timeout), 200)
+
+    def page(self, path):
+        return self.expect(self.http.get(self.url(path), allow_redirects=False, timeout=self.args.timeout), 200)
+
+    def create_order(self):
+        items = self.args.items
+        lines = [firestore_memory.ITEM_ID.format(self.rng.randrange(items)) for _ in range(self.rng.randint(1, 4))]
+        form = {
+            'supplier': firestore_memory.SUPPLIER_ID.format(self.rng.randrange(firestore_memory.seeded_suppliers(items))),
+            'item_id[]': lines,
+            'quantity[]': [str(self.rng.randint(1, 20)) for _ in lines],
+        }
+        return self.expect(self.http.post(self.url('/orders/create'), data=form, allow_redirects=False,
+                                          timeout=self.args.timeout), 302)
+
+    def create_report(self):
+        form = {
+            'title': f'Load test report {self.n}',
+            'report_type': 'inventory',
+            'export_format': 'csv',
+            'include_stock': 'on',
+            'selected_medicines': [firestore_memory.MEDICINE_ID.format(self.rng.randrange(self.args.items))
+                                   for _ in range(5)],
+        }
+        return self.expect(self.http.post(self.url('/reports/create'), data=form, allow_redirects=False,
+                                          timeout=self.args.timeout), 302)
+
+
+ACTIONS = {
+    'login': User.login,
+    'dashboard': lambda u: u.page('/dashboard'),
+    'inventory': lambda u: u.page('/inventory'),
+    'medicines': lambda u: u.page('/medicines'),
+    'orders': lambda u: u.page('/orders'),
+    'order_form': lambda u: u.page('/orders/create'),
+    'create_order': User.create_order,
+    'reports': lambda u: u.page('/reports'),
+    'create_report': User.create_report,
+}
+
+
+def run_user(user, mix, measure_from, stop_at, results, lock):
+    names, weights = list(mix), list(mix.values())
+    action = 'login'
+    while time.monotonic() < stop_at:
+        started = time.monotonic()
+        try:
+            error = ACTIONS[action](user)
+        except requests.RequestException as e:
+            error = type(e).__name__
+        elapsed = time.monotonic() - started
+        if started >= measure_from:
+            with lock:
+                results.append((action, elapsed, error))
+        if user.args.think_ms:
+            time.sleep(user.rng.expovariate(1000.0 / user.args.think_ms))
+        action = user.rng.choices(names, weights)[0]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(int(round(p / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[k]
+
+
+def summarize(rows, seconds):
+    latencies = sorted(r[1] for r in rows)
+    errors = [r[2] for r in rows if r[2]]
+    return {
+        'requests': len(rows),
+        'rps': len(rows) / seconds if seconds else 0.0,
+        'error_rate': len(errors) / len(rows) if rows else 0.0,
+        'mean_ms': sum(latencies) / len(latencies) * 1000.0 if latencies else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000.0,
+        'p90_ms': percentile(latencies, 90) * 1000.0,
+        'p99_ms': percentile(latencies, 99) * 1000.0,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000.0,
+        'errors': dict(sorted(_count(errors).items())),
+    }
+
+
+def _count(values):
+    out = defaultdict(int)
+    for v in values:
+        out[v] += 1
+    return out
+
+
+def run_load(base_url, args, mix):
+    results, lock = [], threading.Lock()
+    start = time.monotonic()
+    measure_from = start + args.warmup
+    stop_at = measure_from + args.duration
+    threads = []
+    for n in range(args.users):
+        user = User(base_url, n, args, random.Random(args.seed * 1000 + n))
+        t = threading.Thread(target=run_user, args=(user, mix, measure_from, stop_at, results, lock), daemon=True)
+        t.start()
+        threads.append(t)
+        # Ramp up over the warmup period instead of signing everyone in at once
+        time.sleep(min(args.warmup / max(args.users, 1), 0.05))
+    for t in threads:
+        t.join(args.timeout + 5)
+    by_action = defaultdict(list)
+    for row in results:
+        by_action[row[0]].append(row)
+    return {
+        'total': summarize(results, args.duration),
+        'actions': {name: summarize(rows, args.duration) for name, rows in sorted(by_action.items())},
+    }
+
+
+def start_server(workers, threads, args, log):
+    env = dict(os.environ,
+               FIRESTORE_BACKEND='memory',
+               FIRESTORE_MEMORY_SEED=str(args.items),
+               FIRESTORE_MEMORY_LATENCY_MS=str(args.latency_ms),
+               AUTH_TEST_TOKEN_SECRET=args.secret,
+               FLASK_ENV='development',
+               LOG_LEVEL=args.app_log_level,
+               REPORTS_LOCAL_DIR=os.path.join(args.workdir, 'reports'),
+               PROFILE_DIR=os.path.join(args.workdir, 'profiles'),
+               SQLITE_REPLICA_PATH=os.path.join(args.workdir, 'replica.sqlite3'))
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:create_app()', '--workers', str(workers),
+           '--threads', str(threads), '--bind', f'127.0.0.1:{args.port}', '--timeout', '120']
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{args.port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'gunicorn exited with status {proc.returncode}; see {log.name}')
+        try:
+            requests.get(base_url + '/healthz', timeout=2)
+            return proc, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_server(proc)
+    raise SystemExit(f'gunicorn did not start within 60s; see {log.name}')
+
+
+def stop_server(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def print_report(label, report):
+    total = report['total']
+    print(f'\n{label}: {total["requests"]} requests, {total["rps"]:.1f} req/s, '
+          f'{total["error_rate"] * 100:.2f}% errors')
+    print(f"  {'action':<14} {'count':>7} {'req/s':>7} {'err %':>6} {'mean':>8} {'p50':>8} "
+          f"{'p90':>8} {'p99':>8} {'max':>8}  (ms)")
+    for name, s in [*report['actions'].items(), ('TOTAL', total)]:
+        print(f'  {name:<14} {s["requests"]:>7} {s["rps"]:>7.1f} {s["error_rate"] * 100:>6.2f} '
+              f'{s["mean_ms"]:>8.1f} {s["p50_ms"]:>8.1f} {s["p90_ms"]:>8.1f} {s["p99_ms"]:>8.1f} {s["max_ms"]:>8.1f}')
+    errors = {k: v for s in report['actions'].values() for k, v in s['errors'].items()}
+    if errors:
+        print('  errors: ' + ', '.join(f'{k} x{v}' for k, v in errors.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', default='1x4,2x4,4x4', help='gunicorn WORKERSxTHREADS, comma-separated')
+    parser.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30.0, help='measured seconds per configuration')
+    parser.add_argument('--warmup', type=float, default=10.0, help='unmeasured seconds before each run')
+    parser.add_argument('--think-ms', type=float, default=500.0, help='mean pause between a user\'s actions')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='action weights, e.g. dashboard=3,inventory=1')
+    parser.add_argument('--items', type=int, default=1000, help='inventory items seeded in every worker')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='added latency per Firestore RPC')
+    parser.add_argument('--timeout', type=float, default=30.0, help='HTTP timeout per request')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--url', help='test this running app instead of starting gunicorn')
+    parser.add_argument('--secret', default=None, help='AUTH_TEST_TOKEN_SECRET (random when starting gunicorn)')
+    parser.add_argument('--app-log-level', default='WARNING', help='LOG_LEVEL of the started app')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    reports = {}
+    if args.url:
+        args.secret = args.secret or os.environ.get('AUTH_TEST_TOKEN_SECRET')
+        if not args.secret:
+            raise SystemExit('--url needs --secret (or AUTH_TEST_TOKEN_SECRET) matching the target app')
+        reports[args.url] = run_load(args.url.rstrip('/'), args, mix)
+        print_report(args.url, reports[args.url])
+    else:
+        args.secret = args.secret or secrets.token_hex(16)
+        args.workdir = tempfile.mkdtemp(prefix='pharmacy-load-')
+        print(f'{args.users} users, {args.duration:g}s per configuration after {args.warmup:g}s warmup, '
+              f'{args.items} items, {args.latency_ms:g} ms per Firestore RPC; app logs in {args.workdir}')
+        for workers, threads in parse_configs(args.configs):
+            label = f'{workers} workers x {threads} threads'
+            with open(os.path.join(args.workdir, f'gunicorn-{workers}x{threads}.log'), 'w') as log:
+                proc, base_url = start_server(workers, threads, args, log)
+                try:
+                    reports[label] = run_load(base_url, args, mix)
+                finally:
+                    stop_server(proc)
+            print_report(label, reports[label])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+    return 1 if any(r['total']['requests'] == 0 for r in reports.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
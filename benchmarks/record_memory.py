@@ -0,0 +1,78 @@
+"""
+Memory benchmark: catalog rows as dicts versus ``__slots__`` records.
+
+Builds N synthetic inventory rows in a fresh subprocess per representation and
+reports the resident set size growth, so allocator state from one run does not
+leak into the next:
+
+    dicts     [{'id': doc_id, **data}, ...]      (what the routes used to build)
+    records   [records.InventoryItem(...), ...]   (records.py)
+
+    python benchmarks/record_memory.py                    # 100k and 1M rows
+    python benchmarks/record_memory.py --counts 100000
+
+Each row gets its own id, name and code strings, as rows read from Firestore
+do, so both columns include the values; the difference is the container cost.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import gc, sys
+sys.path.insert(0, {root!r})
+import records
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+CATEGORIES = ['Pain', 'Antibiotics', 'Vitamins', 'Supplements', 'Equipment']
+n, kind = {n}, {kind!r}
+gc.collect()
+before = rss_kb()
+rows = []
+for i in range(n):
+    doc_id = f'item{{i:08d}}'
+    data = {{'name': f'Medicine {{i}}', 'code': f'C{{i}}', 'category': CATEGORIES[i % 5],
+             'stock': i % 300, 'min': 20, 'price': 4.5 + (i % 50), 'active': True}}
+    if kind == 'dicts':
+        rows.append({{'id': doc_id, **data}})
+    else:
+        rows.append(records.InventoryItem(doc_id, data))
+gc.collect()
+print(rss_kb() - before)
+'''
+
+
+def measure(n, kind):
+    proc = subprocess.run([sys.executable, '-c', CHILD.format(root=ROOT, n=n, kind=kind)],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr[-2000:])
+    return int(proc.stdout.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counts', type=int, nargs='+', default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10}  {'dicts MB':>9}  {'records MB':>10}  {'saved':>6}  {'bytes/row (dict -> record)':>27}")
+    for n in args.counts:
+        dicts, recs = measure(n, 'dicts'), measure(n, 'records')
+        saved = (1 - recs / dicts) * 100 if dicts else 0.0
+        print(f'{n:>10}  {dicts / 1024:>9.1f}  {recs / 1024:>10.1f}  {saved:>5.0f}%  '
+              f'{dicts * 1024 / n:>12.0f} -> {recs * 1024 / n:.0f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Startup benchmark: how long a fresh worker takes to import the application.
+
+Runs ``python -X importtime -c "import app"`` several times in clean
+subprocesses and reports the cumulative import time of ``app`` together with
+the most expensive top-level dependencies. Heavy SDKs (firebase_admin,
+google.cloud.firestore, google.auth) should not appear in the list, since
+they are only imported on first use.
+
+    python benchmarks/startup_importtime.py [--runs 5] [--module app] [--top 15]
+    python benchmarks/startup_importtime.py --factory   # also time create_app()
+
+Exit status is 1 when the median exceeds --budget-ms (if given), so the
+script can guard startup time in CI.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+WATCHED = ('firebase_admin', 'google.cloud.firestore', 'google.auth', 'google.oauth2', 'grpc', 'flask_cors')
+
+
+def run_once(module, factory):
+    code = f'import {module}'
+    if factory:
+        code += f'; {module}.create_app()'
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f'import failed:\n{proc.stderr[-2000:]}')
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if m:
+            self_us, cumulative_us, indent, name = int(m.group(1)), int(m.group(2)), len(m.group(3)), m.group(4)
+            rows.append((name, indent, self_us, cumulative_us))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--factory', action='store_true', help='also call create_app() after importing')
+    parser.add_argument('--budget-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    totals, last = [], []
+    for _ in range(args.runs):
+        last = run_once(args.module, args.factory)
+        # Top-level entries (indent 1) sum to the total wall time spent importing
+        totals.append(sum(cum for _, indent, _, cum in last if indent == 1) / 1000.0)
+
+    print(f'{args.module}: median {statistics.median(totals):.1f} ms, '
+          f'min {min(totals):.1f} ms, max {max(totals):.1f} ms over {args.runs} runs')
+
+    print(f'\nSlowest top-level imports (last run):')
+    top_level = sorted((r for r in last if r[1] == 1), key=lambda r: r[3], reverse=True)
+    for name, _, _, cum in top_level[:args.top]:
+        print(f'  {cum / 1000.0:8.1f} ms  {name}')
+
+    loaded = [w for w in WATCHED if any(name == w or name.startswith(w + '.') for name, _, _, _ in last)]
+    print('\nDeferred packages imported at startup: ' + (', '.join(loaded) if loaded else 'none'))
+
+    if args.budget_ms is not None and statistics.median(totals) > args.budget_ms:
+        print(f'\nFAIL: median exceeds budget of {args.budget_ms:.0f} ms')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Contention benchmark: many tills selling the same item.
+
+T threads ("tills") each sell one unit of the same inventory item S times on
+the in-memory Firestore stand-in, with a per-RPC ``--latency`` and a
+``--write-interval`` between commits to the same document (Firestore's
+sustained per-document write limit, scaled down so a run takes seconds).
+Three ways of writing the sale are compared:
+
+    transaction   read the item, check stock, write stock - 1 (retries on Aborted)
+    increment     one blind firestore.Increment(-1) on the item document
+    sharded       sharded_counter.increment() on one of --shards shard documents
+
+For each it reports sales per second, p50/p99 sale latency, transaction
+aborts, sales that failed after all retries, and whether the final stock
+(item plus shards) equals the starting stock minus the completed sales. Only
+the stock write is measured; the order, counter and watermark documents a
+real sale would also touch are left out.
+
+    python benchmarks/stock_contention.py [--tills 16] [--sales 25] [--shards 10]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ITEM = 'item000001'
+START_STOCK = 1_000_000
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)] if ordered else 0.0
+
+
+def run(mode, args):
+    from firebase_admin import firestore
+    from firestore_memory import MemoryClient
+    import sharded_counter
+
+    db = MemoryClient(latency=args.latency, doc_write_interval=args.write_interval)
+    item_ref = db.collection('inventory').document(ITEM)
+    item_ref.set({'name': 'Paracetamol 500mg', 'stock': START_STOCK})
+    if mode == 'sharded':
+        sharded_counter.reshard(db, ITEM, args.shards)
+    data = item_ref.get().to_dict()
+
+    @firestore.transactional
+    def sell_checked(transaction):
+        stock = (item_ref.get(transaction=transaction).to_dict() or {}).get('stock', 0)
+        if stock < 1:
+            raise ValueError('out of stock')
+        transaction.update(item_ref, {'stock': stock - 1})
+
+    def sell():
+        if mode == 'transaction':
+            sell_checked(db.transaction(max_attempts=args.attempts))
+            return
+        batch = db.batch()
+        sharded_counter.increment(batch, db, ITEM, data, -1)
+        batch.commit()
+
+    latencies, failures, lock = [], [0], threading.Lock()
+
+    def till():
+        for _ in range(args.sales):
+            start = time.perf_counter()
+            try:
+                sell()
+            except Exception:
+                with lock:
+                    failures[0] += 1
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000.0)
+
+    threads = [threading.Thread(target=till) for _ in range(args.tills)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    reads_before = db.reads
+    final = sharded_counter.base_stock(item_ref.get().to_dict())
+    final += sharded_counter.shard_sums(db, [(ITEM, sharded_counter.shard_count(data))])[ITEM]
+    return {
+        'mode': mode,
+        'sales': len(latencies),
+        'per_s': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': statistics.median(latencies) if latencies else 0.0,
+        'p99': percentile(latencies, 0.99),
+        'aborts': db.aborts,
+        'failed': failures[0],
+        'correct': final == START_STOCK - len(latencies),
+        'read_docs': db.reads - reads_before + 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tills', type=int, default=16)
+    parser.add_argument('--sales', type=int, default=25, help='sales per till')
+    parser.add_argument('--shards', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.002, help='seconds per RPC')
+    parser.add_argument('--write-interval', type=float, default=0.02,
+                        help='minimum seconds between commits to one document')
+    parser.add_argument('--attempts', type=int, default=5, help='transaction attempts before a sale fails')
+    args = parser.parse_args()
+
+    print(f'{args.tills} tills x {args.sales} sales of one item; latency {args.latency * 1000:.0f} ms, '
+          f'one write per {args.write_interval * 1000:.0f} ms per document, {args.shards} shards')
+    print(f"  {'mode':<12} {'sales':>6} {'sales/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'aborts':>7} {'failed':>7} "
+          f"{'stock ok':>9} {'reads/total':>12}")
+    for mode in ('transaction', 'increment', 'sharded'):
+        r = run(mode, args)
+        print(f"  {r['mode']:<12} {r['sales']:>6} {r['per_s']:>9.1f} {r['p50']:>8.1f} {r['p99']:>8.1f} "
+              f"{r['aborts']:>7} {r['failed']:>7} {'yes' if r['correct'] else 'NO':>9} {r['read_docs']:>12}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+In-process mirror of small, frequently listed collections.
+
+The medicines, inventory and suppliers pages used to stream their whole
+collection on every request. With FIRESTORE_MIRROR enabled, each worker keeps a
+copy of those collections current through Firestore ``on_snapshot`` listeners
+and the list routes read from it; ``get(name)`` returns ``None`` while a
+collection is cold (listener starting, resyncing, disabled or over budget) and
+callers fall back to a direct query.
+
+Listeners that fail (an exception in the callback, or a watch that is no
+longer active) are restarted by a supervisor thread, which rebuilds that
+collection from a fresh snapshot. The estimated size of all mirrored documents
+is bounded by FIRESTORE_MIRROR_MAX_MB; a collection that pushes the total over
+the budget is dropped from the mirror and served by queries again.
+
+For inventory the mirror also keeps the columnar stats engine
+(inventory_stats.py) current, one row update per changed document, so
+``column_stats('inventory')`` costs a few vectorized reductions.
+
+Changes reach the mirror asynchronously (usually well under a second), so a
+list page opened right after a write may briefly miss that write.
+
+Environment:
+    FIRESTORE_MIRROR                 "1" for medicines,inventory,suppliers or a comma-separated list (unset: off)
+    FIRESTORE_MIRROR_MAX_MB          memory budget for mirrored documents (default 64)
+    FIRESTORE_MIRROR_CHECK_SECONDS   how often listeners are checked and resynced (default 30)
+"""
+import logging
+import os
+import threading
+import time
+
+import records
+from inventory_stats import InventoryColumns
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTIONS = ('medicines', 'inventory', 'suppliers')
+# Collections whose stats columns are kept current alongside the documents
+COLUMNAR = {'inventory': InventoryColumns}
+
+
+def _configured_collections():
+    raw = (os.environ.get('FIRESTORE_MIRROR') or '').strip()
+    if raw.lower() in ('', '0', 'false', 'no', 'off'):
+        return ()
+    if raw.lower() in ('1', 'true', 'yes', 'on'):
+        return DEFAULT_COLLECTIONS
+    return tuple(name.strip() for name in raw.split(',') if name.strip())
+
+
+def _estimate_bytes(data):
+    # Rough but cheap: the repr is within a small factor of a record's real footprint
+    return len(repr(data))
+
+
+class _Collection:
+    """Mirror state of one collection; replaced wholesale on every resync."""
+
+    def __init__(self, name):
+        self.name = name
+        self.docs = {}
+        self.sizes = {}
+        self.bytes = 0
+        self.ready = False
+        self.failed = None
+        self.watch = None
+        self.version = 0
+        self.listing = (None, [])
+        self.last_event = None
+        self.columns = COLUMNAR[name]() if name in COLUMNAR else None
+
+
+class CollectionMirror:
+    def __init__(self, get_db, collections=None, max_bytes=None, check_interval=None):
+        self.get_db = get_db
+        self.collections = tuple(collections if collections is not None else _configured_collections())
+        self.max_bytes = int(max_bytes if max_bytes is not None
+                             else float(os.environ.get('FIRESTORE_MIRROR_MAX_MB', '64')) * 1024 * 1024)
+        self.check_interval = float(check_interval if check_interval is not None
+                                    else os.environ.get('FIRESTORE_MIRROR_CHECK_SECONDS', '30'))
+        self._state = {}
+        self._over_budget = set()
+        self._resyncs = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self):
+        return bool(self.collections)
+
+    def ensure_started(self):
+        """Start the listeners and the supervisor once per process (no-op when disabled)."""
+        if not self.enabled or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._supervise, name='collection-mirror', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            states = list(self._state.values())
+            self._state.clear()
+        for state in states:
+            self._unsubscribe(state)
+
+    def get(self, name):
+        """Documents of ``name`` as records (records.py) ordered by id, or None when not mirrored yet."""
+        with self._lock:
+            state = self._state.get(name)
+            if state is None or not state.ready or state.failed:
+                return None
+            version, listing = state.listing
+            if version != state.version:
+                listing = [state.docs[doc_id] for doc_id in sorted(state.docs)]
+                state.listing = (state.version, listing)
+        # The records are shared by every request reading the mirror; callers must not modify them
+        return list(listing)
+
+    def warm(self, name):
+        """Whether ``name`` is currently served from the mirror."""
+        with self._lock:
+            state = self._state.get(name)
+            return state is not None and state.ready and not state.failed
+
+    def column_stats(self, name):
+        """``stats()`` of the collection's columns (inventory_stats.py), or None when not mirrored yet."""
+        with self._lock:
+            state = self._state.get(name)
+            if state is None or not state.ready or state.failed or state.columns is None:
+                return None
+            return state.columns.stats()
+
+    def _supervise(self):
+        while not self._stop.is_set():
+            for name in self.collections:
+                if name in self._over_budget:
+                    continue
+                with self._lock:
+                    state = self._state.get(name)
+                if state is None or state.failed or not getattr(state.watch, 'is_active', True):
+                    if state is not None:
+                        reason = state.failed or 'listener stopped'
+                        logger.info("Resyncing %s: %s", name, reason)
+                        self._resyncs += 1
+                    self._listen(name)
+            self._stop.wait(self.check_interval)
+
+    def _listen(self, name):
+        state = _Collection(name)
+        with self._lock:
+            old = self._state.get(name)
+            self._state[name] = state
+        if old is not None:
+            self._unsubscribe(old)
+        try:
+            db = self.get_db()
+            if db is None:
+                raise RuntimeError('Firestore client is not initialized')
+            state.watch = db.collection(name).on_snapshot(
+                lambda docs, changes, read_time: self._on_snapshot(state, changes))
+            if name in self._over_budget:
+                # The first snapshot already exceeded the budget
+                self._unsubscribe(state)
+        except Exception as e:
+            state.failed = str(e) or e.__class__.__name__
+            logger.warning("Could not listen to %s: %s", name, state.failed)
+
+    def _on_snapshot(self, state, changes):
+        try:
+            with self._lock:
+                if self._state.get(state.name) is not state:
+                    return  # superseded by a resync
+                for change in changes:
+                    doc_id = change.document.id
+                    state.bytes -= state.sizes.pop(doc_id, 0)
+                    state.docs.pop(doc_id, None)
+                    data = None
+                    if change.type.name != 'REMOVED':
+                        data = change.document.to_dict() or {}
+                        state.docs[doc_id] = records.make(state.name, doc_id, data)
+                        state.sizes[doc_id] = _estimate_bytes(data)
+                        state.bytes += state.sizes[doc_id]
+                    if state.columns is not None:
+                        state.columns.update(doc_id, data)
+                state.version += 1
+                state.ready = True
+                state.last_event = time.monotonic()
+                if sum(s.bytes for s in self._state.values()) > self.max_bytes:
+                    self._drop_over_budget(state)
+        except Exception as e:
+            state.failed = str(e) or e.__class__.__name__
+
+    def _drop_over_budget(self, state):
+        # Called with the lock held; the watch is closed outside the listener thread
+        logger.warning("%s exceeds the mirror budget of %g MB; serving it from queries",
+                       state.name, self.max_bytes / (1024 * 1024))
+        self._over_budget.add(state.name)
+        self._state.pop(state.name, None)
+        state.docs.clear()
+        state.sizes.clear()
+        state.columns = None
+        state.bytes = 0
+        threading.Thread(target=self._unsubscribe, args=(state,), daemon=True).start()
+
+    @staticmethod
+    def _unsubscribe(state):
+        try:
+            if state.watch is not None:
+                state.watch.unsubscribe()
+        except Exception as e:
+            logger.warning("Error closing listener for %s: %s", state.name, e)
+
+    def status(self):
+        now = time.monotonic()
+        collections = {}
+        with self._lock:
+            for name in self.collections:
+                state = self._state.get(name)
+                if name in self._over_budget:
+                    collections[name] = {'state': 'over_budget'}
+                elif state is None:
+                    collections[name] = {'state': 'cold'}
+                else:
+                    collections[name] = {
+                        'state': 'failed' if state.failed else ('ready' if state.ready else 'warming'),
+                        'documents': len(state.docs),
+                        'bytes': state.bytes,
+                        'last_event_seconds_ago': round(now - state.last_event, 1) if state.last_event else None,
+                    }
+            return {'enabled': self.enabled, 'budget_bytes': self.max_bytes,
+                    'resyncs': self._resyncs, 'collections': collections}
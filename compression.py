@@ -0,0 +1,272 @@
+"""
+Response compression, HTML minification and a compressed page cache.
+
+``init_app(app)`` compresses text responses (HTML, JSON, CSS, JavaScript, SVG,
+XML, CSV) with brotli when the ``brotli`` package is installed and the client
+accepts it, and with gzip otherwise. Bodies under COMPRESS_MIN_BYTES are sent
+as is. Streamed responses are compressed chunk by chunk and flushed after
+each chunk, so they keep streaming. File downloads, range responses and
+anything already encoded are left alone.
+
+With MINIFY_HTML=1, rendered HTML also has the indentation and blank lines
+Jinja leaves behind removed (``<pre>``, ``<textarea>`` and ``<script>``
+contents are kept verbatim) before it is compressed.
+
+``@cached_page`` keeps a view's rendered page for PAGE_CACHE_TTL seconds,
+per path and language, and stores each encoding the first time a client asks
+for it, so repeated requests are neither re-rendered nor re-compressed. Only
+anonymous GET requests without pending flash messages are served from it (the
+sign-in and sign-up pages); pages that show the signed-in user are not cached.
+
+Environment:
+    COMPRESS_RESPONSES        0 disables compression (default 1)
+    COMPRESS_MIN_BYTES        smallest body worth compressing (default 1024)
+    COMPRESS_LEVEL            gzip level (default 6)
+    COMPRESS_BROTLI_QUALITY   brotli quality (default 4)
+    MINIFY_HTML               1 strips template whitespace from HTML (default 0)
+    PAGE_CACHE_TTL            seconds a @cached_page page is kept (default 60)
+    PAGE_CACHE_SIZE           pages kept before the least recently used is dropped (default 32)
+"""
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, g, make_response, request, session
+
+COMPRESSIBLE = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+_brotli = None
+
+
+def _brotli_module():
+    """brotli (or brotlicffi) if installed (imported on first use), else None."""
+    global _brotli
+    if _brotli is None:
+        _brotli = False
+        for name in ('brotli', 'brotlicffi'):
+            try:
+                _brotli = __import__(name)
+                break
+            except ImportError:
+                continue
+    return _brotli or None
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def gzip_level():
+    return _env_int('COMPRESS_LEVEL', '6')
+
+
+def brotli_quality():
+    return _env_int('COMPRESS_BROTLI_QUALITY', '4')
+
+
+def available_encodings():
+    return ('br', 'gzip') if _brotli_module() is not None else ('gzip',)
+
+
+def choose_encoding(accept_encodings):
+    """The best encoding the client accepts ('br' or 'gzip'), or None; brotli wins ties."""
+    best, best_q = None, 0
+    for encoding in available_encodings():
+        q = accept_encodings.quality(encoding)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return _brotli_module().compress(data, quality=brotli_quality())
+    compressor = zlib.compressobj(gzip_level(), zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class _StreamCompressor:
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._c = _brotli_module().Compressor(quality=brotli_quality())
+            self._compress = getattr(self._c, 'process', None) or self._c.compress
+            self._flush = self._c.flush
+            self._finish = self._c.finish
+        else:
+            self._c = zlib.compressobj(gzip_level(), zlib.DEFLATED, 31)
+            self._compress = self._c.compress
+            self._flush = lambda: self._c.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._c.flush
+
+    def chunk(self, data):
+        return self._compress(data) + self._flush()
+
+    def finish(self):
+        return self._finish()
+
+
+def _compress_stream(chunks, encoding):
+    compressor = _StreamCompressor(encoding)
+    try:
+        for chunk in chunks:
+            out = compressor.chunk(chunk)
+            if out:
+                yield out
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+# Works on the encoded bytes (no decode/encode of large pages); the templates write tag names in lowercase
+_PROTECTED = re.compile(rb'(<(pre|textarea|script)\b.*?</\2\s*>)', re.DOTALL)
+# Indentation and blank lines; a leading [ \t]* would make the scan retry at every space
+_LINE_WHITESPACE = re.compile(rb'\n\s+')
+
+
+def minify_html(html):
+    """``html`` (bytes) without indentation and blank lines outside pre/textarea/script."""
+    parts = _PROTECTED.split(html)
+    out = []
+    # split() yields text, protected block, tag name, text, ...
+    for i in range(0, len(parts), 3):
+        out.append(_LINE_WHITESPACE.sub(b'\n', parts[i]))
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return b''.join(out).strip()
+
+
+def _compressible(response):
+    mimetype = response.mimetype or ''
+    return mimetype.startswith(COMPRESSIBLE) or mimetype.endswith('+json')
+
+
+def _leave_alone(response):
+    return (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or 'X-Page-Cache' in response.headers
+            or 'Content-Range' in response.headers
+            or 'Accept-Ranges' in response.headers
+            or 'attachment' in response.headers.get('Content-Disposition', ''))
+
+
+def _mark_encoded(response, encoding):
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ from the identity ones; a strong validator would be wrong
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+class PageCache:
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = float(ttl if ttl is not None else os.environ.get('PAGE_CACHE_TTL', '60'))
+        self.max_entries = int(max_entries if max_entries is not None else os.environ.get('PAGE_CACHE_SIZE', '32'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry['stored_at'] > self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype):
+        entry = {'stored_at': time.monotonic(), 'mimetype': mimetype, 'bodies': {None: body}}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def encoded(self, entry, encoding):
+        """The entry's body in ``encoding``, compressed on first use."""
+        body = entry['bodies'].get(encoding)
+        if body is None:
+            body = compress(entry['bodies'][None], encoding)
+            entry['bodies'][encoding] = body
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+pages = PageCache()
+
+
+def cached_page(view):
+    """Serve an anonymous GET of this view from the compressed page cache (see the module docstring)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET' or 'user' in session or '_flashes' in session:
+            return view(*args, **kwargs)
+        key = (request.endpoint, request.full_path, g.get('lang'))
+        entry = pages.get(key)
+        status = 'hit'
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed or response.mimetype != 'text/html':
+                return response
+            body = response.get_data()
+            if _minify_enabled():
+                body = minify_html(body)
+            entry = pages.put(key, body, response.mimetype)
+            status = 'miss'
+        encoding = choose_encoding(request.accept_encodings) if _compress_enabled() else None
+        if encoding is not None and len(entry['bodies'][None]) < _env_int('COMPRESS_MIN_BYTES', '1024'):
+            encoding = None
+        response = Response(pages.encoded(entry, encoding) if encoding else entry['bodies'][None],
+                            mimetype=entry['mimetype'])
+        if encoding:
+            _mark_encoded(response, encoding)
+        response.vary.add('Accept-Encoding')
+        response.headers['X-Page-Cache'] = status
+        return response
+    return wrapper
+
+
+def _compress_enabled():
+    return os.environ.get('COMPRESS_RESPONSES', '1') != '0'
+
+
+def _minify_enabled():
+    return os.environ.get('MINIFY_HTML') == '1'
+
+
+def init_app(app):
+    enabled = _compress_enabled()
+    minify = _minify_enabled()
+    min_bytes = _env_int('COMPRESS_MIN_BYTES', '1024')
+
+    @app.after_request
+    def _compress_response(response):
+        if _leave_alone(response) or not _compressible(response):
+            return response
+        if minify and response.mimetype == 'text/html' and not response.is_streamed:
+            response.set_data(minify_html(response.get_data()))
+        if not enabled:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None or request.method == 'HEAD':
+            return response
+        if response.is_streamed:
+            response.response = _compress_stream(response.iter_encoded(), encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < min_bytes:
+                return response
+            response.set_data(compress(data, encoding))
+        _mark_encoded(response, encoding)
+        return response
@@ -0,0 +1,169 @@
+"""
+Aggregate counters kept in the ``stats`` collection.
+
+Writers update these documents with ``firestore.Increment`` in the same batch or
+transaction as the change they describe, so pages can read totals from a few
+documents instead of rescanning whole collections.
+
+    stats/orders     total, by_status.<status>, delivered_days_sum, delivered_timed,
+                     amount_sum, amount_count
+    stats/inventory  items, stock_units, received_units
+
+Every order write would otherwise increment the same document, which Firestore
+sustains at about one write per second. The increments therefore go to one of
+COUNTER_SHARDS shard documents under ``stats/<name>/shards/``, picked at random
+(sharded_counter.py), and ``read_counters()`` adds the base document and its
+shards back up. ``rebuild_counters()`` writes the totals to the base document
+and clears the shards.
+"""
+from datetime import datetime, timezone
+from lazy_imports import lazy_module
+import sharded_counter
+
+firestore = lazy_module('firebase_admin.firestore')
+
+COUNTERS_COLLECTION = 'stats'
+ORDER_COUNTERS_DOC = 'orders'
+INVENTORY_COUNTERS_DOC = 'inventory'
+# Fixed: readers sum exactly this many shards
+COUNTER_SHARDS = 10
+
+
+def order_counters_ref(db):
+    return db.collection(COUNTERS_COLLECTION).document(ORDER_COUNTERS_DOC)
+
+
+def inventory_counters_ref(db):
+    return db.collection(COUNTERS_COLLECTION).document(INVENTORY_COUNTERS_DOC)
+
+
+def order_created(writer, db, status='pending', amount=None):
+    """Stage the counter updates for a newly created order on a batch or transaction.
+
+    ``amount`` is the order's parsed ``total``, when it has one.
+    """
+    update = {
+        'total': firestore.Increment(1),
+        'by_status': {status: firestore.Increment(1)},
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    }
+    if amount is not None:
+        update['amount_sum'] = firestore.Increment(amount)
+        update['amount_count'] = firestore.Increment(1)
+    sharded_counter.add_to_counter(writer, order_counters_ref(db), COUNTER_SHARDS, update)
+
+
+def order_status_changed(writer, db, old_status, new_status, delivery_days=None):
+    """Stage the counter updates for an order moving between two statuses."""
+    by_status = {new_status: firestore.Increment(1)}
+    if old_status and old_status != new_status:
+        by_status[old_status] = firestore.Increment(-1)
+    update = {
+        'by_status': by_status,
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    }
+    if delivery_days is not None:
+        update['delivered_days_sum'] = firestore.Increment(delivery_days)
+        update['delivered_timed'] = firestore.Increment(1)
+    sharded_counter.add_to_counter(writer, order_counters_ref(db), COUNTER_SHARDS, update)
+
+
+def stock_received(writer, db, units):
+    """Stage the inventory counter updates for ``units`` received into stock."""
+    sharded_counter.add_to_counter(writer, inventory_counters_ref(db), COUNTER_SHARDS, {
+        'stock_units': firestore.Increment(units),
+        'received_units': firestore.Increment(units),
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    })
+
+
+def stock_adjusted(writer, db, units):
+    """Stage the inventory counter update for a batch of stock corrections totalling ``units``."""
+    sharded_counter.add_to_counter(writer, inventory_counters_ref(db), COUNTER_SHARDS, {
+        'stock_units': firestore.Increment(units),
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    })
+
+
+def read_counters(db, timeout=None):
+    """Return (order_counters, inventory_counters) dicts, each summed over its shards; empty when never built."""
+    refs = (sharded_counter.counter_refs(order_counters_ref(db), COUNTER_SHARDS)
+            + sharded_counter.counter_refs(inventory_counters_ref(db), COUNTER_SHARDS))
+    kwargs = {'timeout': timeout} if timeout is not None else {}
+    totals = {ORDER_COUNTERS_DOC: {}, INVENTORY_COUNTERS_DOC: {}}
+    for snap in db.get_all(refs, **kwargs):
+        if snap.exists:
+            # stats/<name> or stats/<name>/shards/<k>
+            sharded_counter.merge_counts(totals[snap.reference.path.split('/')[1]], snap.to_dict() or {})
+    return totals[ORDER_COUNTERS_DOC], totals[INVENTORY_COUNTERS_DOC]
+
+
+def rebuild_counters(db):
+    """Recompute every counter from a full scan and overwrite the stats documents.
+
+    Run once after deploying (``flask rebuild-counters``) so counters include orders
+    created before they were maintained, and again whenever they are suspected to drift.
+    """
+    from order_workflow import normalize_status
+    from order_archive import parse_amount, read_rollup
+
+    # Archived orders are no longer in `orders`; start from their rollup
+    archived = read_rollup(db)
+    orders = {
+        'total': int(archived.get('count') or 0),
+        'by_status': {k: int(v or 0) for k, v in (archived.get('by_status') or {}).items()},
+        'delivered_days_sum': float(archived.get('delivered_days_sum') or 0.0),
+        'delivered_timed': int(archived.get('delivered_timed') or 0),
+        'amount_sum': float(archived.get('amount_sum') or 0.0),
+        'amount_count': int(archived.get('amount_count') or 0),
+    }
+    for doc in db.collection('orders').stream():
+        data = doc.to_dict() or {}
+        status = normalize_status(data.get('status'))
+        orders['total'] += 1
+        orders['by_status'][status] = orders['by_status'].get(status, 0) + 1
+        amount = parse_amount(data.get('total'))
+        if amount is not None:
+            orders['amount_sum'] += amount
+            orders['amount_count'] += 1
+        created = data.get('date')
+        delivered_at = data.get('delivered_at')
+        if isinstance(created, datetime) and isinstance(delivered_at, datetime):
+            days = days_between(created, delivered_at)
+            orders['delivered_days_sum'] += days
+            orders['delivered_timed'] += 1
+
+    # received_units has no other source; carry the current total over
+    received = read_counters(db)[1].get('received_units') or 0
+    inventory = {'items': 0, 'stock_units': 0, 'received_units': received}
+    sharded = []
+    for doc in db.collection('inventory').stream():
+        data = doc.to_dict() or {}
+        inventory['items'] += 1
+        try:
+            inventory['stock_units'] += int(data.get('stock') or 0)
+        except Exception:
+            pass
+        if data.get('stock_shards'):
+            sharded.append((doc.id, sharded_counter.shard_count(data)))
+    inventory['stock_units'] += sum(sharded_counter.shard_sums(db, sharded).values())
+
+    orders['updated_at'] = firestore.SERVER_TIMESTAMP
+    inventory['updated_at'] = firestore.SERVER_TIMESTAMP
+    batch = db.batch()
+    batch.set(order_counters_ref(db), orders)
+    batch.set(inventory_counters_ref(db), inventory)
+    # The totals above include everything the shards held
+    for ref in (order_counters_ref(db), inventory_counters_ref(db)):
+        for shard in sharded_counter.counter_refs(ref, COUNTER_SHARDS)[1:]:
+            batch.delete(shard)
+    batch.commit()
+    return orders, inventory
+
+
+def days_between(start: datetime, end: datetime) -> float:
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    return (end - start).total_seconds() / 86400.0
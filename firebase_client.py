@@ -1,32 +1,15 @@
 """
 Simple Firebase client wrapper for Firestore with a mocked fallback when credentials are not provided.
-Set the environment variable GOOGLE_APPLICATION_CREDENTIALS to the path of your service account JSON file.
+The client comes from the shared connection manager in firebase_config.py, which reads the same
+credential settings as the app (GOOGLE_APPLICATION_CREDENTIALS, FIREBASE_CREDENTIALS*) and never
+falls back to application-default credentials.
 """
-import os
-import json
+from firebase_config import manager
 
-USE_FIREBASE = False
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore
 
-    # initialize app if credentials provided
-    cred_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
-    if cred_path and os.path.exists(cred_path):
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        db = firestore.client()
-        USE_FIREBASE = True
-    else:
-        # try application default
-        try:
-            firebase_admin.initialize_app()
-            db = firestore.client()
-            USE_FIREBASE = True
-        except Exception:
-            USE_FIREBASE = False
-except Exception:
-    USE_FIREBASE = False
+def _db():
+    # None when Firebase isn't configured; callers then use the mock data
+    return manager.client()
 
 
 # Mock data used when Firebase isn't configured
@@ -54,10 +37,10 @@ MOCK = {
 
 def get_collection(name: str):
     """Return a list/dict from Firestore collection or mock data."""
-    if USE_FIREBASE:
+    db = _db()
+    if db is not None:
         try:
-            col = db.collection(name)
-            docs = col.stream()
+            docs = manager.stream(db.collection(name))
             data = [d.to_dict() for d in docs]
             return data
         except Exception:
@@ -71,9 +54,10 @@ def add_document(collection: str, data: dict):
 
     Returns the document id (or True for mock append).
     """
-    if USE_FIREBASE:
+    db = _db()
+    if db is not None:
         try:
-            doc_ref = db.collection(collection).add(data)
+            doc_ref = manager.call(db.collection(collection).add, data, idempotent=False)
             # doc_ref is a tuple (reference, write_time) for admin SDK; return id if possible
             try:
                 return doc_ref[0].id
@@ -1,8 +1,15 @@
 import os
 import json
 import base64
+import contextvars
+import logging
+import threading
+import time
 from typing import Optional, Tuple
-from firebase_admin import credentials, firestore, initialize_app, storage, _apps
+
+import request_deadline
+
+logger = logging.getLogger(__name__)
 
 # Helper: Build a Firebase credential from multiple env-driven sources
 # Priority:
@@ -12,7 +19,9 @@ from firebase_admin import credentials, firestore, initialize_app, storage, _app
 # 4) GOOGLE_APPLICATION_CREDENTIALS (file path)
 # 5) Local files next to this module (serviceAccount*.json)
 
-def _build_credential() -> Optional[credentials.Certificate]:
+def _build_credential() -> Optional['credentials.Certificate']:
+    from firebase_admin import credentials
+
     # 1) Raw JSON string
     raw_json = os.environ.get('FIREBASE_CREDENTIALS_JSON')
     if raw_json:
@@ -74,7 +83,14 @@ def _build_credential() -> Optional[credentials.Certificate]:
 # prevent slow metadata server checks (common on local Windows dev).
 
 def initialize_firebase() -> Tuple[Optional[object], Optional[object]]:
+    if os.environ.get('FIRESTORE_BACKEND') == 'memory':
+        # In-process stand-in for local runs and load tests (see firestore_memory.py); no Storage bucket
+        import firestore_memory
+        logger.warning('FIRESTORE_BACKEND=memory: using the in-memory Firestore stand-in')
+        return firestore_memory.client_from_env(), None
     try:
+        from firebase_admin import firestore, initialize_app, storage, _apps
+
         bucket_name = (
             os.environ.get('FIREBASE_STORAGE_BUCKET')
             or os.environ.get('GOOGLE_CLOUD_STORAGE_BUCKET')
@@ -87,7 +103,7 @@ def initialize_firebase() -> Tuple[Optional[object], Optional[object]]:
             cred = _build_credential()
             if cred is None:
                 # No credentials configured; skip initialization, let the app run without DB
-                print('Firebase credentials not found. Skipping Admin SDK initialization. Set GOOGLE_APPLICATION_CREDENTIALS or FIREBASE_CREDENTIALS* env vars.')
+                logger.warning('Firebase credentials not found. Skipping Admin SDK initialization. Set GOOGLE_APPLICATION_CREDENTIALS or FIREBASE_CREDENTIALS* env vars.')
                 return None, None
             initialize_app(cred, app_options)
 
@@ -96,5 +112,291 @@ def initialize_firebase() -> Tuple[Optional[object], Optional[object]]:
         bucket = storage.bucket(bucket_name) if bucket_name else storage.bucket()
         return db, bucket
     except Exception as e:
-        print(f"Error initializing Firebase: {str(e)}")
+        logger.exception("Error initializing Firebase")
         return None, None
+
+
+class ReadStats:
+    """Firestore calls made and documents read in one context (a request, see logging_setup.py)."""
+    __slots__ = ('calls', 'documents')
+
+    def __init__(self):
+        self.calls = 0
+        self.documents = 0
+
+
+_read_stats = contextvars.ContextVar('firestore_read_stats', default=None)
+
+
+def track_reads():
+    """Start counting Firestore use in the current context; returns (ReadStats, token for untrack_reads)."""
+    stats = ReadStats()
+    return stats, _read_stats.set(stats)
+
+
+def untrack_reads(token) -> None:
+    _read_stats.reset(token)
+
+
+def _count_documents(n: int) -> None:
+    stats = _read_stats.get()
+    if stats is not None:
+        stats.documents += n
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Firestore while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Fails fast after repeated transient Firestore errors.
+
+    closed     calls go through; ``failure_threshold`` consecutive failures open it
+    open       calls raise CircuitOpenError for ``reset_timeout`` seconds
+    half_open  one trial call is let through; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return self._state
+
+    def allow(self) -> None:
+        with self._lock:
+            if self._state == 'closed':
+                return
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError('Firestore is unavailable (circuit open)')
+                self._state = 'half_open'
+            # half_open: only one trial call at a time
+            if self._trial_in_flight:
+                raise CircuitOpenError('Firestore is unavailable (circuit half-open)')
+            self._trial_in_flight = True
+
+    def release(self) -> None:
+        """End a call without a verdict on Firestore's health (e.g. the caller gave up)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Exception) -> None:
+        with self._lock:
+            self._failures += 1
+            self._last_error = f'{type(error).__name__}: {error}'
+            self._trial_in_flight = False
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    logger.error("Circuit opened after %d failures: %s", self._failures, self._last_error)
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        state = self.state
+        with self._lock:
+            info = {'state': state, 'consecutive_failures': self._failures, 'last_error': self._last_error}
+            if state != 'closed':
+                info['retry_in_seconds'] = max(round(self.reset_timeout - (time.monotonic() - self._opened_at), 1), 0)
+        return info
+
+
+def _transient_error_types():
+    from google.api_core import exceptions
+    return (
+        exceptions.ServiceUnavailable,
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError,
+        exceptions.TooManyRequests,
+        exceptions.ResourceExhausted,
+        exceptions.Unknown,
+    )
+
+
+class ConnectionManager:
+    """Owns the process-wide Firebase clients and guards every Firestore call.
+
+    Clients are created on first use (nothing touches firebase_admin or the
+    credential probing above until a request needs Firestore), and the single
+    Firestore client is shared by all threads; it pools its gRPC channel.
+    Reads go through ``stream()``, ``get()``, ``get_all()`` or ``call()``,
+    which retry transient errors with exponential backoff and feed the circuit
+    breaker. Writes should use ``call(fn, idempotent=False)`` so that a commit
+    whose outcome is unknown is never replayed. Inside ``track_reads()`` every
+    call, and every document returned by the first three, is counted.
+
+    Environment:
+        FIRESTORE_TIMEOUT_SECONDS    per-attempt RPC timeout, further capped by the
+                                     request deadline (default 10)
+        FIRESTORE_RETRY_SECONDS      total time spent retrying one call (default 15)
+        FIRESTORE_BREAKER_FAILURES   consecutive failures that open the circuit (default 5)
+        FIRESTORE_BREAKER_RESET      seconds before a trial call is allowed (default 30)
+    """
+
+    def __init__(self):
+        self.timeout = float(os.environ.get('FIRESTORE_TIMEOUT_SECONDS', '10'))
+        self.retry_budget = float(os.environ.get('FIRESTORE_RETRY_SECONDS', '15'))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.environ.get('FIRESTORE_BREAKER_FAILURES', '5')),
+            reset_timeout=float(os.environ.get('FIRESTORE_BREAKER_RESET', '30')),
+        )
+        self._clients = None
+        self._lock = threading.Lock()
+        self._retry = None
+
+    # -- clients --
+    def clients(self) -> Tuple[Optional[object], Optional[object]]:
+        """(db, bucket), initializing Firebase on first use; (None, None) without credentials."""
+        if self._clients is None:
+            with self._lock:
+                if self._clients is None:
+                    self._clients = initialize_firebase()
+        return self._clients
+
+    def client(self):
+        return self.clients()[0]
+
+    def set_clients(self, db, bucket=None) -> None:
+        """Install already-built clients (e.g. an emulator or test client) instead of initializing."""
+        with self._lock:
+            self._clients = (db, bucket)
+
+    # -- guarded calls --
+    def retry_policy(self, deadline: Optional[float] = None):
+        """api_core Retry for transient errors; ``deadline`` caps the total retry time in seconds."""
+        if self._retry is None:
+            from google.api_core import retry as api_retry
+            self._retry = api_retry.Retry(
+                predicate=api_retry.if_exception_type(*_transient_error_types()),
+                initial=0.1, maximum=2.0, multiplier=2.0, timeout=self.retry_budget,
+            )
+        if deadline is not None and deadline < self.retry_budget:
+            return self._retry.with_timeout(max(deadline, 0.0))
+        return self._retry
+
+    def attempt_timeout(self) -> float:
+        """Timeout for the next RPC: FIRESTORE_TIMEOUT_SECONDS, capped by the request deadline."""
+        deadline = request_deadline.current()
+        if deadline is None:
+            return self.timeout
+        return min(self.timeout, deadline.remaining())
+
+    def call(self, fn, *args, idempotent: bool = True, **kwargs):
+        """Run ``fn(*args, **kwargs)`` under the circuit breaker, retrying transient errors.
+
+        Inside a request the retries stop at the request deadline; a call made
+        after the budget is spent raises DeadlineExceededError without touching
+        Firestore.
+        """
+        from google.api_core.exceptions import DeadlineExceeded, RetryError
+
+        deadline = request_deadline.current()
+        remaining = deadline.check() if deadline is not None else None
+        self.breaker.allow()
+        stats = _read_stats.get()
+        if stats is not None:
+            stats.calls += 1
+        # RetryError: the retry budget ran out on transient errors
+        transient = _transient_error_types() + (RetryError,)
+        try:
+            if idempotent:
+                result = self.retry_policy(remaining)(fn)(*args, **kwargs)
+            else:
+                result = fn(*args, **kwargs)
+        except transient as e:
+            cause = getattr(e, 'cause', None) or e
+            if deadline is not None and (deadline.remaining() <= 0 or (
+                    isinstance(cause, DeadlineExceeded) and remaining < self.timeout)):
+                # Our own budget ran out (or cut the RPC timeout short); that says
+                # nothing about Firestore's health
+                self.breaker.release()
+                deadline.exceeded = True
+                raise request_deadline.DeadlineExceededError(str(e)) from e
+            self.breaker.record_failure(e)
+            raise
+        except Exception:
+            # Non-transient errors (NotFound, InvalidArgument, ...) mean Firestore answered
+            self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def read(self, fn, *args, **kwargs):
+        """call() for read helpers taking a ``timeout`` keyword; each attempt gets the time left."""
+        return self.call(lambda: fn(*args, timeout=self.attempt_timeout(), **kwargs))
+
+    def stream(self, query) -> list:
+        """All documents of ``query``; the whole read is retried, so results are materialized."""
+        docs = self.call(lambda: list(query.stream(timeout=self.attempt_timeout())))
+        _count_documents(len(docs))
+        return docs
+
+    def get(self, ref):
+        snap = self.call(lambda: ref.get(timeout=self.attempt_timeout()))
+        _count_documents(1)
+        return snap
+
+    def get_all(self, refs) -> list:
+        db = self.client()
+        docs = self.call(lambda: list(db.get_all(refs, timeout=self.attempt_timeout())))
+        _count_documents(len(docs))
+        return docs
+
+    def health(self, deep: bool = False) -> dict:
+        """State for the /healthz probe; ``deep`` also performs a one-document read."""
+        db, bucket = self._clients if self._clients is not None else (None, None)
+        info = {
+            'initialized': self._clients is not None,
+            'configured': db is not None,
+            'storage': bucket is not None,
+            'circuit': self.breaker.snapshot(),
+        }
+        if deep:
+            db = self.client()
+            info['configured'] = db is not None
+            if db is not None:
+                started = time.monotonic()
+                try:
+                    self.call(lambda: list(db.collection('stats').limit(1).stream(timeout=self.timeout)))
+                    info['read_ok'] = True
+                except Exception as e:
+                    info['read_ok'] = False
+                    info['read_error'] = f'{type(e).__name__}: {e}'
+                info['read_ms'] = round((time.monotonic() - started) * 1000, 1)
+        return info
+
+
+# The process-wide manager; everything else goes through it
+manager = ConnectionManager()
+
+
+def get_clients() -> Tuple[Optional[object], Optional[object]]:
+    return manager.clients()
+
+
+def get_db():
+    return manager.client()
+
+
+def get_bucket():
+    return manager.clients()[1]
+
+
+def set_clients(db, bucket=None) -> None:
+    manager.set_clients(db, bucket)
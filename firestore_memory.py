@@ -0,0 +1,744 @@
+"""
+In-memory Firestore stand-in for local development, load tests and benchmarks.
+
+It mimics the subset of the google-cloud-firestore client API this app uses:
+collections, documents, queries (where/order_by/limit/start_after/select),
+batches, transactions (compatible with ``firestore.transactional``), field
+transforms (SERVER_TIMESTAMP, Increment, ArrayUnion, DELETE_FIELD) and
+collection ``on_snapshot`` listeners. Enable it with FIRESTORE_BACKEND=memory.
+
+Each process gets its own store, so gunicorn workers do not see each other's
+writes. ``seed()`` fills a store with a deterministic synthetic pharmacy, the
+same in every worker (FIRESTORE_MEMORY_SEED items at start-up).
+
+Environment:
+    FIRESTORE_MEMORY_LATENCY_MS   delay added to every RPC (default 0)
+    FIRESTORE_MEMORY_SEED         inventory items to seed on start-up (default 0: empty)
+"""
+import copy
+import itertools
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Optional
+
+from google.api_core import exceptions
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.base_query import And, FieldFilter, Or
+
+_TYPE_RANK = {type(None): 0, bool: 1, int: 2, float: 2, datetime: 3, str: 4, bytes: 5, list: 6, dict: 7}
+
+
+def _sort_key(value):
+    rank = _TYPE_RANK.get(type(value), 8)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    if rank in (6, 7, 8):
+        value = repr(value)
+    return (rank, value)
+
+
+def _get_field(data, field_path):
+    cur = data
+    for part in field_path.split('.'):
+        if not isinstance(cur, dict) or part not in cur:
+            return _MISSING
+        cur = cur[part]
+    return cur
+
+
+_MISSING = object()
+
+
+def _set_field(data, field_path, value):
+    parts = field_path.split('.')
+    cur = data
+    for part in parts[:-1]:
+        nxt = cur.get(part)
+        if not isinstance(nxt, dict):
+            nxt = {}
+            cur[part] = nxt
+        cur = nxt
+    cur[parts[-1]] = value
+
+
+def _delete_field(data, field_path):
+    parts = field_path.split('.')
+    cur = data
+    for part in parts[:-1]:
+        cur = cur.get(part)
+        if not isinstance(cur, dict):
+            return
+    cur.pop(parts[-1], None)
+
+
+def _apply_value(current, value, now):
+    if value is transforms.SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value.value
+    if isinstance(value, transforms.Maximum):
+        base = current if isinstance(current, (int, float)) else value.value
+        return max(base, value.value)
+    if isinstance(value, transforms.Minimum):
+        base = current if isinstance(current, (int, float)) else value.value
+        return min(base, value.value)
+    if isinstance(value, transforms.ArrayUnion):
+        out = list(current) if isinstance(current, list) else []
+        for v in value.values:
+            if v not in out:
+                out.append(v)
+        return out
+    if isinstance(value, transforms.ArrayRemove):
+        out = list(current) if isinstance(current, list) else []
+        return [v for v in out if v not in value.values]
+    if isinstance(value, dict):
+        base = current if isinstance(current, dict) else {}
+        merged = dict(base)
+        for k, v in value.items():
+            if v is transforms.DELETE_FIELD:
+                merged.pop(k, None)
+            else:
+                merged[k] = _apply_value(base.get(k), v, now)
+        return merged
+    return copy.deepcopy(value)
+
+
+def _compare(left, op, right):
+    if op == '==':
+        return left is not _MISSING and left == right
+    if op == '!=':
+        return left is not _MISSING and left is not None and left != right
+    if op == 'in':
+        return left is not _MISSING and left in right
+    if op == 'not-in':
+        return left is not _MISSING and left is not None and left not in right
+    if op == 'array_contains':
+        return isinstance(left, list) and right in left
+    if op == 'array_contains_any':
+        return isinstance(left, list) and any(v in left for v in right)
+    if left is _MISSING or left is None:
+        return False
+    lk, rk = _sort_key(left), _sort_key(right)
+    if lk[0] != rk[0]:
+        return False
+    if op == '<':
+        return lk < rk
+    if op == '<=':
+        return lk <= rk
+    if op == '>':
+        return lk > rk
+    if op == '>=':
+        return lk >= rk
+    raise ValueError(f'Unsupported operator {op!r}')
+
+
+def _matches(data, doc_id, flt):
+    if isinstance(flt, And):
+        return all(_matches(data, doc_id, f) for f in flt.filters)
+    if isinstance(flt, Or):
+        return any(_matches(data, doc_id, f) for f in flt.filters)
+    if isinstance(flt, FieldFilter):
+        field, op, value = flt.field_path, flt.op_string, flt.value
+        if not isinstance(op, str):
+            # IS_NULL unary filter
+            op, value = '==', None
+    else:
+        field, op, value = flt
+    left = doc_id if field == '__name__' else _get_field(data, field)
+    if field == '__name__' and hasattr(value, 'id'):
+        value = value.id
+    return _compare(left, op, value)
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None, read_time=None):
+        self.reference = reference
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        if self._data is None:
+            return None
+        value = _get_field(self._data, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class _Record:
+    __slots__ = ('data', 'version', 'create_time', 'update_time')
+
+    def __init__(self, data, version, now):
+        self.data = data
+        self.version = version
+        self.create_time = now
+        self.update_time = now
+
+
+class DocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self._path = path
+
+    @property
+    def id(self):
+        return self._path.rsplit('/', 1)[-1]
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self._path.rsplit('/', 1)[0])
+
+    def collection(self, name):
+        return CollectionReference(self._client, f'{self._path}/{name}')
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other._path == self._path
+
+    def __hash__(self):
+        return hash(self._path)
+
+    def get(self, field_paths=None, transaction=None, retry=None, timeout=None):
+        self._client._rpc()
+        snap = self._client._snapshot(self._path)
+        if transaction is not None:
+            transaction._record_read(self._path)
+        if field_paths and snap.exists:
+            snap._data = {k: v for k, v in snap._data.items() if k in field_paths}
+        return snap
+
+    def create(self, document_data, retry=None, timeout=None):
+        batch = self._client.batch()
+        batch.create(self, document_data)
+        return batch.commit()[0]
+
+    def set(self, document_data, merge=False, retry=None, timeout=None):
+        batch = self._client.batch()
+        batch.set(self, document_data, merge=merge)
+        return batch.commit()[0]
+
+    def update(self, field_updates, option=None, retry=None, timeout=None):
+        batch = self._client.batch()
+        batch.update(self, field_updates)
+        return batch.commit()[0]
+
+    def delete(self, option=None, retry=None, timeout=None):
+        batch = self._client.batch()
+        batch.delete(self)
+        return batch.commit()[0]
+
+    def on_snapshot(self, callback):
+        return self._client._watch(self._path, None, callback, document=True)
+
+
+class Query:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, client, path, filters=(), orders=(), limit=None, start_after=None, projection=None,
+                 limit_to_last=False):
+        self._client = client
+        self._path = path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._projection = projection
+        self._limit_to_last = limit_to_last
+
+    def _copy(self, **changes):
+        kwargs = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                      start_after=self._start_after, projection=self._projection,
+                      limit_to_last=self._limit_to_last)
+        kwargs.update(changes)
+        return Query(self._client, self._path, **kwargs)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        flt = filter if filter is not None else (field_path, op_string, value)
+        return self._copy(filters=self._filters + (flt,))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count, limit_to_last=False)
+
+    def limit_to_last(self, count):
+        return self._copy(limit=count, limit_to_last=True)
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start_after=document_fields_or_snapshot)
+
+    def _cursor_values(self, cursor):
+        if isinstance(cursor, DocumentSnapshot):
+            data, doc_id = cursor._data or {}, cursor.id
+        elif isinstance(cursor, dict):
+            data, doc_id = cursor, cursor.get('__name__')
+        else:
+            data, doc_id = {}, None
+        values = []
+        for field, _direction in self._effective_orders():
+            values.append(doc_id if field == '__name__' else _get_field(data, field))
+        return values
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        if not any(f == '__name__' for f, _ in orders):
+            direction = orders[-1][1] if orders else self.ASCENDING
+            orders.append(('__name__', direction))
+        return orders
+
+    def _row_key(self, doc_id, data):
+        key = []
+        for field, direction in self._effective_orders():
+            value = doc_id if field == '__name__' else _get_field(data, field)
+            k = _sort_key(None if value is _MISSING else value)
+            key.append(_Desc(k) if direction == self.DESCENDING else k)
+        return key
+
+    def _run(self, transaction=None):
+        self._client._rpc()
+        rows = []
+        for path, rec in self._client._scan(self._path):
+            doc_id = path.rsplit('/', 1)[-1]
+            if not all(_matches(rec.data, doc_id, f) for f in self._filters):
+                continue
+            # Firestore drops documents missing an order_by field
+            if any(f != '__name__' and _get_field(rec.data, f) is _MISSING for f, _ in self._orders):
+                continue
+            rows.append((path, rec))
+            if transaction is not None:
+                transaction._record_read(path)
+        rows.sort(key=lambda pr: self._row_key(pr[0].rsplit('/', 1)[-1], pr[1].data))
+        if self._start_after is not None:
+            cursor_key = []
+            for (field, direction), value in zip(self._effective_orders(), self._cursor_values(self._start_after)):
+                k = _sort_key(None if value is _MISSING else value)
+                cursor_key.append(_Desc(k) if direction == self.DESCENDING else k)
+            rows = [pr for pr in rows
+                    if self._row_key(pr[0].rsplit('/', 1)[-1], pr[1].data) > cursor_key]
+        if self._limit is not None:
+            rows = rows[-self._limit:] if self._limit_to_last else rows[:self._limit]
+        now = datetime.now(timezone.utc)
+        out = []
+        for path, rec in rows:
+            data = copy.deepcopy(rec.data)
+            if self._projection is not None:
+                projected = {}
+                for field in self._projection:
+                    value = _get_field(data, field)
+                    if value is not _MISSING:
+                        _set_field(projected, field, value)
+                data = projected
+            out.append(DocumentSnapshot(DocumentReference(self._client, path), data,
+                                        rec.create_time, rec.update_time, now))
+        return out
+
+    def stream(self, transaction=None, retry=None, timeout=None):
+        for snap in self._run(transaction):
+            self._client.reads += 1
+            yield snap
+
+    def get(self, transaction=None, retry=None, timeout=None):
+        return list(self.stream(transaction=transaction))
+
+    def count(self, alias=None):
+        query = self
+
+        class _Agg:
+            def get(self, transaction=None, retry=None, timeout=None):
+                return [[SimpleNamespace(alias=alias or 'field_1', value=len(query._run(transaction)))]]
+        return _Agg()
+
+    def on_snapshot(self, callback):
+        return self._client._watch(self._path, self, callback)
+
+
+class _Desc:
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return self.key > other.key
+
+    def __gt__(self, other):
+        return self.key < other.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+
+    @property
+    def id(self):
+        return self._path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, f'{self._path}/{document_id or _auto_id()}')
+
+    def add(self, document_data, document_id=None, retry=None, timeout=None):
+        ref = self.document(document_id)
+        result = ref.create(document_data)
+        return result.update_time, ref
+
+    def list_documents(self, page_size=None):
+        return [DocumentReference(self._client, path) for path, _ in self._client._scan(self._path)]
+
+
+def _auto_id():
+    return uuid.uuid4().hex[:20]
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference._path, document_data, False))
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference._path, document_data, merge))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference._path, field_updates, False))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference._path, None, False))
+
+    def commit(self, retry=None, timeout=None):
+        writes, self._writes = self._writes, []
+        return self._client._commit(writes)
+
+
+class Transaction(WriteBatch):
+    def __init__(self, client, max_attempts=5, read_only=False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+        self._reads = {}
+
+    # Hooks used by google.cloud.firestore_v1.transaction._Transactional
+    def _clean_up(self):
+        self._writes = []
+        self._reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = uuid.uuid4().bytes
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        writes, reads = self._writes, self._reads
+        self._clean_up()
+        return self._client._commit(writes, expected_versions=reads)
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    def _record_read(self, path):
+        with self._client._lock:
+            rec = self._client._docs.get(path)
+            self._reads.setdefault(path, rec.version if rec else 0)
+
+    def get_all(self, references, retry=None, timeout=None):
+        return self._client.get_all(references, transaction=self)
+
+    def get(self, ref_or_query, retry=None, timeout=None):
+        if isinstance(ref_or_query, DocumentReference):
+            return iter([ref_or_query.get(transaction=self)])
+        return ref_or_query.stream(transaction=self)
+
+    def commit(self, retry=None, timeout=None):
+        return self._commit()
+
+
+class _Watch:
+    def __init__(self, client, key):
+        self._client = client
+        self._key = key
+
+    def unsubscribe(self):
+        with self._client._lock:
+            self._client._watches.pop(self._key, None)
+
+    close = unsubscribe
+
+
+class MemoryClient:
+    """Thread-safe in-memory stand-in for ``google.cloud.firestore.Client``.
+
+    ``latency`` adds a fixed delay per RPC; ``doc_write_interval`` enforces a
+    minimum spacing between commits touching the same document, emulating
+    Firestore's sustained per-document write limit.
+    """
+
+    def __init__(self, latency: float = 0.0, doc_write_interval: float = 0.0, project: str = 'memory'):
+        self.project = project
+        self.latency = latency
+        self.doc_write_interval = doc_write_interval
+        self.reads = 0
+        self.writes = 0
+        self.aborts = 0
+        self._docs = {}
+        self._version = itertools.count(1)
+        self._lock = threading.RLock()
+        self._last_write = {}
+        self._watches = {}
+        self._watch_ids = itertools.count(1)
+
+    # -- public API --
+    def collection(self, *path):
+        return CollectionReference(self, '/'.join(path))
+
+    def document(self, *path):
+        return DocumentReference(self, '/'.join(path))
+
+    def collections(self):
+        with self._lock:
+            names = sorted({p.split('/', 1)[0] for p in self._docs})
+        return [CollectionReference(self, n) for n in names]
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return Transaction(self, max_attempts=max_attempts, read_only=read_only)
+
+    def get_all(self, references, field_paths=None, transaction=None, retry=None, timeout=None):
+        self._rpc()
+        for ref in references:
+            if transaction is not None:
+                transaction._record_read(ref._path)
+            self.reads += 1
+            yield self._snapshot(ref._path)
+
+    def close(self):
+        pass
+
+    # -- internals --
+    def _rpc(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _snapshot(self, path):
+        with self._lock:
+            rec = self._docs.get(path)
+            data = copy.deepcopy(rec.data) if rec else None
+            ctime, utime = (rec.create_time, rec.update_time) if rec else (None, None)
+        return DocumentSnapshot(DocumentReference(self, path), data, ctime, utime, datetime.now(timezone.utc))
+
+    def _scan(self, collection_path):
+        prefix = collection_path + '/'
+        depth = collection_path.count('/') + 1
+        with self._lock:
+            return [(p, r) for p, r in self._docs.items()
+                    if p.startswith(prefix) and p.count('/') == depth]
+
+    def _throttle(self, paths):
+        if not self.doc_write_interval:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max((self._last_write.get(p, 0) + self.doc_write_interval - now for p in paths), default=0)
+                if wait <= 0:
+                    for p in paths:
+                        self._last_write[p] = now
+                    return
+            time.sleep(wait + random.uniform(0, self.doc_write_interval / 10))
+
+    def _commit(self, writes, expected_versions=None):
+        self._rpc()
+        paths = sorted({w[1] for w in writes})
+        self._throttle(paths)
+        now = datetime.now(timezone.utc)
+        changed = []
+        with self._lock:
+            for path, version in (expected_versions or {}).items():
+                rec = self._docs.get(path)
+                if (rec.version if rec else 0) != version:
+                    self.aborts += 1
+                    raise exceptions.Aborted(f'Transaction contention on {path}')
+            staged = {}
+            for kind, path, data, merge in writes:
+                rec = staged[path] if path in staged else self._docs.get(path)
+                current = rec.data if rec else None
+                if kind == 'create':
+                    if current is not None:
+                        raise exceptions.AlreadyExists(f'Document already exists: {path}')
+                    new = _apply_value({}, data, now)
+                elif kind == 'set':
+                    new = _apply_value(current if merge and current else {}, data, now)
+                elif kind == 'update':
+                    if current is None:
+                        raise exceptions.NotFound(f'No document to update: {path}')
+                    new = copy.deepcopy(current)
+                    for field, value in data.items():
+                        if value is transforms.DELETE_FIELD:
+                            _delete_field(new, field)
+                        else:
+                            old = _get_field(new, field)
+                            _set_field(new, field, _apply_value(None if old is _MISSING else old, value, now))
+                else:
+                    new = None
+                if new is None:
+                    staged[path] = None
+                else:
+                    nrec = _Record(new, next(self._version), now)
+                    if rec is not None:
+                        nrec.create_time = rec.create_time
+                    staged[path] = nrec
+            for path, rec in staged.items():
+                old = self._docs.get(path)
+                if rec is None:
+                    self._docs.pop(path, None)
+                else:
+                    self._docs[path] = rec
+                changed.append((path, old, rec))
+            self.writes += len(writes)
+            watches = list(self._watches.values())
+        self._notify(watches, changed)
+        return [SimpleNamespace(update_time=now) for _ in writes] or [SimpleNamespace(update_time=now)]
+
+    def _watch(self, path, query, callback, document=False):
+        key = next(self._watch_ids)
+        with self._lock:
+            self._watches[key] = (path, query, callback, document)
+        if document:
+            snap = self._snapshot(path)
+            callback([snap], [], datetime.now(timezone.utc))
+        else:
+            docs = (query or CollectionReference(self, path))._run()
+            changes = [SimpleNamespace(type=SimpleNamespace(name='ADDED'), document=d) for d in docs]
+            callback(docs, changes, datetime.now(timezone.utc))
+        return _Watch(self, key)
+
+    def _notify(self, watches, changed):
+        now = datetime.now(timezone.utc)
+        for path, query, callback, document in watches:
+            if document:
+                hits = [c for c in changed if c[0] == path]
+                if hits:
+                    callback([self._snapshot(path)], [], now)
+                continue
+            depth = path.count('/') + 1
+            changes = []
+            for doc_path, old, new in changed:
+                if not doc_path.startswith(path + '/') or doc_path.count('/') != depth:
+                    continue
+                ref = DocumentReference(self, doc_path)
+                if new is None:
+                    kind = 'REMOVED'
+                    snap = DocumentSnapshot(ref, None)
+                else:
+                    kind = 'ADDED' if old is None else 'MODIFIED'
+                    snap = DocumentSnapshot(ref, copy.deepcopy(new.data), new.create_time, new.update_time, now)
+                changes.append(SimpleNamespace(type=SimpleNamespace(name=kind), document=snap))
+            if changes:
+                try:
+                    callback(None, changes, now)
+                except Exception:
+                    pass
+
+
+
+# Document ids used by seed(), e.g. for load tests that reference seeded items
+ITEM_ID = 'item{:06d}'
+MEDICINE_ID = 'med{:06d}'
+SUPPLIER_ID = 'sup{:05d}'
+ORDER_ID = 'ord{:06d}'
+CATEGORIES = ('Pain Relief', 'Antibiotics', 'Vitamins', 'Supplements', 'Cardiology', 'Dermatology', 'Equipment')
+
+
+def seeded_suppliers(items):
+    """Suppliers seed() creates by default for ``items`` items."""
+    return max(items // 50, 3)
+
+
+def seed(client, items=1000, suppliers=None, orders=None, rng_seed=42):
+    """Fill ``client`` with ``items`` inventory items and medicines, suppliers and past orders."""
+    rng = random.Random(rng_seed)
+    suppliers = suppliers if suppliers is not None else seeded_suppliers(items)
+    orders = orders if orders is not None else items // 2
+    now = datetime.now(timezone.utc)
+    writes = []
+    for i in range(suppliers):
+        writes.append(('set', 'suppliers/' + SUPPLIER_ID.format(i), {
+            'name': f'Supplier {i}', 'contact_person': f'Contact {i}', 'email': f'supplier{i}@example.com',
+            'phone': f'+966500{i:06d}', 'status': 'active', 'payment_terms': 'net30',
+            'created_at': now, 'updated_at': now}, False))
+    for i in range(items):
+        price = round(rng.uniform(2, 250), 2)
+        stock = rng.choice((0, 3, 8, 15, 40, 120, 400))
+        common = {'name': f'Medicine {i}', 'code': f'MED{i:06d}', 'category': rng.choice(CATEGORIES),
+                  'stock': stock, 'price': price, 'supplier': SUPPLIER_ID.format(rng.randrange(suppliers)),
+                  'expiry': (now + timedelta(days=rng.randrange(-30, 720))).strftime('%Y-%m-%d'),
+                  'updated_at': now}
+        writes.append(('set', 'inventory/' + ITEM_ID.format(i), {**common, 'min': rng.choice((5, 10, 20, 50))}, False))
+        writes.append(('set', 'medicines/' + MEDICINE_ID.format(i), common, False))
+    statuses = ('pending', 'processing', 'shipped', 'delivered', 'delivered', 'delivered', 'cancelled')
+    for i in range(orders):
+        lines = [{'item_id': ITEM_ID.format(rng.randrange(items)), 'quantity': rng.randint(1, 30)}
+                 for _ in range(rng.randint(1, 4))]
+        writes.append(('set', 'orders/' + ORDER_ID.format(i), {
+            'supplier': SUPPLIER_ID.format(rng.randrange(suppliers)), 'items': lines, 'status': rng.choice(statuses),
+            'date': now - timedelta(days=rng.randrange(0, 365), minutes=rng.randrange(1440)),
+            'total': f'{rng.uniform(20, 5000):.2f}', 'created_by': 'seed@example.com', 'updated_at': now}, False))
+    client._commit(writes)
+    return client
+
+
+def client_from_env():
+    """A MemoryClient configured (and seeded) from FIRESTORE_MEMORY_* variables."""
+    client = MemoryClient()
+    items = int(os.environ.get('FIRESTORE_MEMORY_SEED', '0'))
+    if items:
+        seed(client, items)
+        # What the maintenance commands would build from the seeded collections
+        import alerts
+        import counters
+        import sales_series
+        counters.rebuild_counters(client)
+        alerts.compute_alerts(client)
+        sales_series.rebuild_series(client)
+    # Seeding is not part of what a request waits for
+    client.latency = float(os.environ.get('FIRESTORE_MEMORY_LATENCY_MS', '0')) / 1000.0
+    return client
@@ -0,0 +1,158 @@
+"""
+Idempotency keys for the create routes (orders, medicines).
+
+A double-clicked submit or a retry by a proxy used to create a second
+document with a new auto-ID. Now the client sends a key, either in the
+``Idempotency-Key`` header or in the ``idempotency_key`` form field that the
+forms render with ``{{ idempotency_key() }}``, and the route creates its
+document under an ID derived from that key (and the signed-in user):
+
+    attempt = idempotency.from_request(db, 'orders', owner=uid)
+    prior = attempt.prior(fs.get)               # one read; a retry stops here
+    batch.create(attempt.document('orders'), order)
+    attempt.stage(batch, {'id': ...})           # the stored answer, same batch
+    idempotency.commit(batch, attempt, fs.call) # False: a concurrent retry won
+
+Because the document is written with ``create``, a retry that gets past the
+lookup (two submits racing, or a key whose record expired) fails with
+``AlreadyExists`` instead of writing a duplicate, so the commit is safe to
+retry and counters in the same batch are never applied twice. Reusing a key
+for a different request raises ``KeyReused``.
+
+Records live in ``idempotency_keys`` with an ``expires_at`` field; configure a
+Firestore TTL policy on it so expired records are deleted. Expired records are
+ignored when read.
+
+Environment:
+    IDEMPOTENCY_TTL_HOURS   how long a key is answered from the store (default 24)
+"""
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from flask import request
+
+from lazy_imports import lazy_module
+
+firestore = lazy_module('firebase_admin.firestore')
+
+COLLECTION = 'idempotency_keys'
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 255
+
+
+class InvalidKey(ValueError):
+    """The supplied key is empty, too long or not printable ASCII."""
+
+
+class KeyReused(ValueError):
+    """The key was already used for a request with different content."""
+
+
+def ttl():
+    return timedelta(hours=float(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24')))
+
+
+def new_key():
+    """A fresh key for a form to submit (a Jinja global)."""
+    return uuid.uuid4().hex
+
+
+def init_app(app):
+    app.jinja_env.globals['idempotency_key'] = new_key
+
+
+def derived_id(scope, key, owner=None):
+    """Document ID for ``key``: the same key from the same user always maps to the same document."""
+    return hashlib.sha256(f'{scope}\n{owner or ""}\n{key}'.encode()).hexdigest()[:40]
+
+
+def _fingerprint():
+    if request.is_json:
+        body = request.get_json(silent=True)
+    else:
+        body = {k: request.form.getlist(k) for k in sorted(request.form) if k != FORM_FIELD}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _aware(value):
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class Attempt:
+    def __init__(self, db, scope, key, owner=None, fingerprint=None):
+        self.db = db
+        self.scope = scope
+        self.id = derived_id(scope, key, owner)
+        self.fingerprint = fingerprint
+        self.ref = db.collection(COLLECTION).document(self.id)
+
+    def document(self, collection):
+        """The reference to create the new document at."""
+        return self.db.collection(collection).document(self.id)
+
+    def prior(self, get):
+        """The stored result of an earlier request with this key, or None (``get`` reads a reference)."""
+        snap = get(self.ref)
+        if not snap.exists:
+            return None
+        data = snap.to_dict() or {}
+        expires_at = _aware(data.get('expires_at'))
+        if isinstance(expires_at, datetime) and expires_at <= datetime.now(timezone.utc):
+            return None
+        if self.fingerprint and data.get('fingerprint') not in (None, self.fingerprint):
+            raise KeyReused(f'{HEADER} was already used for a different {self.scope} request')
+        return data.get('result') or {}
+
+    def stage(self, writer, result):
+        """Stage the record answering later retries with ``result``, on the batch creating the document."""
+        writer.create(self.ref, {
+            'scope': self.scope,
+            'fingerprint': self.fingerprint,
+            'result': result,
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'expires_at': datetime.now(timezone.utc) + ttl(),
+        })
+
+
+def from_request(db, scope, owner=None):
+    """An Attempt for the current request's key, or None when it sent none."""
+    key = request.headers.get(HEADER)
+    if key is None and not request.is_json:
+        key = request.form.get(FORM_FIELD)
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH or not key.isascii() or not key.isprintable():
+        raise InvalidKey(f'{HEADER} must be 1 to {MAX_KEY_LENGTH} printable ASCII characters')
+    return Attempt(db, scope, key, owner=owner, fingerprint=_fingerprint())
+
+
+def commit(batch, attempt, call):
+    """Commit a batch staged for ``attempt`` (None: an unkeyed write) through ``call``.
+
+    Returns False when the keyed document already existed, i.e. a concurrent
+    or earlier request with the same key created it.
+    """
+    if attempt is None:
+        call(batch.commit, idempotent=False)
+        return True
+    try:
+        # Every keyed write is a create, so replaying the commit cannot write twice
+        call(batch.commit)
+    except Exception as e:
+        if is_duplicate(e):
+            return False
+        raise
+    return True
+
+
+def is_duplicate(error):
+    """Whether a commit failed because the keyed document already exists."""
+    from google.api_core import exceptions
+    return isinstance(error, exceptions.AlreadyExists)
@@ -0,0 +1,48 @@
+"""
+Deferred imports for heavy optional-at-startup modules.
+
+``firebase_admin`` and the google-cloud client libraries take several hundred
+milliseconds to import (gRPC, protobuf, google.auth). Modules that only need
+them inside functions bind a ``LazyModule`` at import time instead, and the
+real import happens on first attribute access:
+
+    firestore = lazy_module('firebase_admin.firestore')
+
+    def bump(ref):
+        ref.update({'n': firestore.Increment(1)})   # imported here, once
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    """Module stand-in that imports ``name`` on first attribute access."""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            with self.__dict__['_lock']:
+                module = self.__dict__['_module']
+                if module is None:
+                    module = importlib.import_module(self.__dict__['_name'])
+                    self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
@@ -0,0 +1,66 @@
+"""
+Locally signed ID tokens for load tests and offline development.
+
+``/verify-token`` normally checks Firebase ID tokens against Google's keys,
+which a load test cannot mint. When AUTH_TEST_TOKEN_SECRET is set *and* the
+app runs on the in-memory Firestore stand-in (FIRESTORE_BACKEND=memory), it
+also accepts HS256 tokens signed with that secret and issued by ``ISSUER``:
+
+    token = issue_test_token('user-17', email='user17@example.com')
+
+The claims mirror a Firebase ID token (``sub``, ``uid``, ``email``, ``name``),
+so the rest of the sign-in flow, including provisioning the user document, is
+unchanged. With a real Firestore backend test tokens are always rejected.
+
+Environment:
+    AUTH_TEST_TOKEN_SECRET   shared HS256 secret; unset disables test tokens
+"""
+import os
+import time
+
+ISSUER = 'pharmacy-local-test'
+AUDIENCE = 'pharmacy-local-test'
+ALGORITHM = 'HS256'
+
+
+class InvalidTestToken(ValueError):
+    """A token issued by ISSUER that does not verify (bad signature, expired, or test tokens disabled)."""
+
+
+def enabled() -> bool:
+    return bool(os.environ.get('AUTH_TEST_TOKEN_SECRET')) and os.environ.get('FIRESTORE_BACKEND') == 'memory'
+
+
+def issue_test_token(uid, email=None, name=None, secret=None, ttl=3600):
+    from jose import jwt
+    secret = secret or os.environ.get('AUTH_TEST_TOKEN_SECRET')
+    if not secret:
+        raise RuntimeError('AUTH_TEST_TOKEN_SECRET is not set')
+    now = int(time.time())
+    claims = {'iss': ISSUER, 'aud': AUDIENCE, 'sub': uid, 'uid': uid, 'iat': now, 'exp': now + int(ttl)}
+    if email:
+        claims['email'] = email
+    if name:
+        claims['name'] = name
+    return jwt.encode(claims, secret, algorithm=ALGORITHM)
+
+
+def verify_test_token(token):
+    """Claims of a valid test token; None for tokens from any other issuer.
+
+    Raises InvalidTestToken for a test token that does not verify, including
+    every test token while test tokens are disabled.
+    """
+    from jose import jwt, JWTError
+    try:
+        if jwt.get_unverified_claims(token).get('iss') != ISSUER:
+            return None
+    except JWTError:
+        return None
+    if not enabled():
+        raise InvalidTestToken('Test tokens are only accepted with FIRESTORE_BACKEND=memory')
+    try:
+        return jwt.decode(token, os.environ['AUTH_TEST_TOKEN_SECRET'], algorithms=[ALGORITHM],
+                          audience=AUDIENCE, issuer=ISSUER)
+    except JWTError as e:
+        raise InvalidTestToken(str(e)) from e
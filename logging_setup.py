@@ -0,0 +1,288 @@
+"""
+Structured logging for the web process.
+
+``init_app(app)`` routes the ``logging`` module through a queue: request
+threads only put records on an in-memory queue, and one listener thread
+formats them (one JSON object per line by default) and writes them to stdout.
+When the queue is full records are dropped and counted rather than blocking
+the request.
+
+Every request gets an id (the incoming ``X-Request-ID`` header or a new one,
+echoed back in the response) that is attached to each record logged while it
+runs, and ends with an access record carrying the endpoint, status, duration
+and the Firestore calls and documents read (see ``firebase_config.track_reads``).
+
+Records of a request, DEBUG included, are kept in a small buffer. A request
+slower than LOG_SLOW_REQUEST_MS is logged again as a WARNING with its full
+context: headers (minus cookies and authorization), query arguments, form
+field names, the signed-in user, and the buffered records. DEBUG records are
+otherwise only written for the LOG_DEBUG_SAMPLE_RATE share of requests. Only
+this app's own loggers (its modules and the access log) are lowered to DEBUG
+for that; the root logger, and with it Firestore, gRPC and urllib3, stays at
+LOG_LEVEL.
+
+Environment:
+    LOG_LEVEL               level written outside sampled requests (default INFO)
+    LOG_FORMAT              json or text (default json)
+    LOG_SLOW_REQUEST_MS     threshold for slow-request capture, 0 disables it (default 1000)
+    LOG_DEBUG_SAMPLE_RATE   fraction of requests whose DEBUG records are written (default 0)
+    LOG_BUFFER_RECORDS      records kept per request for the slow-request dump (default 200)
+    LOG_QUEUE_SIZE          records waiting for the writer before new ones are dropped (default 10000)
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import traceback
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import g, request, session
+
+import firebase_config
+
+access_log = logging.getLogger('access')
+
+_current = contextvars.ContextVar('request_log', default=None)
+
+# Attributes every LogRecord has; anything else was passed with ``extra=``
+_STANDARD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id', 'endpoint'}
+_HIDDEN_HEADERS = frozenset(('cookie', 'authorization', 'proxy-authorization', 'x-csrf-token'))
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class RequestLog:
+    """Logging state of one request."""
+
+    def __init__(self, request_id, endpoint, sampled, buffer_size):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.records = deque(maxlen=buffer_size) if buffer_size else None
+
+
+def current():
+    """The RequestLog of the request running in this context, if any."""
+    return _current.get()
+
+
+def _extra_fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS and not k.startswith('_')}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            out['request_id'] = record.request_id
+            out['endpoint'] = record.endpoint
+        out.update(_extra_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out['exception'] = record.exc_text
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(name)s] %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if getattr(record, 'request_id', None):
+            fields = {'request_id': record.request_id, **fields}
+        if fields:
+            line += ' ' + ' '.join(f'{k}={json.dumps(v, default=str) if isinstance(v, (dict, list)) else v}'
+                                   for k, v in fields.items())
+        return line
+
+
+class RequestQueueHandler(logging.handlers.QueueHandler):
+    """Tags records with the current request, buffers them for slow-request dumps and enqueues
+    those at or above ``threshold`` (every level for sampled requests)."""
+
+    def __init__(self, log_queue, threshold):
+        super().__init__(log_queue)
+        self.threshold = threshold
+        self.dropped = 0
+
+    def emit(self, record):
+        state = _current.get()
+        if state is not None:
+            record.request_id = state.request_id
+            record.endpoint = state.endpoint
+            if state.records is not None:
+                state.records.append(record)
+        else:
+            record.request_id = None
+        if record.levelno < self.threshold and not (state is not None and state.sampled):
+            return
+        super().emit(record)
+
+    def prepare(self, record):
+        # Render the message and traceback here, so the listener never touches request objects
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler = None
+_listener = None
+
+
+def configure():
+    """Install the queue handler on the root logger (once per process); returns it."""
+    global _handler, _listener
+    if _handler is not None:
+        return _handler
+    level = logging.getLevelName(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+    capture = slow_threshold_ms() > 0 or debug_sample_rate() > 0
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(TextFormatter() if os.environ.get('LOG_FORMAT') == 'text' else JsonFormatter())
+    log_queue = queue.Queue(maxsize=max(int(os.environ.get('LOG_QUEUE_SIZE', '10000')), 1))
+    _handler = RequestQueueHandler(log_queue, threshold=level)
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    if capture:
+        # This app's DEBUG records must reach the handler to be buffered or sampled; it filters the rest.
+        # Library loggers keep the root level so their DEBUG chatter is never even created.
+        for name in app_logger_names():
+            logging.getLogger(name).setLevel(min(level, logging.DEBUG))
+    return _handler
+
+
+def app_logger_names():
+    """Loggers of this app: one per top-level module (``getLogger(__name__)``) and the access log."""
+    return [access_log.name, *sorted(n[:-3] for n in os.listdir(ROOT) if n.endswith('.py'))]
+
+
+def slow_threshold_ms():
+    return float(os.environ.get('LOG_SLOW_REQUEST_MS', '1000'))
+
+
+def debug_sample_rate():
+    return float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '0'))
+
+
+def dropped():
+    """Records dropped because the queue was full."""
+    return _handler.dropped if _handler is not None else 0
+
+
+def _request_context(state, reads):
+    user = session.get('user') or {}
+    return {
+        'method': request.method,
+        'url': request.full_path if request.query_string else request.path,
+        'remote_addr': request.remote_addr,
+        'headers': {k: v for k, v in request.headers.items() if k.lower() not in _HIDDEN_HEADERS},
+        'args': request.args.to_dict(flat=False),
+        'form_fields': sorted(request.form.keys()),
+        'user': {'uid': user.get('uid'), 'role': user.get('role')} if user else None,
+        'session_keys': sorted(session.keys()),
+        'deadline_exceeded': bool(g.get('deadline') and g.deadline.exceeded),
+        'firestore_calls': reads.calls,
+        'firestore_reads': reads.documents,
+        'records': [{
+            'ms': round((r.created - state.started_at) * 1000.0, 1),
+            'level': r.levelname,
+            'logger': r.name,
+            'message': r.getMessage(),
+        } for r in state.records or ()],
+    }
+
+
+def init_app(app):
+    handler = configure()
+    slow_ms = slow_threshold_ms()
+    sample_rate = debug_sample_rate()
+    buffer_size = int(os.environ.get('LOG_BUFFER_RECORDS', '200')) if slow_ms > 0 else 0
+    # Flask adds its own stderr handler to app.logger when none is found; ours is on the root logger
+    from flask.logging import default_handler
+    app.logger.removeHandler(default_handler)
+
+    @app.before_request
+    def _start_request_log():
+        request_id = (request.headers.get('X-Request-ID') or '')[:64] or uuid.uuid4().hex
+        state = RequestLog(request_id, request.endpoint,
+                           sampled=bool(sample_rate) and random.random() < sample_rate,
+                           buffer_size=buffer_size)
+        g.request_log = state
+        g._request_log_token = _current.set(state)
+        g.firestore_reads, g._reads_token = firebase_config.track_reads()
+
+    @app.after_request
+    def _log_request(response):
+        state = g.get('request_log')
+        if state is None:
+            return response
+        response.headers['X-Request-ID'] = state.request_id
+        elapsed_ms = (time.perf_counter() - state.started) * 1000.0
+        reads = g.firestore_reads
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(elapsed_ms, 1),
+            'firestore_calls': reads.calls,
+            'firestore_reads': reads.documents,
+        }
+        level = logging.DEBUG if request.endpoint == 'static' else logging.INFO
+        access_log.log(level, '%s %s %s %.1f ms', request.method, request.path,
+                       response.status_code, elapsed_ms, extra=fields)
+        if slow_ms > 0 and elapsed_ms >= slow_ms and request.endpoint != 'static':
+            try:
+                context = _request_context(state, reads)
+            except Exception as e:  # never fail the response over the dump
+                context = {'error': f'{type(e).__name__}: {e}'}
+            access_log.warning('Slow request: %s %s took %.1f ms (threshold %g ms)', request.method,
+                               request.path, elapsed_ms, slow_ms, extra={**fields, 'context': context})
+        return response
+
+    @app.teardown_request
+    def _end_request_log(exc=None):
+        token = g.pop('_reads_token', None)
+        if token is not None:
+            firebase_config.untrack_reads(token)
+        token = g.pop('_request_log_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    return handler
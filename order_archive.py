@@ -0,0 +1,206 @@
+"""
+Hot/cold tiering for orders.
+
+Delivered and cancelled orders older than ARCHIVE_AFTER_DAYS are moved from
+``orders`` to ``orders_archive/{year}/orders/{id}``. Before an order leaves the
+hot collection its totals are folded into the ``stats/orders_archive`` rollup,
+so pages that summarise order history add the rollup to what they read from
+the (much smaller) live collection:
+
+    stats/orders_archive   count, amount_sum, amount_count, by_status.<status>,
+                           delivered_days_sum, delivered_timed,
+                           months.<YYYY-MM>.count / .amount
+
+Each chunk is archived in one transaction: copy, rollup, delete and checkpoint
+commit together, so an interrupted run never double counts and the next run
+resumes from ``stats/archive_checkpoint``.
+
+Environment:
+    ARCHIVE_AFTER_DAYS   minimum age of an order before it is archived (default 180)
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from lazy_imports import lazy_module
+
+from counters import COUNTERS_COLLECTION, days_between
+from order_workflow import normalize_status
+import watermarks
+
+firestore = lazy_module('firebase_admin.firestore')
+
+ARCHIVE_COLLECTION = 'orders_archive'
+ROLLUP_DOC = 'orders_archive'
+CHECKPOINT_DOC = 'archive_checkpoint'
+ARCHIVABLE_STATUSES = ('delivered', 'cancelled')
+# Two writes per order plus the rollup and checkpoint must stay under 500
+CHUNK_SIZE = 200
+
+
+def rollup_ref(db):
+    return db.collection(COUNTERS_COLLECTION).document(ROLLUP_DOC)
+
+
+def checkpoint_ref(db):
+    return db.collection(COUNTERS_COLLECTION).document(CHECKPOINT_DOC)
+
+
+def archive_ref(db, year, order_id):
+    return db.collection(ARCHIVE_COLLECTION).document(str(year)).collection('orders').document(order_id)
+
+
+def parse_amount(val):
+    """Order totals are stored as numbers or formatted strings ('1,250.00 SAR')."""
+    if isinstance(val, (int, float)):
+        return float(val)
+    if isinstance(val, str):
+        cleaned = ''.join(ch for ch in val if ch.isdigit() or ch in ['.', ',']).replace(',', '')
+        try:
+            return float(cleaned) if cleaned else None
+        except Exception:
+            return None
+    return None
+
+
+def _utc(dt):
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def month_key(dt):
+    return f'{dt.year:04d}-{dt.month:02d}'
+
+
+def _finished_at(data):
+    # Age is measured from when the order reached its final status, if recorded
+    for field in ('delivered_at', 'cancelled_at', 'updated_at', 'date'):
+        val = data.get(field)
+        if isinstance(val, datetime):
+            return _utc(val)
+    return None
+
+
+def is_archivable(data, cutoff):
+    if normalize_status(data.get('status')) not in ARCHIVABLE_STATUSES:
+        return False
+    created, finished = data.get('date'), _finished_at(data)
+    return isinstance(created, datetime) and finished is not None and finished < cutoff
+
+
+def read_rollup(db, timeout=None):
+    """The archive rollup dict; empty when nothing has been archived."""
+    snap = rollup_ref(db).get(timeout=timeout)
+    return (snap.to_dict() or {}) if snap.exists else {}
+
+
+def rollup_month(rollup, year, month):
+    """(count, amount) of archived orders dated in the given month."""
+    entry = (rollup.get('months') or {}).get(f'{year:04d}-{month:02d}') or {}
+    return int(entry.get('count') or 0), float(entry.get('amount') or 0.0)
+
+
+def _fold(delta, data):
+    status = normalize_status(data.get('status'))
+    created = _utc(data['date'])
+    amount = parse_amount(data.get('total'))
+    delta['count'] += 1
+    delta['by_status'][status] = delta['by_status'].get(status, 0) + 1
+    month = delta['months'].setdefault(month_key(created), {'count': 0, 'amount': 0.0})
+    month['count'] += 1
+    if amount is not None:
+        delta['amount_sum'] += amount
+        delta['amount_count'] += 1
+        month['amount'] += amount
+    delivered_at = data.get('delivered_at')
+    if status == 'delivered' and isinstance(delivered_at, datetime):
+        delta['delivered_days_sum'] += days_between(created, delivered_at)
+        delta['delivered_timed'] += 1
+
+
+def _rollup_update(delta):
+    inc = firestore.Increment
+    return {
+        'count': inc(delta['count']),
+        'amount_sum': inc(delta['amount_sum']),
+        'amount_count': inc(delta['amount_count']),
+        'delivered_days_sum': inc(delta['delivered_days_sum']),
+        'delivered_timed': inc(delta['delivered_timed']),
+        'by_status': {k: inc(v) for k, v in delta['by_status'].items()},
+        'months': {k: {'count': inc(v['count']), 'amount': inc(v['amount'])} for k, v in delta['months'].items()},
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    }
+
+
+def _archive_chunk(db, refs, cutoff, cursor_date):
+    """Archive the archivable orders among ``refs`` in one transaction; returns how many moved."""
+
+    @firestore.transactional
+    def _apply(transaction):
+        # Re-read inside the transaction so a concurrent run or status change is respected
+        snaps = [s for s in db.get_all(refs, transaction=transaction) if s.exists]
+        delta = {'count': 0, 'amount_sum': 0.0, 'amount_count': 0, 'delivered_days_sum': 0.0,
+                 'delivered_timed': 0, 'by_status': {}, 'months': {}}
+        for snap in snaps:
+            data = snap.to_dict() or {}
+            if not is_archivable(data, cutoff):
+                continue
+            _fold(delta, data)
+            year = _utc(data['date']).year
+            transaction.set(archive_ref(db, year, snap.id), {**data, 'archived_at': firestore.SERVER_TIMESTAMP})
+            transaction.delete(snap.reference)
+        if delta['count']:
+            transaction.set(rollup_ref(db), _rollup_update(delta), merge=True)
+            watermarks.bump(transaction, db, 'orders')
+        transaction.set(checkpoint_ref(db), {
+            'cutoff': cutoff,
+            'cursor_date': cursor_date,
+            'archived': firestore.Increment(delta['count']),
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+        return delta['count']
+
+    return _apply(db.transaction())
+
+
+def archive_orders(db, older_than_days=None, chunk_size=CHUNK_SIZE, max_chunks=None):
+    """Move old delivered/cancelled orders to the archive; returns a run summary.
+
+    A run interrupted part-way (or stopped by ``max_chunks``) leaves its cutoff
+    and cursor in the checkpoint and the next run continues from there. A run
+    that reaches the end clears the cursor so the next one starts over.
+    """
+    days = int(older_than_days if older_than_days is not None else os.environ.get('ARCHIVE_AFTER_DAYS', '180'))
+    snap = checkpoint_ref(db).get()
+    checkpoint = (snap.to_dict() or {}) if snap.exists else {}
+    cursor_date = checkpoint.get('cursor_date')
+    if isinstance(cursor_date, datetime) and isinstance(checkpoint.get('cutoff'), datetime):
+        cutoff = _utc(checkpoint['cutoff'])
+        resumed = True
+    else:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        cursor_date, resumed = None, False
+
+    # Only the date range is queried; status is checked per order so no composite index is needed
+    query = db.collection('orders').where('date', '<', cutoff).order_by('date').limit(chunk_size)
+    # Resuming by date alone can pass over orders sharing the cursor timestamp; the next full run gets them
+    last = {'date': cursor_date} if cursor_date is not None else None
+    archived = scanned = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        page = list((query.start_after(last) if last is not None else query).stream())
+        if not page:
+            break
+        last_date = _utc(page[-1].to_dict()['date'])
+        archived += _archive_chunk(db, [d.reference for d in page], cutoff, last_date)
+        scanned += len(page)
+        chunks += 1
+        if len(page) < chunk_size:
+            break
+        # The archived documents are gone, but the snapshot still works as a cursor
+        last = page[-1]
+    else:
+        return {'archived': archived, 'scanned': scanned, 'cutoff': cutoff, 'resumed': resumed, 'complete': False}
+
+    checkpoint_ref(db).set({
+        'cutoff': None,
+        'cursor_date': None,
+        'last_completed_at': firestore.SERVER_TIMESTAMP,
+    }, merge=True)
+    return {'archived': archived, 'scanned': scanned, 'cutoff': cutoff, 'resumed': resumed, 'complete': True}
@@ -0,0 +1,132 @@
+"""
+Order status workflow.
+
+Orders move pending -> processing -> shipped -> delivered (or are cancelled before
+they ship). Each transition is applied in a single Firestore transaction that
+re-reads the order, validates the move, stamps ``<status>_at`` and updates the
+aggregate counters in ``counters.py``. Delivering an order also adds the ordered
+quantities to inventory ``stock`` with ``firestore.Increment``.
+"""
+from datetime import datetime, timezone
+from lazy_imports import lazy_module
+
+import counters
+import sharded_counter
+import watermarks
+
+firestore = lazy_module('firebase_admin.firestore')
+
+ORDER_TRANSITIONS = {
+    'pending': ('processing', 'cancelled'),
+    'processing': ('shipped', 'cancelled'),
+    'shipped': ('delivered',),
+    'delivered': (),
+    'cancelled': (),
+}
+
+# Older documents carry Arabic labels or legacy names; map them onto the canonical states
+STATUS_ALIASES = {
+    'قيد الانتظار': 'pending',
+    'قيد المعالجة': 'processing',
+    'in_transit': 'shipped',
+    'تم الشحن': 'shipped',
+    'تم التسليم': 'delivered',
+    'تم التوصيل': 'delivered',
+    'ملغي': 'cancelled',
+    'canceled': 'cancelled',
+}
+
+
+class OrderTransitionError(ValueError):
+    """Raised when an order does not exist or cannot move to the requested status."""
+
+
+def normalize_status(status) -> str:
+    if not isinstance(status, str) or not status.strip():
+        return 'pending'
+    s = status.strip()
+    s = STATUS_ALIASES.get(s, s).lower()
+    return STATUS_ALIASES.get(s, s)
+
+
+def next_statuses(status):
+    """Statuses an order in ``status`` may move to next."""
+    return ORDER_TRANSITIONS.get(normalize_status(status), ())
+
+
+def order_lines(order_data):
+    """Aggregate the order's item rows into {item_id: quantity}."""
+    lines = {}
+    for row in order_data.get('items') or []:
+        row = row or {}
+        iid = row.get('item_id') or row.get('id') or row.get('code')
+        try:
+            qty = int(row.get('quantity') or 0)
+        except Exception:
+            qty = 0
+        if iid and qty > 0:
+            lines[str(iid)] = lines.get(str(iid), 0) + qty
+    return lines
+
+
+def transition_order(db, order_id, new_status, actor=None):
+    """Move an order to ``new_status`` atomically.
+
+    Returns a summary dict with the previous status and, for deliveries, the
+    quantities received and any item ids that no longer exist in inventory.
+    Raises OrderTransitionError for unknown orders or invalid transitions.
+    """
+    new_status = normalize_status(new_status)
+    if new_status not in ORDER_TRANSITIONS:
+        raise OrderTransitionError(f'Unknown order status: {new_status}')
+    order_ref = db.collection('orders').document(order_id)
+
+    @firestore.transactional
+    def _apply(transaction):
+        snap = order_ref.get(transaction=transaction)
+        if not snap.exists:
+            raise OrderTransitionError(f'Order {order_id} not found')
+        data = snap.to_dict() or {}
+        current = normalize_status(data.get('status'))
+        if new_status not in ORDER_TRANSITIONS.get(current, ()):
+            raise OrderTransitionError(f'Cannot move order from {current} to {new_status}')
+
+        # All reads must happen before the first write in a transaction
+        received, missing, items = {}, [], {}
+        if new_status == 'delivered':
+            lines = order_lines(data)
+            refs = [db.collection('inventory').document(iid) for iid in lines]
+            for item in db.get_all(refs, transaction=transaction):
+                if item.exists:
+                    received[item.id] = lines[item.id]
+                    items[item.id] = item.to_dict() or {}
+            missing = [iid for iid in lines if iid not in received]
+
+        now = datetime.now(timezone.utc)
+        update = {
+            'status': new_status,
+            f'{new_status}_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP,
+            'status_history': firestore.ArrayUnion([{'from': current, 'to': new_status, 'at': now, 'by': actor}]),
+        }
+        transaction.update(order_ref, update)
+
+        delivery_days = None
+        if new_status == 'delivered':
+            for iid, qty in received.items():
+                sharded_counter.increment(transaction, db, iid, items[iid], qty)
+            if received:
+                counters.stock_received(transaction, db, sum(received.values()))
+                watermarks.bump(transaction, db, 'inventory')
+            created = data.get('date')
+            if isinstance(created, datetime):
+                delivery_days = counters.days_between(created, now)
+        if new_status == 'cancelled' and data.get('sales'):
+            # Take the order back out of the daily sales series (imported here: sales_series imports this module)
+            import sales_series
+            sales_series.record(transaction, db, data['sales'], sign=-1)
+        counters.order_status_changed(transaction, db, current, new_status, delivery_days)
+        watermarks.bump(transaction, db, 'orders')
+        return {'order_id': order_id, 'from': current, 'to': new_status, 'received': received, 'missing': missing}
+
+    return _apply(db.transaction())
@@ -0,0 +1,387 @@
+"""
+Unicode text for the streaming PDF writer (report_export.py).
+
+The standard Helvetica font a PDF can use without embedding covers Latin-1
+only. Cells with any other text (Arabic medicine names, for instance) are set
+in an embedded TrueType font instead: a Type0 font with Identity-H encoding
+over a CIDFontType2, so strings are written as the font's own glyph ids, plus
+a ToUnicode map so the text can still be searched and copied. ``subset()``
+keeps only the glyphs a report used in the embedded copy; the others are
+emptied and every glyph keeps its id.
+
+PDF viewers do no shaping, so Arabic is shaped here. ``shape_arabic()``
+replaces letters with their contextual presentation forms (isolated, final,
+initial, medial, and the lam-alef ligatures), and ``visual_order()`` puts a
+line in display order: right-to-left runs reversed, Latin words and numbers
+kept left to right (a simplified form of the Unicode bidi algorithm, enough
+for single-line table cells). Characters the font lacks print as its
+missing-glyph box.
+
+The default font is fonts/DejaVuSans.ttf (Latin, Greek, Cyrillic, Arabic).
+
+Environment:
+    REPORT_PDF_FONT   TrueType (.ttf) font for text outside Latin-1 (default fonts/DejaVuSans.ttf)
+"""
+import hashlib
+import os
+import struct
+import threading
+import unicodedata
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FONT = os.path.join(ROOT, 'fonts', 'DejaVuSans.ttf')
+# Tables a PDF viewer needs from an embedded TrueType font
+EMBEDDED_TABLES = (b'cvt ', b'fpgm', b'glyf', b'head', b'hhea', b'hmtx', b'loca', b'maxp', b'prep')
+
+_ARG_1_AND_2_ARE_WORDS = 0x0001
+_WE_HAVE_A_SCALE = 0x0008
+_MORE_COMPONENTS = 0x0020
+_WE_HAVE_AN_X_AND_Y_SCALE = 0x0040
+_WE_HAVE_A_TWO_BY_TWO = 0x0080
+
+
+class TrueTypeFont:
+    """The parts of a .ttf file the PDF writer needs: character map, advance widths, metrics."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.name = ''.join(ch for ch in os.path.splitext(os.path.basename(path))[0] if ch.isalnum() or ch == '-')
+        num_tables = struct.unpack_from('>H', self.data, 4)[0]
+        self.tables = {}
+        for i in range(num_tables):
+            tag, _checksum, offset, length = struct.unpack_from('>4sIII', self.data, 12 + 16 * i)
+            self.tables[tag] = (offset, length)
+        head = self.tables[b'head'][0]
+        self.units_per_em = struct.unpack_from('>H', self.data, head + 18)[0]
+        self.bbox = struct.unpack_from('>4h', self.data, head + 36)
+        self.long_loca = struct.unpack_from('>h', self.data, head + 50)[0] == 1
+        self.num_glyphs = struct.unpack_from('>H', self.data, self.tables[b'maxp'][0] + 4)[0]
+        hhea = self.tables[b'hhea'][0]
+        self.ascent, self.descent = struct.unpack_from('>hh', self.data, hhea + 4)
+        num_metrics = struct.unpack_from('>H', self.data, hhea + 34)[0]
+        hmtx = self.tables[b'hmtx'][0]
+        advances = [struct.unpack_from('>H', self.data, hmtx + 4 * i)[0] for i in range(num_metrics)]
+        # Glyphs past the last metric share its advance
+        self.advances = advances + [advances[-1]] * (self.num_glyphs - num_metrics)
+        self.cap_height = self.ascent
+        if b'OS/2' in self.tables:
+            os2 = self.tables[b'OS/2'][0]
+            if struct.unpack_from('>H', self.data, os2)[0] >= 2:
+                self.cap_height = struct.unpack_from('>h', self.data, os2 + 88)[0]
+        self.cmap = self._read_cmap()
+
+    def _read_cmap(self):
+        base = self.tables[b'cmap'][0]
+        count = struct.unpack_from('>H', self.data, base + 2)[0]
+        subtables = {}
+        for i in range(count):
+            platform, encoding, offset = struct.unpack_from('>HHI', self.data, base + 4 + 8 * i)
+            subtables[(platform, encoding)] = base + offset
+        # Full Unicode (format 12) when present, else the BMP table (format 4)
+        for key in ((3, 10), (0, 4), (3, 1), (0, 3)):
+            offset = subtables.get(key)
+            if offset is None:
+                continue
+            fmt = struct.unpack_from('>H', self.data, offset)[0]
+            if fmt == 12:
+                return self._cmap_format_12(offset)
+            if fmt == 4:
+                return self._cmap_format_4(offset)
+        raise ValueError('font has no Unicode character map')
+
+    def _cmap_format_4(self, offset):
+        segments = struct.unpack_from('>H', self.data, offset + 6)[0] // 2
+        ends = offset + 14
+        starts = ends + 2 * segments + 2
+        deltas = starts + 2 * segments
+        range_offsets = deltas + 2 * segments
+        cmap = {}
+        for i in range(segments):
+            end = struct.unpack_from('>H', self.data, ends + 2 * i)[0]
+            start = struct.unpack_from('>H', self.data, starts + 2 * i)[0]
+            delta = struct.unpack_from('>h', self.data, deltas + 2 * i)[0]
+            range_offset = struct.unpack_from('>H', self.data, range_offsets + 2 * i)[0]
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset == 0:
+                    glyph = (code + delta) & 0xFFFF
+                else:
+                    at = range_offsets + 2 * i + range_offset + 2 * (code - start)
+                    glyph = struct.unpack_from('>H', self.data, at)[0]
+                    if glyph:
+                        glyph = (glyph + delta) & 0xFFFF
+                if glyph:
+                    cmap[code] = glyph
+        return cmap
+
+    def _cmap_format_12(self, offset):
+        groups = struct.unpack_from('>I', self.data, offset + 12)[0]
+        cmap = {}
+        for i in range(groups):
+            start, end, glyph = struct.unpack_from('>III', self.data, offset + 16 + 12 * i)
+            for code in range(start, end + 1):
+                cmap[code] = glyph + code - start
+        return cmap
+
+    def glyph(self, char):
+        """Glyph id of ``char`` (0, the missing-glyph box, when the font lacks it)."""
+        return self.cmap.get(ord(char), 0)
+
+    def width(self, glyph):
+        """Advance width of ``glyph`` in PDF text units (1/1000 of the font size)."""
+        return self.advances[glyph] * 1000 // self.units_per_em
+
+    def scaled(self, value):
+        return value * 1000 // self.units_per_em
+
+    def _loca(self):
+        offset = self.tables[b'loca'][0]
+        if self.long_loca:
+            return struct.unpack_from(f'>{self.num_glyphs + 1}I', self.data, offset)
+        return [2 * v for v in struct.unpack_from(f'>{self.num_glyphs + 1}H', self.data, offset)]
+
+    def _components(self, glyph_data):
+        """Glyph ids a composite glyph is built from."""
+        if len(glyph_data) < 10 or struct.unpack_from('>h', glyph_data, 0)[0] >= 0:
+            return []
+        components, at = [], 10
+        while True:
+            flags, component = struct.unpack_from('>HH', glyph_data, at)
+            components.append(component)
+            at += 4 + (4 if flags & _ARG_1_AND_2_ARE_WORDS else 2)
+            if flags & _WE_HAVE_A_SCALE:
+                at += 2
+            elif flags & _WE_HAVE_AN_X_AND_Y_SCALE:
+                at += 4
+            elif flags & _WE_HAVE_A_TWO_BY_TWO:
+                at += 8
+            if not flags & _MORE_COMPONENTS:
+                return components
+
+    def subset(self, glyphs):
+        """The font file with only ``glyphs`` (and the glyphs they are built from) drawn; ids are unchanged."""
+        loca = self._loca()
+        glyf = self.tables[b'glyf'][0]
+        keep, pending = set(), {0} | set(glyphs)
+        while pending:
+            glyph = pending.pop()
+            if glyph in keep or glyph >= self.num_glyphs:
+                continue
+            keep.add(glyph)
+            pending.update(self._components(self.data[glyf + loca[glyph]:glyf + loca[glyph + 1]]))
+        new_glyf, new_loca = bytearray(), []
+        for glyph in range(self.num_glyphs):
+            new_loca.append(len(new_glyf))
+            if glyph in keep:
+                new_glyf += self.data[glyf + loca[glyph]:glyf + loca[glyph + 1]]
+                new_glyf += b'\0' * (-len(new_glyf) % 4)
+        new_loca.append(len(new_glyf))
+
+        tables = {}
+        for tag in EMBEDDED_TABLES:
+            if tag in self.tables:
+                offset, length = self.tables[tag]
+                tables[tag] = self.data[offset:offset + length]
+        head = bytearray(tables[b'head'])
+        struct.pack_into('>I', head, 8, 0)    # checkSumAdjustment; viewers do not check it
+        struct.pack_into('>h', head, 50, 1)   # indexToLocFormat: long offsets
+        tables[b'head'] = bytes(head)
+        tables[b'glyf'] = bytes(new_glyf)
+        tables[b'loca'] = struct.pack(f'>{len(new_loca)}I', *new_loca)
+        return _sfnt(tables)
+
+
+def _checksum(data):
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def _sfnt(tables):
+    """A TrueType file holding ``tables`` ({tag: bytes})."""
+    count = len(tables)
+    entry_selector = count.bit_length() - 1
+    search_range = 16 * (1 << entry_selector)
+    header = struct.pack('>IHHHH', 0x00010000, count, search_range, entry_selector, count * 16 - search_range)
+    directory, body = [], bytearray()
+    offset = 12 + 16 * count
+    for tag in sorted(tables):
+        data = tables[tag]
+        directory.append(struct.pack('>4sIII', tag, _checksum(data), offset + len(body), len(data)))
+        body += data + b'\0' * (-len(data) % 4)
+    return header + b''.join(directory) + bytes(body)
+
+
+def subset_tag(glyphs):
+    """Six capital letters naming a font subset, as PDF requires (``ABCDEF+Font``)."""
+    digest = hashlib.sha1(','.join(map(str, sorted(glyphs))).encode('ascii')).digest()
+    return ''.join(chr(ord('A') + b % 26) for b in digest[:6])
+
+
+# -- Arabic shaping --
+# Letter -> number of presentation forms (1 non-joining, 2 joins on the right only, 4 joins both ways);
+# their forms are consecutive in Arabic Presentation Forms-B from U+FE80, in letter order
+_FORM_COUNTS = (
+    (0x0621, 1), (0x0622, 2), (0x0623, 2), (0x0624, 2), (0x0625, 2), (0x0626, 4), (0x0627, 2), (0x0628, 4),
+    (0x0629, 2), (0x062A, 4), (0x062B, 4), (0x062C, 4), (0x062D, 4), (0x062E, 4), (0x062F, 2), (0x0630, 2),
+    (0x0631, 2), (0x0632, 2), (0x0633, 4), (0x0634, 4), (0x0635, 4), (0x0636, 4), (0x0637, 4), (0x0638, 4),
+    (0x0639, 4), (0x063A, 4), (0x0641, 4), (0x0642, 4), (0x0643, 4), (0x0644, 4), (0x0645, 4), (0x0646, 4),
+    (0x0647, 4), (0x0648, 2), (0x0649, 2), (0x064A, 4),
+)
+_FORMS = {}
+_next_form = 0xFE80
+for _letter, _count in _FORM_COUNTS:
+    _FORMS[_letter] = (_next_form, _count)
+    _next_form += _count
+del _letter, _count, _next_form
+_TATWEEL = 0x0640
+# Lam followed by one of these alefs becomes a ligature (isolated form; +1 for final)
+_LAM = 0x0644
+_LAM_ALEF = {0x0622: 0xFEF5, 0x0623: 0xFEF7, 0x0625: 0xFEF9, 0x0627: 0xFEFB}
+_ISOLATED, _FINAL, _INITIAL, _MEDIAL = range(4)
+
+
+def _transparent(code):
+    # Harakat and other combining marks do not break joining
+    return unicodedata.category(chr(code)) == 'Mn'
+
+
+def _joins_forward(code):
+    return code == _TATWEEL or _FORMS.get(code, (0, 0))[1] == 4
+
+
+def _joins_back(code):
+    return code == _TATWEEL or _FORMS.get(code, (0, 0))[1] >= 2
+
+
+def shape_arabic(text):
+    """``text`` (logical order) with Arabic letters in their contextual presentation forms."""
+    codes = [ord(ch) for ch in text]
+    if not any(code in _FORMS for code in codes):
+        return text
+    out = []
+    prev = None  # previous non-transparent letter
+    i = 0
+    while i < len(codes):
+        code = codes[i]
+        if _transparent(code):
+            out.append(chr(code))
+            i += 1
+            continue
+        joined_back = prev is not None and _joins_forward(prev) and _joins_back(code)
+        following = next((c for c in codes[i + 1:] if not _transparent(c)), None)
+        if code == _LAM and i + 1 < len(codes) and codes[i + 1] in _LAM_ALEF:
+            out.append(chr(_LAM_ALEF[codes[i + 1]] + (1 if joined_back else 0)))
+            # The ligature ends in an alef, which never joins forward
+            prev = codes[i + 1]
+            i += 2
+            continue
+        if code in _FORMS:
+            first, count = _FORMS[code]
+            joins_next = following is not None and _joins_forward(code) and _joins_back(following)
+            if count == 1:
+                form = _ISOLATED
+            elif joined_back and joins_next:
+                form = _MEDIAL
+            elif joined_back:
+                form = _FINAL
+            elif joins_next:
+                form = _INITIAL
+            else:
+                form = _ISOLATED
+            out.append(chr(first + form))
+        else:
+            out.append(chr(code))
+        prev = code
+        i += 1
+    return ''.join(out)
+
+
+# -- Bidi --
+_MIRRORED = str.maketrans('()[]{}<>', ')(][}{><')
+
+
+def _direction(char):
+    kind = unicodedata.bidirectional(char)
+    if kind in ('R', 'AL'):
+        return 'R'
+    if kind == 'L':
+        return 'L'
+    if kind in ('EN', 'AN'):
+        return 'N'
+    if kind == 'NSM':
+        return 'M'
+    return ''
+
+
+def is_rtl(text):
+    """Whether the first strongly directional character of ``text`` is right to left."""
+    for char in text:
+        direction = _direction(char)
+        if direction in ('R', 'L'):
+            return direction == 'R'
+    return False
+
+
+def visual_order(text):
+    """``text`` (one line, logical order) in left-to-right display order."""
+    kinds = [_direction(ch) for ch in text]
+    if 'R' not in kinds:
+        return text
+    base = 'R' if is_rtl(text) else 'L'
+    # Numbers take the direction of the text before them; marks that of their letter
+    resolved, last_strong, previous = [], base, base
+    for kind in kinds:
+        if kind == 'N':
+            kind = 'L' if last_strong == 'L' else 'N'
+        elif kind == 'M':
+            kind = previous
+        elif kind in ('R', 'L'):
+            last_strong = kind
+        resolved.append(kind)
+        previous = kind
+    # Neutrals between two runs of the same direction take it (numbers count as
+    # right to left here), otherwise the line's
+    sides = ['R' if kind == 'N' else kind for kind in resolved]
+    for i, kind in enumerate(resolved):
+        if kind:
+            continue
+        before = next((sides[j] for j in range(i - 1, -1, -1) if sides[j]), base)
+        after = next((sides[j] for j in range(i + 1, len(sides)) if sides[j]), base)
+        resolved[i] = before if before == after else base
+    # Embedding levels: odd reads right to left; numbers and Latin inside Arabic sit one above
+    if base == 'L':
+        levels = [{'L': 0, 'R': 1, 'N': 2}[kind] for kind in resolved]
+    else:
+        levels = [{'L': 2, 'R': 1, 'N': 2}[kind] for kind in resolved]
+    chars = list(text)
+    for i, level in enumerate(levels):
+        if level % 2:
+            chars[i] = chars[i].translate(_MIRRORED)
+    # Reverse every run at or above each level, from the highest down to 1
+    for level in range(max(levels), 0, -1):
+        i = 0
+        while i < len(chars):
+            if levels[i] >= level:
+                j = i
+                while j < len(chars) and levels[j] >= level:
+                    j += 1
+                chars[i:j] = chars[i:j][::-1]
+                levels[i:j] = levels[i:j][::-1]
+                i = j
+            else:
+                i += 1
+    return ''.join(chars)
+
+
+_font = None
+_font_lock = threading.Lock()
+
+
+def unicode_font():
+    """The TrueType font for text outside Latin-1 (REPORT_PDF_FONT), loaded once."""
+    global _font
+    if _font is None:
+        with _font_lock:
+            if _font is None:
+                _font = TrueTypeFont(os.environ.get('REPORT_PDF_FONT') or DEFAULT_FONT)
+    return _font
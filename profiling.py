@@ -0,0 +1,207 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled when an admin sends ``X-Profile: 1`` (or adds
+``?_profile=1``), or when it falls in the sampled fraction PROFILE_SAMPLE_RATE
+of all traffic. The profiler runs from ``before_request`` to teardown, so it
+covers the view and template rendering, and writes its dump to PROFILE_DIR:
+
+    cprofile   ``<stamp>-<endpoint>-<ms>ms-<id>.prof`` (pstats; open with snakeviz or
+               ``python -m pstats``) plus a ``.txt`` call tree sorted by cumulative time
+    sample     ``<stamp>-<endpoint>-<ms>ms-<id>.folded``: stacks of the request thread
+               sampled every PROFILE_SAMPLE_INTERVAL_MS, in the collapsed format
+               flamegraph.pl and speedscope read
+
+``X-Profile: sample`` picks the sampling profiler for one request. Only the
+newest PROFILE_KEEP dumps are kept. Admins list them at ``/admin/profiles``.
+
+Environment:
+    PROFILE_DIR                  dump directory (default profiles)
+    PROFILE_MODE                 cprofile or sample (default cprofile)
+    PROFILE_SAMPLE_RATE          fraction of requests profiled automatically (default 0)
+    PROFILE_SAMPLE_INTERVAL_MS   sampling profiler interval (default 5)
+    PROFILE_KEEP                 dumps kept before the oldest are deleted (default 50)
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import g, request, session
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cprofile', 'sample')
+_SUFFIXES = ('.prof', '.txt', '.folded')
+# cProfile cannot run in two threads at once on every Python version; extra requests are not profiled
+_cprofile_lock = threading.Lock()
+
+
+def profile_dir():
+    return os.environ.get('PROFILE_DIR', 'profiles')
+
+
+class SamplingProfiler:
+    """Samples one thread's stack at a fixed interval and counts the collapsed stacks."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+            self.samples += 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def _requested_mode():
+    flag = request.headers.get('X-Profile') or request.args.get('_profile')
+    if not flag or flag in ('0', 'false', 'no'):
+        return None
+    if (session.get('user') or {}).get('role') != 'admin':
+        return None
+    return flag if flag in MODES else ''
+
+
+def _rotate(directory, keep):
+    dumps = {}
+    for name in os.listdir(directory):
+        stem, ext = os.path.splitext(name)
+        if ext in _SUFFIXES:
+            dumps.setdefault(stem, []).append(name)
+    for stem in sorted(dumps)[:-keep]:
+        for name in dumps[stem]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def list_profiles():
+    """Newest first: [{'name', 'files', 'size', 'created'}] for each dump in PROFILE_DIR."""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    dumps = {}
+    for name in os.listdir(directory):
+        stem, ext = os.path.splitext(name)
+        if ext in _SUFFIXES:
+            path = os.path.join(directory, name)
+            entry = dumps.setdefault(stem, {'name': stem, 'files': [], 'size': 0,
+                                            'created': datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)})
+            entry['files'].append(name)
+            entry['size'] += os.path.getsize(path)
+    return [dumps[stem] for stem in sorted(dumps, reverse=True)]
+
+
+def profile_path(filename):
+    """Absolute path of a dump file, or None for names outside PROFILE_DIR or unknown suffixes."""
+    if os.path.basename(filename) != filename or os.path.splitext(filename)[1] not in _SUFFIXES:
+        return None
+    path = os.path.abspath(os.path.join(profile_dir(), filename))
+    return path if os.path.isfile(path) else None
+
+
+def init_app(app):
+    default_mode = os.environ.get('PROFILE_MODE', 'cprofile')
+    sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+    interval = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5')) / 1000.0
+    keep = max(int(os.environ.get('PROFILE_KEEP', '50')), 1)
+
+    @app.before_request
+    def _start_profile():
+        g.profiler = None
+        mode = _requested_mode()
+        if mode is None and sample_rate and random.random() < sample_rate:
+            mode = ''
+        if mode is None:
+            return
+        mode = mode or default_mode
+        g.profile_started = time.perf_counter()
+        if mode == 'sample':
+            g.profiler = SamplingProfiler(threading.get_ident(), interval)
+            g.profiler.start()
+        elif _cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler is active in this interpreter
+                _cprofile_lock.release()
+                return
+            g.profiler = profiler
+        g.profile_id = uuid.uuid4().hex[:8]
+
+    @app.after_request
+    def _tag_response(response):
+        if g.get('profiler') is not None:
+            response.headers['X-Profile-Id'] = g.profile_id
+        return response
+
+    @app.teardown_request
+    def _finish_profile(exc=None):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        if isinstance(profiler, SamplingProfiler):
+            profiler.stop()
+        else:
+            profiler.disable()
+            _cprofile_lock.release()
+        elapsed_ms = (time.perf_counter() - g.profile_started) * 1000.0
+        try:
+            _write(profiler, elapsed_ms)
+        except Exception as e:
+            logger.exception("Could not write profile for %s", request.endpoint)
+
+    def _write(profiler, elapsed_ms):
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        endpoint = re.sub(r'[^A-Za-z0-9_]', '_', request.endpoint or 'unknown')
+        stem = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{endpoint}-{elapsed_ms:.0f}ms-{g.profile_id}"
+        base = os.path.join(directory, stem)
+        if isinstance(profiler, SamplingProfiler):
+            profiler.dump(base + '.folded')
+        else:
+            profiler.dump_stats(base + '.prof')
+            out = io.StringIO()
+            out.write(f'{request.method} {request.full_path} {elapsed_ms:.1f} ms\n\n')
+            stats = pstats.Stats(profiler, stream=out).strip_dirs().sort_stats('cumulative')
+            stats.print_stats(60)
+            stats.print_callees(25)
+            with open(base + '.txt', 'w') as f:
+                f.write(out.getvalue())
+        _rotate(directory, keep)
+        logger.info("%s took %.1f ms; profile saved as %s", request.endpoint, elapsed_ms, stem)
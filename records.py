@@ -0,0 +1,123 @@
+"""
+Compact record types for catalog data held in memory.
+
+A Firestore document turned into ``{'id': doc.id, **doc.to_dict()}`` costs a
+full dict per row (several hundred bytes before the values). The collection
+mirror, the stats cache and the list routes keep whole collections around, so
+rows are stored as ``__slots__`` records instead: known fields live in slots,
+anything else in a small ``extra`` dict that is only created when needed.
+
+Records behave like the dicts they replace where the code and templates rely
+on it: ``rec.get('stock', 0)``, ``rec['name']``, ``'min' in rec`` and Jinja's
+``rec.name`` all work, and a field missing from the document is missing from
+the record (``get()`` returns the default), not ``None``.
+
+    make('inventory', snap.id, snap.to_dict())   # InventoryItem
+    make('reports', snap.id, snap.to_dict())     # no record type: plain dict
+"""
+
+
+class Record:
+    __slots__ = ('id', 'extra')
+
+    def __init__(self, id, data=None):
+        self.id = id
+        self.extra = None
+        for key, value in (data or {}).items():
+            self[key] = value
+
+    @classmethod
+    def fields(cls):
+        names = []
+        for klass in reversed(cls.__mro__):
+            names.extend(n for n in getattr(klass, '__slots__', ()) if n != 'extra')
+        return names
+
+    def __setitem__(self, key, value):
+        if key != 'extra' and key in self._slot_names:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __getitem__(self, key):
+        if key != 'extra' and key in self._slot_names:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def keys(self):
+        return [k for k in self._slot_names if hasattr(self, k)] + list(self.extra or ())
+
+    # Not items(): a subclass slot named like a method would shadow it (orders have an ``items`` field)
+    def _pairs(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def to_dict(self):
+        return dict(self._pairs())
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.to_dict()!r})'
+
+
+class Medicine(Record):
+    __slots__ = ('name', 'code', 'category', 'stock', 'price', 'expiry', 'supplier', 'updated_at')
+
+
+class InventoryItem(Record):
+    __slots__ = ('name', 'code', 'category', 'stock', 'min', 'price', 'active', 'expiry', 'supplier',
+                 'updated_at')
+
+
+class Supplier(Record):
+    __slots__ = ('name', 'contact_person', 'email', 'phone', 'address', 'status', 'payment_terms',
+                 'created_at', 'updated_at')
+
+
+class Order(Record):
+    __slots__ = ('supplier', 'status', 'total', 'date', 'items', 'created_by', 'delivered_at', 'sales',
+                 'updated_at')
+
+
+RECORD_TYPES = {
+    'medicines': Medicine,
+    'inventory': InventoryItem,
+    'suppliers': Supplier,
+    'orders': Order,
+}
+
+# Methods and attributes of Record that a slot of the same name would hide
+_RECORD_API = frozenset(n for n in vars(Record) if not n.startswith('__')) - set(Record.__slots__)
+
+# Field lookups go through a frozenset per class instead of walking __mro__ each time
+for _cls in (Record, *RECORD_TYPES.values()):
+    _clash = _RECORD_API.intersection(_cls.__slots__) if _cls is not Record else ()
+    if _clash:
+        raise TypeError(f"{_cls.__name__} slots {sorted(_clash)} would hide Record methods; keep them in extra")
+    _cls._slot_names = frozenset(_cls.fields())
+
+
+def make(collection, doc_id, data):
+    """A record for ``collection``'s document, or a plain dict for collections without a record type."""
+    cls = RECORD_TYPES.get(collection)
+    if cls is None:
+        return {'id': doc_id, **(data or {})}
+    return cls(doc_id, data)
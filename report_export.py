@@ -0,0 +1,393 @@
+"""
+Streaming export engine for reports.
+
+Rows are read from Firestore one page at a time (cursor pagination on the
+document id) and written straight to a temporary file as CSV, XLSX or PDF, so
+memory stays bounded by the page size even for reports covering the whole
+catalog. The finished file is handed to ``report_storage``.
+
+XLSX output uses openpyxl's write-only mode. PDF output is produced by a small
+built-in writer that flushes every page as soon as it is full. Latin-1 text is
+set in the standard Helvetica font; any other text (Arabic names, for
+instance) in an embedded Unicode TrueType font, shaped and ordered for display
+by ``pdf_fonts``. Only the glyphs the report used are embedded.
+
+Environment:
+    REPORT_PAGE_SIZE  Medicine documents read per Firestore page (default 500)
+    REPORT_PDF_FONT   TrueType font for PDF text outside Latin-1 (see pdf_fonts)
+"""
+import csv
+import os
+import tempfile
+import unicodedata
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import pdf_fonts
+import report_storage
+
+PAGE_SIZE = int(os.environ.get('REPORT_PAGE_SIZE', '500'))
+EXPIRY_HORIZON_DAYS = 90
+# Characters Excel (and openpyxl) reject in worksheet titles
+SHEET_TITLE_FORBIDDEN = str.maketrans({c: '-' for c in '/\\?*[]:'})
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'pdf': ('application/pdf', 'pdf'),
+}
+
+
+def report_columns(data):
+    """[(field, header)] for a report document's options."""
+    cols = [('name', 'Name'), ('category', 'Category'), ('expiry', 'Expiry')]
+    if data.get('include_stock', True):
+        cols.append(('stock', 'Stock'))
+    if data.get('include_pricing', False):
+        cols += [('price', 'Price'), ('value', 'Value')]
+    return cols
+
+
+def _to_number(val):
+    if isinstance(val, (int, float)):
+        return float(val)
+    if isinstance(val, str):
+        cleaned = ''.join(ch for ch in val if ch.isdigit() or ch in ['.', ',']).replace(',', '')
+        try:
+            return float(cleaned) if cleaned else None
+        except Exception:
+            return None
+    return None
+
+
+def _expiry_date(med):
+    expiry = med.get('expiry') or med.get('expiration')
+    if isinstance(expiry, datetime):
+        return expiry.date()
+    if isinstance(expiry, str):
+        try:
+            return datetime.strptime(expiry[:10], '%Y-%m-%d').date()
+        except Exception:
+            return None
+    return None
+
+
+def _row(med, columns):
+    stock = med.get('stock', 0)
+    price = _to_number(med.get('price'))
+    expiry = _expiry_date(med)
+    values = {
+        'name': med.get('name', 'Unnamed Medicine'),
+        'category': med.get('category', 'Uncategorized'),
+        'expiry': expiry.isoformat() if expiry else '',
+        'stock': stock,
+        'price': price if price is not None else '',
+        'value': round(price * float(stock or 0), 2) if price is not None and isinstance(stock, (int, float)) else '',
+    }
+    return [values[field] for field, _ in columns]
+
+
+def iter_medicine_pages(db, data, page_size=PAGE_SIZE):
+    """Yield lists of (id, dict) medicine documents, one Firestore page at a time."""
+    selected = data.get('selected_medicines') or []
+    if selected:
+        for start in range(0, len(selected), page_size):
+            refs = [db.collection('medicines').document(mid) for mid in selected[start:start + page_size]]
+            yield [(s.id, s.to_dict() or {}) for s in db.get_all(refs) if s.exists]
+        return
+
+    query = db.collection('medicines').order_by('__name__').limit(page_size)
+    last = None
+    while True:
+        page_query = query.start_after(last) if last is not None else query
+        docs = list(page_query.stream())
+        if not docs:
+            return
+        yield [(d.id, d.to_dict() or {}) for d in docs]
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+def iter_report_rows(db, data, columns, on_page=None):
+    """Yield output rows for the report, applying the report type's filter."""
+    today = datetime.now(timezone.utc).date()
+    horizon = today + timedelta(days=EXPIRY_HORIZON_DAYS)
+    expiry_only = data.get('type') == 'expiry'
+    for page in iter_medicine_pages(db, data):
+        for _med_id, med in page:
+            if expiry_only:
+                exp = _expiry_date(med)
+                if not exp or exp > horizon:
+                    continue
+            yield _row(med, columns)
+        if on_page:
+            on_page(len(page))
+
+
+def write_csv(path, title, columns, rows):
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8-sig') as fh:
+        writer = csv.writer(fh)
+        writer.writerow([header for _, header in columns])
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def sheet_title(title):
+    """``title`` as a valid worksheet name: forbidden characters replaced, at most 31 characters."""
+    cleaned = (title or '').translate(SHEET_TITLE_FORBIDDEN).strip().strip("'")[:31].strip()
+    return cleaned or 'Report'
+
+
+def write_xlsx(path, title, columns, rows):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError('XLSX export requires the openpyxl package')
+    # write_only keeps rows out of memory; they are spooled to a temp file
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title(title))
+    ws.append([header for _, header in columns])
+    count = 0
+    for row in rows:
+        ws.append(row)
+        count += 1
+    wb.save(path)
+    return count
+
+
+class StreamingPdfWriter:
+    """Minimal PDF writer that emits each page as soon as it is complete.
+
+    Only the byte offsets of written objects, the page object numbers and the
+    glyphs used from the Unicode font are kept in memory, so output size does
+    not affect memory use. The Unicode font is written at ``close()``, and only
+    if some text needed it.
+    """
+
+    PAGE_WIDTH = 842   # A4 landscape, in points
+    PAGE_HEIGHT = 595
+    MARGIN = 36
+    FONT_SIZE = 8
+    LINE_HEIGHT = 12
+    CELL_GAP = 4
+
+    def __init__(self, fh, title, headers, widths):
+        self._fh = fh
+        self._title = title
+        self._headers = headers
+        self._widths = widths
+        self._offsets = {}
+        self._page_ids = []
+        self._lines = []
+        self._next_id = 4  # 1 catalog, 2 page tree, 3 font
+        self._unicode_id = None  # Type0 font object, allocated on first use
+        self._glyph_text = {}  # glyph id -> text it shows, for the ToUnicode map
+        self._pos = 0
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._object(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+        self._rows_per_page = int((self.PAGE_HEIGHT - 2 * self.MARGIN - 3 * self.LINE_HEIGHT) // self.LINE_HEIGHT)
+
+    def _write(self, data):
+        self._fh.write(data)
+        self._pos += len(data)
+
+    def _object(self, obj_id, body):
+        self._offsets[obj_id] = self._pos
+        self._write(f'{obj_id} 0 obj\n'.encode('ascii') + body + b'\nendobj\n')
+
+    @staticmethod
+    def _latin(text):
+        try:
+            text.encode('latin-1')
+        except UnicodeEncodeError:
+            return False
+        return True
+
+    def _fit(self, text, width):
+        # Helvetica averages ~0.5em per glyph; truncate rather than overflow the column
+        max_chars = max(int(width / (self.FONT_SIZE * 0.5)), 1)
+        text = str(text)
+        return text if len(text) <= max_chars else text[:max_chars - 1] + '~'
+
+    def _show(self, text, size, x, y, width=None):
+        """Text operators drawing ``text`` at (x, y); right-to-left text is right-aligned in ``width``."""
+        if self._latin(text):
+            escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+            return f'BT /F1 {size} Tf {x:.1f} {y:.1f} Td ({escaped}) Tj ET'
+        font = pdf_fonts.unicode_font()
+        if self._unicode_id is None:
+            self._unicode_id = self._next_id
+            self._next_id += 1
+        glyphs = []
+        for char in pdf_fonts.visual_order(pdf_fonts.shape_arabic(text)):
+            glyph = font.glyph(char)
+            self._glyph_text.setdefault(glyph, unicodedata.normalize('NFKC', char))
+            glyphs.append(glyph)
+        if width is not None and pdf_fonts.is_rtl(text):
+            advance = sum(font.width(glyph) for glyph in glyphs) * size / 1000
+            x = max(x, x + width - self.CELL_GAP - advance)
+        hex_glyphs = ''.join(f'{glyph:04X}' for glyph in glyphs)
+        return f'BT /F2 {size} Tf {x:.1f} {y:.1f} Td <{hex_glyphs}> Tj ET'
+
+    def _text_line(self, cells, y, underline=False):
+        parts = []
+        x = self.MARGIN
+        for cell, width in zip(cells, self._widths):
+            parts.append(self._show(self._fit(cell, width), self.FONT_SIZE, x, y, width))
+            x += width
+        if underline:
+            parts.append(f'{self.MARGIN} {y - 3:.1f} m {self.PAGE_WIDTH - self.MARGIN} {y - 3:.1f} l S')
+        return '\n'.join(parts)
+
+    def add_row(self, cells):
+        self._lines.append(cells)
+        if len(self._lines) >= self._rows_per_page:
+            self._flush_page()
+
+    def _flush_page(self):
+        y = self.PAGE_HEIGHT - self.MARGIN
+        page_no = len(self._page_ids) + 1
+        ops = [self._show(f'{self._title} - page {page_no}', 12, self.MARGIN, y)]
+        y -= 2 * self.LINE_HEIGHT
+        ops.append(self._text_line(self._headers, y, underline=True))
+        for cells in self._lines:
+            y -= self.LINE_HEIGHT
+            ops.append(self._text_line(cells, y))
+        stream = '\n'.join(ops).encode('latin-1')
+        content_id, page_id = self._next_id, self._next_id + 1
+        self._next_id += 2
+        self._object(content_id, f'<< /Length {len(stream)} >>\nstream\n'.encode('ascii') + stream + b'\nendstream')
+        fonts = '/F1 3 0 R' if self._unicode_id is None else f'/F1 3 0 R /F2 {self._unicode_id} 0 R'
+        self._object(page_id, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.PAGE_WIDTH} {self.PAGE_HEIGHT}] '
+            f'/Resources << /Font << {fonts} >> >> /Contents {content_id} 0 R >>'
+        ).encode('ascii'))
+        self._page_ids.append(page_id)
+        self._lines = []
+
+    def _stream(self, obj_id, data, extra=''):
+        packed = zlib.compress(data)
+        self._object(obj_id, f'<< /Length {len(packed)} /Filter /FlateDecode{extra} >>\nstream\n'.encode('ascii')
+                     + packed + b'\nendstream')
+
+    def _to_unicode(self):
+        entries = [f'<{glyph:04X}> <{text.encode("utf-16-be").hex().upper()}>'
+                   for glyph, text in sorted(self._glyph_text.items()) if glyph and text]
+        blocks = []
+        for start in range(0, len(entries), 100):  # at most 100 entries per block
+            chunk = entries[start:start + 100]
+            blocks.append(f'{len(chunk)} beginbfchar\n' + '\n'.join(chunk) + '\nendbfchar')
+        return '\n'.join([
+            '/CIDInit /ProcSet findresource begin', '12 dict begin', 'begincmap',
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def',
+            '/CMapName /Adobe-Identity-UCS def', '/CMapType 2 def',
+            '1 begincodespacerange', '<0000> <FFFF>', 'endcodespacerange',
+            *blocks,
+            'endcmap', 'CMapName currentdict /CMap defineresource pop', 'end', 'end',
+        ]).encode('ascii')
+
+    def _write_unicode_font(self):
+        font = pdf_fonts.unicode_font()
+        glyphs = sorted(self._glyph_text)
+        name = f'{pdf_fonts.subset_tag(glyphs)}+{font.name}'
+        cid_id, descriptor_id, file_id, cmap_id = range(self._next_id, self._next_id + 4)
+        self._next_id += 4
+        widths = ' '.join(f'{glyph} [{font.width(glyph)}]' for glyph in glyphs)
+        bbox = ' '.join(str(font.scaled(v)) for v in font.bbox)
+        self._object(self._unicode_id, (
+            f'<< /Type /Font /Subtype /Type0 /BaseFont /{name} /Encoding /Identity-H '
+            f'/DescendantFonts [{cid_id} 0 R] /ToUnicode {cmap_id} 0 R >>'
+        ).encode('ascii'))
+        self._object(cid_id, (
+            f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{name} '
+            f'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+            f'/FontDescriptor {descriptor_id} 0 R /CIDToGIDMap /Identity /DW 1000 /W [{widths}] >>'
+        ).encode('ascii'))
+        self._object(descriptor_id, (
+            f'<< /Type /FontDescriptor /FontName /{name} /Flags 32 /FontBBox [{bbox}] /ItalicAngle 0 '
+            f'/Ascent {font.scaled(font.ascent)} /Descent {font.scaled(font.descent)} '
+            f'/CapHeight {font.scaled(font.cap_height)} /StemV 80 /FontFile2 {file_id} 0 R >>'
+        ).encode('ascii'))
+        subset = font.subset(glyphs)
+        self._stream(file_id, subset, f' /Length1 {len(subset)}')
+        self._stream(cmap_id, self._to_unicode())
+
+    def close(self):
+        if self._lines or not self._page_ids:
+            self._flush_page()
+        if self._unicode_id is not None:
+            self._write_unicode_font()
+        kids = ' '.join(f'{pid} 0 R' for pid in self._page_ids)
+        self._object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>'.encode('ascii'))
+        self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        xref_pos = self._pos
+        size = self._next_id
+        lines = [f'xref\n0 {size}\n', '0000000000 65535 f \n']
+        for obj_id in range(1, size):
+            lines.append(f'{self._offsets.get(obj_id, 0):010d} 00000 n \n')
+        self._write(''.join(lines).encode('ascii'))
+        self._write(f'trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_pos}\n%%EOF\n'.encode('ascii'))
+
+
+def write_pdf(path, title, columns, rows):
+    usable = StreamingPdfWriter.PAGE_WIDTH - 2 * StreamingPdfWriter.MARGIN
+    weights = {'name': 3, 'category': 2}
+    total_weight = sum(weights.get(field, 1) for field, _ in columns)
+    widths = [usable * weights.get(field, 1) / total_weight for field, _ in columns]
+    count = 0
+    with open(path, 'wb') as fh:
+        pdf = StreamingPdfWriter(fh, title or 'Report', [header for _, header in columns], widths)
+        for row in rows:
+            pdf.add_row(row)
+            count += 1
+        pdf.close()
+    return count
+
+
+WRITERS = {'csv': write_csv, 'xlsx': write_xlsx, 'pdf': write_pdf}
+
+
+def _count_medicines(db, data):
+    selected = data.get('selected_medicines') or []
+    if selected:
+        return len(selected)
+    try:
+        result = db.collection('medicines').count().get()
+        return int(result[0][0].value)
+    except Exception:
+        return None
+
+
+def export_report(db, bucket, report_id, data, progress):
+    """Render the report in its ``export_format`` and store it; returns the output descriptor."""
+    fmt = (data.get('export_format') or 'pdf').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f'Unsupported export format: {fmt}')
+    content_type, ext = FORMATS[fmt]
+    columns = report_columns(data)
+    total = _count_medicines(db, data)
+    seen = [0]
+
+    def on_page(n):
+        seen[0] += n
+        if total:
+            progress(seen[0] * 100 / total)
+
+    fd, tmp_path = tempfile.mkstemp(suffix=f'.{ext}')
+    os.close(fd)
+    try:
+        rows = iter_report_rows(db, data, columns, on_page=on_page)
+        count = WRITERS[fmt](tmp_path, data.get('title'), columns, rows)
+        output = report_storage.save_artifact(bucket, tmp_path, f'{report_id}.{ext}', content_type)
+        output['rows'] = count
+        output['format'] = fmt
+        return output
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
@@ -0,0 +1,164 @@
+"""
+In-process background runner for report generation.
+
+``reports_create()`` only writes the report document with status ``queued`` and
+hands its id to the runner, so web workers return immediately. Worker threads
+claim the report in a transaction (so two processes never build the same one),
+render the export with ``report_export``, report progress on the document and
+store the output via ``report_storage``. Status moves queued -> processing -> ready | failed.
+
+Environment:
+    REPORT_WORKERS        worker threads per process (default 2)
+    REPORT_QUEUE_SIZE     maximum queued jobs per process (default 100)
+"""
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from lazy_imports import lazy_module
+
+import report_export
+
+firestore = lazy_module('firebase_admin.firestore')
+logger = logging.getLogger(__name__)
+
+# A processing report whose heartbeat is older than this is assumed orphaned
+STALE_AFTER = timedelta(minutes=10)
+PROGRESS_INTERVAL_SECONDS = 1.0
+FINAL_STATUSES = ('ready', 'failed')
+
+
+class ReportJobRunner:
+    def __init__(self, get_clients, workers=None, max_queue=None):
+        # get_clients() -> (db, bucket); resolved per job so tests and reconnects see the current clients
+        self._get_clients = get_clients
+        self._workers = int(workers or os.environ.get('REPORT_WORKERS', '2'))
+        self._queue = queue.Queue(maxsize=int(max_queue or os.environ.get('REPORT_QUEUE_SIZE', '100')))
+        self._threads = []
+        self._lock = threading.Lock()
+        self._worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+    def _ensure_started(self):
+        # Threads start lazily so forking servers never inherit them from the master
+        with self._lock:
+            if self._threads and all(t.is_alive() for t in self._threads):
+                return
+            self._threads = [t for t in self._threads if t.is_alive()]
+            first_start = not self._threads
+            while len(self._threads) < self._workers:
+                t = threading.Thread(target=self._loop, name=f'report-worker-{len(self._threads)}', daemon=True)
+                t.start()
+                self._threads.append(t)
+        if first_start:
+            # Pick up reports a previous process accepted but never finished
+            threading.Thread(target=self._sweep, name='report-sweep', daemon=True).start()
+
+    def _sweep(self):
+        try:
+            self.requeue_unfinished()
+        except Exception as e:
+            logger.exception("Requeue sweep failed")
+
+    def submit(self, report_id) -> bool:
+        """Queue a report for generation. Returns False when the queue is full."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(report_id)
+            return True
+        except queue.Full:
+            return False
+
+    def requeue_unfinished(self, limit=50) -> int:
+        """Queue reports left ``queued`` or orphaned in ``processing`` (e.g. after a restart)."""
+        db, _bucket = self._get_clients()
+        if db is None:
+            return 0
+        count = 0
+        cutoff = datetime.now(timezone.utc) - STALE_AFTER
+        for doc in db.collection('reports').where('status', 'in', ['queued', 'processing']).limit(limit).stream():
+            data = doc.to_dict() or {}
+            heartbeat = data.get('heartbeat_at')
+            if data.get('status') == 'processing' and isinstance(heartbeat, datetime) and heartbeat > cutoff:
+                continue
+            if self.submit(doc.id):
+                count += 1
+        return count
+
+    def _loop(self):
+        while True:
+            report_id = self._queue.get()
+            try:
+                self._run(report_id)
+            except Exception as e:
+                logger.exception("Unexpected error for report %s", report_id)
+            finally:
+                self._queue.task_done()
+
+    def _claim(self, db, ref):
+        """Atomically move the report to processing; returns its data or None if not ours to build."""
+        cutoff = datetime.now(timezone.utc) - STALE_AFTER
+
+        @firestore.transactional
+        def _txn(transaction):
+            snap = ref.get(transaction=transaction)
+            if not snap.exists:
+                return None
+            data = snap.to_dict() or {}
+            status = data.get('status')
+            heartbeat = data.get('heartbeat_at')
+            orphaned = status == 'processing' and not (isinstance(heartbeat, datetime) and heartbeat > cutoff)
+            if status != 'queued' and not orphaned:
+                return None
+            transaction.update(ref, {
+                'status': 'processing',
+                'progress': 0,
+                'worker': self._worker_id,
+                'started_at': firestore.SERVER_TIMESTAMP,
+                'heartbeat_at': firestore.SERVER_TIMESTAMP,
+                'attempts': firestore.Increment(1),
+            })
+            return data
+
+        return _txn(db.transaction())
+
+    def _run(self, report_id):
+        db, bucket = self._get_clients()
+        if db is None:
+            logger.warning("Firestore unavailable; report %s left queued", report_id)
+            return
+        ref = db.collection('reports').document(report_id)
+        data = self._claim(db, ref)
+        if data is None:
+            return
+
+        last = [0.0]
+
+        def progress(pct):
+            now = time.monotonic()
+            if now - last[0] < PROGRESS_INTERVAL_SECONDS:
+                return
+            last[0] = now
+            ref.update({'progress': max(0, min(99, int(pct))), 'heartbeat_at': firestore.SERVER_TIMESTAMP})
+
+        try:
+            output = report_export.export_report(db, bucket, report_id, data, progress)
+            ref.update({
+                'status': 'ready',
+                'progress': 100,
+                'output': output,
+                'error': None,
+                'finished_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP,
+            })
+        except Exception as e:
+            logger.exception("Report %s failed", report_id)
+            ref.update({
+                'status': 'failed',
+                'error': str(e)[:500],
+                'finished_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP,
+            })
+
@@ -0,0 +1,53 @@
+"""
+Storage for generated report files.
+
+Artifacts go to the Firebase Storage ``bucket`` when one is configured and to a
+local directory otherwise (REPORTS_LOCAL_DIR, default ./instance/reports), so
+report generation also works in development without cloud credentials.
+"""
+import os
+import shutil
+from typing import Optional
+
+REPORTS_PREFIX = 'reports'
+CHUNK_SIZE = 256 * 1024
+
+
+def local_root() -> str:
+    here = os.path.dirname(os.path.abspath(__file__))
+    return os.environ.get('REPORTS_LOCAL_DIR') or os.path.join(here, 'instance', 'reports')
+
+
+def save_artifact(bucket, source_path: str, name: str, content_type: str) -> dict:
+    """Store the file at ``source_path`` under ``reports/<name>`` and describe where it went."""
+    size = os.path.getsize(source_path)
+    if bucket is not None:
+        blob_name = f'{REPORTS_PREFIX}/{name}'
+        blob = bucket.blob(blob_name)
+        blob.upload_from_filename(source_path, content_type=content_type)
+        return {'backend': 'gcs', 'path': blob_name, 'size': size, 'content_type': content_type}
+
+    root = local_root()
+    os.makedirs(root, exist_ok=True)
+    dest = os.path.join(root, name)
+    shutil.copyfile(source_path, dest)
+    return {'backend': 'local', 'path': name, 'size': size, 'content_type': content_type}
+
+
+def local_path(output: dict) -> Optional[str]:
+    """Absolute path of a locally stored artifact, or None if it is missing."""
+    if not output or output.get('backend') != 'local':
+        return None
+    root = os.path.abspath(local_root())
+    path = os.path.abspath(os.path.join(root, output.get('path') or ''))
+    # Never serve anything outside the reports directory
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def open_blob(bucket, output: dict):
+    """Open a bucket-stored artifact for chunked, seekable reads; returns (reader, size)."""
+    blob = bucket.blob(output['path'])
+    blob.reload()
+    return blob.open('rb', chunk_size=CHUNK_SIZE), blob.size
@@ -0,0 +1,99 @@
+"""
+Per-request time budgets for Firestore calls.
+
+Every request starts a ``Deadline`` (REQUEST_DEADLINE_SECONDS, overridable per
+route with the ``budget()`` decorator or REQUEST_DEADLINES). The connection
+manager in firebase_config.py reads it through ``current()`` and gives each
+Firestore attempt only the time that is left, so a slow query can no longer
+hold a worker until gunicorn kills it. Once the budget is spent, further calls
+fail fast with ``DeadlineExceededError`` and the deadline is marked
+``exceeded``; pages render what they computed so far and show it as stale.
+
+Environment:
+    REQUEST_DEADLINE_SECONDS   default budget per request (default 10)
+    REQUEST_DEADLINES          per-endpoint overrides, e.g. "dashboard=5,inventory=8";
+                               0 disables the deadline for that endpoint
+"""
+import contextvars
+import os
+import time
+from typing import Optional
+
+from flask import g, request
+
+_current = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceededError(TimeoutError):
+    """The request's time budget ran out before a Firestore call could complete."""
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        # Set once a call was refused or timed out because the budget was spent
+        self.exceeded = False
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def check(self) -> float:
+        """Remaining seconds; raises DeadlineExceededError (and marks the deadline) when none are left."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            self.exceeded = True
+            raise DeadlineExceededError(f'Request deadline of {self.seconds:g}s exceeded')
+        return remaining
+
+
+def current() -> Optional[Deadline]:
+    """The deadline of the request running in this context, if any."""
+    return _current.get()
+
+
+def budget(seconds: Optional[float]):
+    """Route decorator: give this view its own budget (None or 0 disables the deadline)."""
+    def decorator(view):
+        view._deadline_seconds = seconds
+        return view
+    return decorator
+
+
+def _overrides() -> dict:
+    out = {}
+    for part in (os.environ.get('REQUEST_DEADLINES') or '').split(','):
+        name, _, value = part.partition('=')
+        if name.strip() and value.strip():
+            try:
+                out[name.strip()] = float(value)
+            except ValueError:
+                pass
+    return out
+
+
+def init_app(app):
+    default = float(os.environ.get('REQUEST_DEADLINE_SECONDS', '10'))
+    overrides = _overrides()
+
+    @app.before_request
+    def _start_deadline():
+        g.deadline = None
+        view = app.view_functions.get(request.endpoint)
+        seconds = overrides.get(request.endpoint, getattr(view, '_deadline_seconds', default))
+        if seconds:
+            g.deadline = Deadline(seconds)
+            g._deadline_token = _current.set(g.deadline)
+
+    @app.teardown_request
+    def _end_deadline(exc=None):
+        token = g.pop('_deadline_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    @app.context_processor
+    def _inject_stale():
+        # True when some figures on the page could not be loaded within the budget
+        deadline = g.get('deadline')
+        g.stale = bool(deadline and deadline.exceeded)
+        return dict(stale=g.stale)
@@ -0,0 +1,245 @@
+"""
+Daily sales time series.
+
+Each order adds its amount, units and order count to one small document per
+UTC day in ``sales_daily/{YYYY-MM-DD}``, broken down by medicine category and
+by supplier. A report period (``PERIODS``, the same keys as the reports page
+filter) is answered by reading at most a few hundred of those documents, with
+no scan of ``orders`` or the archive.
+
+Orders created through the app are recorded in the same batch that writes the
+order (``record()``), and the contribution is stored on the order as ``sales``
+so a cancellation can subtract exactly what was added. ``rebuild_series()``
+recomputes every day from live and archived orders, e.g. after importing old
+data:
+
+    flask --app app rebuild-sales-series
+"""
+from datetime import date, datetime, timedelta, timezone
+
+from lazy_imports import lazy_module
+from order_archive import ARCHIVE_COLLECTION, parse_amount, read_rollup
+from order_workflow import order_lines, normalize_status
+
+firestore = lazy_module('firebase_admin.firestore')
+
+SERIES_COLLECTION = 'sales_daily'
+PERIODS = ('last_7_days', 'this_month', 'last_month', 'this_quarter', 'this_year', 'custom_range')
+DEFAULT_PERIOD = 'this_month'
+MAX_RANGE_DAYS = 731
+UNCATEGORIZED = 'Uncategorized'
+UNKNOWN_SUPPLIER = 'Unknown'
+BATCH_LIMIT = 400
+
+def day_ref(db, day):
+    return db.collection(SERIES_COLLECTION).document(day.isoformat())
+
+
+def _parse_day(val):
+    if isinstance(val, date):
+        return val
+    try:
+        return datetime.strptime(str(val)[:10], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def resolve_period(period, today=None, start=None, end=None):
+    """Inclusive (start, end) dates for a report period; raises ValueError for bad custom ranges."""
+    today = today or datetime.now(timezone.utc).date()
+    if period == 'last_7_days':
+        return today - timedelta(days=6), today
+    if period == 'this_month':
+        return today.replace(day=1), today
+    if period == 'last_month':
+        last = today.replace(day=1) - timedelta(days=1)
+        return last.replace(day=1), last
+    if period == 'this_quarter':
+        return date(today.year, 3 * ((today.month - 1) // 3) + 1, 1), today
+    if period == 'this_year':
+        return date(today.year, 1, 1), today
+    if period == 'custom_range':
+        start, end = _parse_day(start), _parse_day(end)
+        if start is None or end is None:
+            raise ValueError('A custom range needs a start and an end date')
+        if end < start:
+            start, end = end, start
+        if (end - start).days + 1 > MAX_RANGE_DAYS:
+            raise ValueError(f'Custom ranges are limited to {MAX_RANGE_DAYS} days')
+        return start, end
+    raise ValueError(f'Unknown report period: {period}')
+
+
+def _item_details(db, item_ids, transaction=None):
+    """{item_id: (category, price)} from inventory, falling back to medicines."""
+    details, missing = {}, list(item_ids)
+    for collection in ('inventory', 'medicines'):
+        if not missing:
+            break
+        refs = [db.collection(collection).document(iid) for iid in missing]
+        for snap in db.get_all(refs, transaction=transaction):
+            if snap.exists:
+                data = snap.to_dict() or {}
+                details[snap.id] = (str(data.get('category') or UNCATEGORIZED), parse_amount(data.get('price')))
+        missing = [iid for iid in missing if iid not in details]
+    return details
+
+
+def contribution(order, details, day):
+    """What one order adds to the series: amounts by category and supplier for ``day``."""
+    categories = {}
+    units = 0
+    lines_amount = 0.0
+    for iid, qty in order_lines(order).items():
+        category, price = details.get(iid, (UNCATEGORIZED, None))
+        amount = (price or 0.0) * qty
+        entry = categories.setdefault(category, {'amount': 0.0, 'units': 0})
+        entry['amount'] = round(entry['amount'] + amount, 2)
+        entry['units'] += qty
+        units += qty
+        lines_amount += amount
+    total = parse_amount(order.get('total'))
+    amount = round(total if total is not None else lines_amount, 2)
+    return {
+        'day': day.isoformat(),
+        'amount': amount,
+        'units': units,
+        'orders': 1,
+        'supplier': str(order.get('supplier') or UNKNOWN_SUPPLIER),
+        'categories': categories,
+    }
+
+
+def order_contribution(db, order, day=None):
+    """Contribution of a new order, looking up item categories and prices."""
+    day = day or datetime.now(timezone.utc).date()
+    return contribution(order, _item_details(db, list(order_lines(order))), day)
+
+
+def record(writer, db, contrib, sign=1):
+    """Add (sign=1) or subtract (sign=-1) a contribution to its day document via ``writer`` (batch or transaction)."""
+    inc = firestore.Increment
+    writer.set(day_ref(db, _parse_day(contrib['day'])), {
+        'day': contrib['day'],
+        'amount': inc(sign * contrib['amount']),
+        'units': inc(sign * contrib['units']),
+        'orders': inc(sign * contrib['orders']),
+        'categories': {
+            name: {'amount': inc(sign * c['amount']), 'units': inc(sign * c['units'])}
+            for name, c in contrib['categories'].items()
+        },
+        'suppliers': {
+            contrib['supplier']: {'amount': inc(sign * contrib['amount']), 'orders': inc(sign * contrib['orders'])},
+        },
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    }, merge=True)
+
+
+def read_days(db, start, end, timeout=None):
+    """[(date, data)] for the days in [start, end] that have sales, in order."""
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    kwargs = {'timeout': timeout} if timeout is not None else {}
+    snaps = {s.id: s for s in db.get_all([day_ref(db, d) for d in days], **kwargs)}
+    return [(d, snaps[d.isoformat()].to_dict() or {}) for d in days
+            if d.isoformat() in snaps and snaps[d.isoformat()].exists]
+
+
+def _totals(rows, field, metrics):
+    """{key: {metric: sum}} over the nested ``field`` map of every day row."""
+    # At most MAX_RANGE_DAYS rows of a few keys each: one pass in plain Python
+    out = {}
+    for _, data in rows:
+        for k, v in (data.get(field) or {}).items():
+            entry = out.setdefault(k, {m: 0.0 for m in metrics})
+            for metric in metrics:
+                entry[metric] += float((v or {}).get(metric) or 0)
+    return out
+
+
+def summarize(db, start, end, category=None, timeout=None):
+    """Totals, per-category and per-supplier breakdowns and a daily series for [start, end]."""
+    rows = read_days(db, start, end, timeout=timeout)
+    by_category = _totals(rows, 'categories', ('amount', 'units'))
+    by_supplier = _totals(rows, 'suppliers', ('amount', 'orders'))
+    if category:
+        chosen = by_category.get(category, {})
+        amount, units = chosen.get('amount', 0.0), chosen.get('units', 0.0)
+        orders = None  # orders are not split by category
+        daily = [(d, float(((data.get('categories') or {}).get(category) or {}).get('amount') or 0)) for d, data in rows]
+    else:
+        amount = sum(float(data.get('amount') or 0) for _, data in rows)
+        units = sum(float(data.get('units') or 0) for _, data in rows)
+        orders = int(sum(float(data.get('orders') or 0) for _, data in rows))
+        daily = [(d, float(data.get('amount') or 0)) for d, data in rows]
+    return {
+        'start': start,
+        'end': end,
+        'category': category,
+        'amount': round(amount, 2),
+        'units': int(units),
+        'orders': orders,
+        'by_category': sorted(
+            ({'name': k, 'amount': round(v['amount'], 2), 'units': int(v['units'])} for k, v in by_category.items()),
+            key=lambda r: r['amount'], reverse=True),
+        'by_supplier': sorted(
+            ({'name': k, 'amount': round(v['amount'], 2), 'orders': int(v['orders'])} for k, v in by_supplier.items()),
+            key=lambda r: r['amount'], reverse=True),
+        'daily': [{'day': d.isoformat(), 'amount': round(a, 2)} for d, a in daily],
+    }
+
+
+def _order_day(data):
+    created = data.get('date')
+    if isinstance(created, datetime):
+        if created.tzinfo is not None:
+            created = created.astimezone(timezone.utc)
+        return created.date()
+    return None
+
+
+def rebuild_series(db):
+    """Recompute every day document from live and archived orders; returns the number of days written."""
+    details = {}
+    for collection in ('medicines', 'inventory'):  # inventory wins, as in _item_details
+        for snap in db.collection(collection).stream():
+            data = snap.to_dict() or {}
+            details[snap.id] = (str(data.get('category') or UNCATEGORIZED), parse_amount(data.get('price')))
+
+    sources = [db.collection('orders')]
+    years = {key[:4] for key in (read_rollup(db).get('months') or {})}
+    sources += [db.collection(ARCHIVE_COLLECTION).document(y).collection('orders') for y in sorted(years)]
+
+    days = {}
+    for source in sources:
+        for snap in source.stream():
+            data = snap.to_dict() or {}
+            day = _order_day(data)
+            if day is None or normalize_status(data.get('status')) == 'cancelled':
+                continue
+            contrib = data.get('sales') or contribution(data, details, day)
+            entry = days.setdefault(day.isoformat(), {'day': day.isoformat(), 'amount': 0.0, 'units': 0,
+                                                      'orders': 0, 'categories': {}, 'suppliers': {}})
+            entry['amount'] = round(entry['amount'] + contrib['amount'], 2)
+            entry['units'] += contrib['units']
+            entry['orders'] += contrib['orders']
+            for name, c in contrib['categories'].items():
+                cat = entry['categories'].setdefault(name, {'amount': 0.0, 'units': 0})
+                cat['amount'] = round(cat['amount'] + c['amount'], 2)
+                cat['units'] += c['units']
+            sup = entry['suppliers'].setdefault(contrib['supplier'], {'amount': 0.0, 'orders': 0})
+            sup['amount'] = round(sup['amount'] + contrib['amount'], 2)
+            sup['orders'] += contrib['orders']
+
+    stale = [snap.reference for snap in db.collection(SERIES_COLLECTION).stream() if snap.id not in days]
+    writes = [('delete', ref, None) for ref in stale]
+    writes += [('set', day_ref(db, _parse_day(key)), {**entry, 'updated_at': firestore.SERVER_TIMESTAMP})
+               for key, entry in days.items()]
+    for i in range(0, len(writes), BATCH_LIMIT):
+        batch = db.batch()
+        for op, ref, payload in writes[i:i + BATCH_LIMIT]:
+            if op == 'delete':
+                batch.delete(ref)
+            else:
+                batch.set(ref, payload)
+        batch.commit()
+    return len(days)
@@ -0,0 +1,222 @@
+"""
+Sharded stock counters for high-contention inventory items.
+
+Firestore sustains about one write per second on a single document, and
+transactions that touch a hot document abort and retry when they collide.
+When several tills sell the same fast-moving item, its ``stock`` field is
+such a document. Items can opt into a distributed counter instead:
+
+    flask --app app shard-stock item000042 --shards 10
+
+This sets ``stock_shards: 10`` on the item. From then on, ``increment()``
+writes each stock change as a ``firestore.Increment`` on one of
+``inventory/{id}/stock_shards/{0..9}`` picked at random, without touching
+the item document. Inside a transaction this is a blind write, so it adds
+nothing to the read set. The item's stock is its ``stock`` field plus the
+``delta`` of every shard. ``overlay()`` gives list rows their summed stock,
+reading all shards of all sharded items with one ``get_all``, and keeps the
+totals for SHARDED_STOCK_CACHE_SECONDS. ``reshard()`` folds the shards back
+into ``stock`` in one transaction and sets a new shard count (0 turns
+sharding off).
+
+Items without ``stock_shards`` are written and read exactly as before.
+``python benchmarks/stock_contention.py`` compares both modes on the
+in-memory stand-in.
+
+Aggregate counter documents (counters.py) use the same scheme with a fixed
+shard count: ``add_to_counter()`` stages the increments on a random document
+of ``<counter>/shards/``, and ``merge_counts()`` adds a counter's base
+document and shards back up when it is read.
+
+Environment:
+    SHARDED_STOCK_CACHE_SECONDS   how long summed shard totals are reused (default 2)
+"""
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from lazy_imports import lazy_module
+import records
+
+firestore = lazy_module('firebase_admin.firestore')
+
+SHARDS_COLLECTION = 'stock_shards'
+MAX_SHARDS = 100
+
+
+def shard_count(data):
+    try:
+        return max(int((data or {}).get('stock_shards') or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def base_stock(data):
+    try:
+        return int((data or {}).get('stock') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def shard_ref(db, item_id, shard):
+    return db.collection('inventory').document(item_id).collection(SHARDS_COLLECTION).document(str(shard))
+
+
+def increment(writer, db, item_id, data, delta):
+    """Stage a stock change of ``delta`` for the item (``data`` is its document) on a batch or transaction."""
+    shards = shard_count(data)
+    if shards:
+        writer.set(shard_ref(db, item_id, random.randrange(shards)), {
+            'delta': firestore.Increment(delta),
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+        cache.invalidate(item_id)
+    else:
+        writer.update(db.collection('inventory').document(item_id), {
+            'stock': firestore.Increment(delta),
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        })
+
+
+def shard_sums(db, items, transaction=None):
+    """{item_id: sum of shard deltas} for ``items`` = [(item_id, shards)], read with one get_all."""
+    refs = [shard_ref(db, item_id, k) for item_id, shards in items for k in range(shards)]
+    sums = {item_id: 0 for item_id, _ in items}
+    if not refs:
+        return sums
+    kwargs = {'transaction': transaction} if transaction is not None else {}
+    for snap in db.get_all(refs, **kwargs):
+        if snap.exists:
+            item_id = snap.reference.path.split('/')[-3]
+            try:
+                sums[item_id] += int((snap.to_dict() or {}).get('delta') or 0)
+            except (TypeError, ValueError):
+                pass
+    return sums
+
+
+class ShardTotalsCache:
+    def __init__(self, ttl=None):
+        self.ttl = float(ttl if ttl is not None else os.environ.get('SHARDED_STOCK_CACHE_SECONDS', '2'))
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def sums(self, db, items):
+        """shard_sums() with each item's total reused for ``ttl`` seconds."""
+        now = time.monotonic()
+        out, missing = {}, []
+        with self._lock:
+            for item_id, shards in items:
+                entry = self._entries.get(item_id)
+                if entry is not None and entry[1] == shards and now - entry[2] < self.ttl:
+                    out[item_id] = entry[0]
+                else:
+                    missing.append((item_id, shards))
+        if missing:
+            fresh = shard_sums(db, missing)
+            with self._lock:
+                for item_id, shards in missing:
+                    self._entries[item_id] = (fresh[item_id], shards, now)
+            out.update(fresh)
+        return out
+
+    def invalidate(self, item_id=None):
+        with self._lock:
+            if item_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(item_id, None)
+
+
+cache = ShardTotalsCache()
+
+
+def overlay(db, rows):
+    """``rows`` (inventory records or dicts) with sharded items' ``stock`` replaced by the summed total.
+
+    Rows of sharded items are copied, never modified: mirror rows are shared between requests.
+    """
+    sharded = [(row['id'], shard_count(row)) for row in rows if row.get('stock_shards')]
+    sharded = [(item_id, n) for item_id, n in sharded if n]
+    if not sharded:
+        return rows
+    sums = cache.sums(db, sharded)
+    out = []
+    for row in rows:
+        if row['id'] in sums and row.get('stock_shards'):
+            stock = base_stock(row) + sums[row['id']]
+            if isinstance(row, records.Record):
+                row = records.make('inventory', row['id'], {**row.to_dict(), 'stock': stock})
+            else:
+                row = {**row, 'stock': stock}
+        out.append(row)
+    return out
+
+
+COUNTER_SHARDS_COLLECTION = 'shards'
+
+
+def counter_shard_ref(ref, shard):
+    return ref.collection(COUNTER_SHARDS_COLLECTION).document(str(shard))
+
+
+def counter_refs(ref, shards):
+    """The counter document ``ref`` and its shards, to read with one get_all."""
+    return [ref] + [counter_shard_ref(ref, k) for k in range(shards)]
+
+
+def add_to_counter(writer, ref, shards, fields):
+    """Stage ``fields`` (Increment transforms, nested maps allowed) on a random shard of the counter ``ref``."""
+    writer.set(counter_shard_ref(ref, random.randrange(shards)), fields, merge=True)
+
+
+def merge_counts(total, data):
+    """Add one shard's ``data`` into ``total``: numbers are summed, nested maps merged, timestamps kept latest."""
+    for key, value in data.items():
+        current = total.get(key)
+        if isinstance(value, dict):
+            if not isinstance(current, dict):
+                current = total[key] = {}
+            merge_counts(current, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = (current if isinstance(current, (int, float)) else 0) + value
+        elif isinstance(value, datetime):
+            total[key] = value if not isinstance(current, datetime) or value > current else current
+        elif key not in total:
+            total[key] = value
+    return total
+
+
+def reshard(db, item_id, shards):
+    """Fold the item's shards into ``stock`` and give it ``shards`` new ones (0: unsharded).
+
+    Returns (stock, previous shard count). Runs in one transaction, so stock
+    changes written to the old shards meanwhile make it retry rather than get lost.
+    """
+    if not 0 <= shards <= MAX_SHARDS:
+        raise ValueError(f'shards must be between 0 and {MAX_SHARDS}')
+    item_ref = db.collection('inventory').document(item_id)
+
+    @firestore.transactional
+    def _apply(transaction):
+        snap = item_ref.get(transaction=transaction)
+        if not snap.exists:
+            raise KeyError(item_id)
+        data = snap.to_dict() or {}
+        previous = shard_count(data)
+        sums = shard_sums(db, [(item_id, previous)], transaction=transaction)
+        stock = base_stock(data) + sums[item_id]
+        transaction.update(item_ref, {
+            'stock': stock,
+            'stock_shards': shards if shards else firestore.DELETE_FIELD,
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        })
+        for k in range(previous):
+            transaction.delete(shard_ref(db, item_id, k))
+        return stock, previous
+
+    result = _apply(db.transaction())
+    cache.invalidate(item_id)
+    return result
@@ -0,0 +1,176 @@
+"""
+Single-flight coalescing for expensive computations.
+
+When several requests need the same value at once (a dozen pharmacists opening
+the dashboard at shift start), ``SingleFlight.do(key, fn)`` lets the first
+caller run ``fn`` while the others wait for it and share its result, instead of
+each running the same collection scans in parallel.
+
+Within a worker this uses a lock and an event per key. With
+SINGLEFLIGHT_DIR set, flights are also coalesced across gunicorn workers on the
+same host: the leader holds an ``fcntl`` lock on ``<dir>/<key>.lock`` and
+writes its result to ``<dir>/<key>.json``; a worker that had to wait for the
+lock reads that result instead of computing again. Results that cannot be
+JSON-encoded are simply not shared across processes.
+
+Waiting is bounded by SINGLEFLIGHT_TIMEOUT and by the request deadline (see
+request_deadline.py); a caller that gives up waiting runs ``fn`` itself.
+
+Environment:
+    SINGLEFLIGHT_DIR       directory for cross-process lock/result files (unset: in-process only)
+    SINGLEFLIGHT_TIMEOUT   seconds a caller waits for another's flight (default 30)
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import request_deadline
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process coalescing only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, lock_dir=None, timeout=None):
+        self.lock_dir = lock_dir if lock_dir is not None else (os.environ.get('SINGLEFLIGHT_DIR') or None)
+        self.timeout = float(timeout if timeout is not None else os.environ.get('SINGLEFLIGHT_TIMEOUT', '30'))
+        if self.lock_dir and fcntl is None:
+            logger.warning('fcntl is unavailable; coalescing within this process only')
+            self.lock_dir = None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {'leaders': 0, 'shared': 0, 'shared_remote': 0, 'wait_timeouts': 0}
+
+    def do(self, key, fn):
+        """Run ``fn()`` once for all concurrent callers of ``key`` and return its result to each."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            if call.done.wait(self._wait_seconds()):
+                with self._lock:
+                    self._counters['shared'] += 1
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            with self._lock:
+                self._counters['wait_timeouts'] += 1
+            return fn()
+
+        try:
+            call.result = self._run(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _wait_seconds(self):
+        deadline = request_deadline.current()
+        if deadline is None:
+            return self.timeout
+        return min(self.timeout, deadline.remaining())
+
+    def _run(self, key, fn):
+        if not self.lock_dir:
+            with self._lock:
+                self._counters['leaders'] += 1
+            return fn()
+
+        base = os.path.join(self.lock_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', str(key)))
+        started = time.time()
+        with open(base + '.lock', 'a') as lock_file:
+            if not self._acquire(lock_file):
+                with self._lock:
+                    self._counters['wait_timeouts'] += 1
+                return fn()
+            try:
+                # Another worker finished this flight while we waited for the lock
+                shared = self._read_result(base + '.json', started)
+                if shared is not None:
+                    with self._lock:
+                        self._counters['shared_remote'] += 1
+                    return shared
+                with self._lock:
+                    self._counters['leaders'] += 1
+                result = fn()
+                self._write_result(base + '.json', result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _acquire(self, lock_file):
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            pass
+        give_up = time.monotonic() + self._wait_seconds()
+        while time.monotonic() < give_up:
+            time.sleep(0.05)
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                continue
+        return False
+
+    @staticmethod
+    def _read_result(path, started):
+        try:
+            with open(path) as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if payload.get('written_at', 0) < started:
+            return None
+        result = payload.get('result')
+        # Pairs such as (value, complete) come back from JSON as lists
+        return tuple(result) if payload.get('tuple') else result
+
+    @staticmethod
+    def _write_result(path, result):
+        payload = {'written_at': time.time(), 'tuple': isinstance(result, tuple), 'result': result}
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(payload, f)
+            os.replace(tmp, path)
+        except (TypeError, ValueError, OSError) as e:
+            logger.warning("Result for %s not shared: %s", os.path.basename(path), e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def metrics(self):
+        with self._lock:
+            return {**self._counters, 'in_flight': sorted(self._calls), 'cross_process': bool(self.lock_dir)}
@@ -0,0 +1,336 @@
+"""
+Local SQLite read replica for analytics.
+
+Questions like "sales by category" or "expiring items by supplier" need joins
+and grouped aggregations that Firestore cannot do without full scans.
+``sync_replica()`` copies the live ``medicines``, ``inventory``, ``suppliers``
+and ``orders`` collections into an indexed SQLite file (one table per
+collection plus ``order_items``), and ``run_query()`` answers the named
+analytics queries in ``QUERIES`` from it.
+
+Incremental syncs read only documents whose ``updated_at`` is at or after the
+last one seen for that collection (``sync_state`` table). They cannot see
+deletions or documents without ``updated_at``, so run a full resync
+(``full=True``) periodically; it rebuilds every table from a complete scan.
+Orders moved to the archive (order_archive.py) leave the replica on the next
+full resync.
+
+    flask --app app sync-replica          # incremental
+    flask --app app sync-replica --full   # rebuild
+
+The replica lives in the Flask instance folder (``init_app()``), so it is the
+same file wherever the app is started from.
+
+Environment:
+    SQLITE_REPLICA_PATH   replica database file; relative paths are under the instance folder (default replica.sqlite3)
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+from order_archive import parse_amount
+import sharded_counter
+
+PAGE_SIZE = 500
+_ISO = '%Y-%m-%dT%H:%M:%S.%fZ'
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_instance_dir = None
+# Replica files whose schema this process has already created
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+def init_app(app):
+    global _instance_dir
+    _instance_dir = app.instance_path
+
+
+def replica_path():
+    path = os.environ.get('SQLITE_REPLICA_PATH', 'replica.sqlite3')
+    if not os.path.isabs(path):
+        # Flask's default instance folder when init_app() has not run (e.g. in scripts)
+        path = os.path.join(_instance_dir or os.path.join(ROOT, 'instance'), path)
+    return path
+
+
+def _iso(val):
+    if isinstance(val, datetime):
+        if val.tzinfo is not None:
+            val = val.astimezone(timezone.utc)
+        return val.strftime(_ISO)
+    return None
+
+
+def _day(val):
+    """YYYY-MM-DD for timestamps and date strings such as medicine expiry."""
+    if isinstance(val, datetime):
+        return _iso(val)[:10]
+    if isinstance(val, str):
+        try:
+            return datetime.strptime(val[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            return None
+    return None
+
+
+def _int(val):
+    try:
+        return int(val) if val is not None and str(val) != '' else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(val):
+    return str(val) if val not in (None, '') else None
+
+
+# Extracted, typed columns per collection; the full document is kept in `data` as JSON
+COLUMNS = {
+    'medicines': {
+        'name': lambda d: _text(d.get('name')),
+        'category': lambda d: _text(d.get('category')),
+        'supplier': lambda d: _text(d.get('supplier')),
+        'stock': lambda d: _int(d.get('stock')),
+        'price': lambda d: parse_amount(d.get('price')),
+        'expiry': lambda d: _day(d.get('expiry') or d.get('expiration')),
+    },
+    'inventory': {
+        'name': lambda d: _text(d.get('name')),
+        'category': lambda d: _text(d.get('category')),
+        'supplier': lambda d: _text(d.get('supplier')),
+        'stock': lambda d: _int(d.get('stock')),
+        'min_stock': lambda d: _int(d.get('min')),
+        'price': lambda d: parse_amount(d.get('price')),
+        'expiry': lambda d: _day(d.get('expiry') or d.get('expiration')),
+    },
+    'suppliers': {
+        'name': lambda d: _text(d.get('name')),
+        'email': lambda d: _text(d.get('email')),
+        'phone': lambda d: _text(d.get('phone')),
+    },
+    'orders': {
+        'supplier': lambda d: _text(d.get('supplier')),
+        'status': lambda d: _text(d.get('status')),
+        'total': lambda d: parse_amount(d.get('total')),
+        'date': lambda d: _iso(d.get('date')),
+        'delivered_at': lambda d: _iso(d.get('delivered_at')),
+    },
+}
+COLUMN_TYPES = {'stock': 'INTEGER', 'min_stock': 'INTEGER', 'price': 'REAL', 'total': 'REAL'}
+
+SCHEMA = [
+    *(
+        f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, "
+        + ''.join(f"{col} {COLUMN_TYPES.get(col, 'TEXT')}, " for col in columns)
+        + "updated_at TEXT, data TEXT)"
+        for table, columns in COLUMNS.items()
+    ),
+    "CREATE TABLE IF NOT EXISTS order_items (order_id TEXT NOT NULL, item_id TEXT NOT NULL, quantity INTEGER)",
+    "CREATE TABLE IF NOT EXISTS sync_state (collection TEXT PRIMARY KEY, last_updated_at TEXT, "
+    "last_sync TEXT, last_full_sync TEXT, rows INTEGER)",
+    "CREATE INDEX IF NOT EXISTS idx_medicines_category ON medicines (category)",
+    "CREATE INDEX IF NOT EXISTS idx_medicines_expiry ON medicines (expiry, supplier)",
+    "CREATE INDEX IF NOT EXISTS idx_inventory_category ON inventory (category)",
+    "CREATE INDEX IF NOT EXISTS idx_inventory_expiry ON inventory (expiry, supplier)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_date ON orders (date, status)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_supplier ON orders (supplier, date)",
+    "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_order_items_item ON order_items (item_id)",
+]
+
+
+def connect(path=None):
+    path = path or replica_path()
+    # A file removed while the process runs is recreated with its schema
+    fresh = path not in _schema_ready or not os.path.exists(path)
+    if fresh:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if fresh:
+        with _schema_lock:
+            # Readers (the analytics routes) never block the sync writer; WAL mode persists in the file
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            _schema_ready.add(path)
+    return conn
+
+
+def _upsert(conn, table, doc_id, data):
+    columns = COLUMNS[table]
+    values = [doc_id, *(extract(data) for extract in columns.values()),
+              _iso(data.get('updated_at')), json.dumps(data, default=str, ensure_ascii=False)]
+    names = ['id', *columns, 'updated_at', 'data']
+    conn.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                 values)
+    if table == 'orders':
+        conn.execute('DELETE FROM order_items WHERE order_id = ?', (doc_id,))
+        rows = []
+        for row in data.get('items') or []:
+            row = row or {}
+            item_id = row.get('item_id') or row.get('id') or row.get('code')
+            if item_id:
+                rows.append((doc_id, str(item_id), _int(row.get('quantity')) or 0))
+        conn.executemany('INSERT INTO order_items (order_id, item_id, quantity) VALUES (?, ?, ?)', rows)
+
+
+def _pages(db, collection, since):
+    query = db.collection(collection)
+    if since is not None:
+        query = query.where('updated_at', '>=', since).order_by('updated_at')
+    query = query.limit(PAGE_SIZE)
+    cursor = None
+    while True:
+        page = list((query.start_after(cursor) if cursor is not None else query).stream())
+        if not page:
+            return
+        yield page
+        if len(page) < PAGE_SIZE:
+            return
+        cursor = page[-1]
+
+
+def _sync_sharded_stock(db, conn):
+    """Rewrite items with sharded stock with their summed total; shard writes leave the item's updated_at alone."""
+    items = [(snap.id, snap.to_dict() or {})
+             for snap in db.collection('inventory').where('stock_shards', '>', 0).stream()]
+    sums = sharded_counter.shard_sums(db, [(item_id, sharded_counter.shard_count(data)) for item_id, data in items])
+    for item_id, data in items:
+        _upsert(conn, 'inventory', item_id, {**data, 'stock': sharded_counter.base_stock(data) + sums[item_id]})
+
+
+def sync_collection(db, conn, collection, full=False):
+    """Copy one collection into the replica; returns the number of documents written."""
+    state = conn.execute('SELECT last_updated_at FROM sync_state WHERE collection = ?', (collection,)).fetchone()
+    since = None
+    if not full and state is not None and state['last_updated_at']:
+        since = datetime.strptime(state['last_updated_at'], _ISO).replace(tzinfo=timezone.utc)
+
+    written, latest = 0, state['last_updated_at'] if state is not None and not full else None
+    if since is None:
+        # Documents written during or after this scan carry a later updated_at. Start the next incremental sync
+        # there even when no scanned document has the field (with slack for clock skew against the server).
+        latest = _iso(datetime.now(timezone.utc) - timedelta(minutes=5))
+    with conn:
+        if since is None:
+            # Full rebuild: rows for deleted or archived documents go away
+            conn.execute(f'DELETE FROM {collection}')
+            if collection == 'orders':
+                conn.execute('DELETE FROM order_items')
+        for page in _pages(db, collection, since):
+            for snap in page:
+                data = snap.to_dict() or {}
+                _upsert(conn, collection, snap.id, data)
+                stamp = _iso(data.get('updated_at'))
+                if stamp and (latest is None or stamp > latest):
+                    latest = stamp
+                written += 1
+        if collection == 'inventory':
+            _sync_sharded_stock(db, conn)
+        now = _iso(datetime.now(timezone.utc))
+        rows = conn.execute(f'SELECT COUNT(*) FROM {collection}').fetchone()[0]
+        conn.execute(
+            "INSERT INTO sync_state (collection, last_updated_at, last_sync, last_full_sync, rows) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(collection) DO UPDATE SET "
+            "last_updated_at = excluded.last_updated_at, last_sync = excluded.last_sync, "
+            "last_full_sync = COALESCE(excluded.last_full_sync, sync_state.last_full_sync), rows = excluded.rows",
+            (collection, latest, now, now if since is None else None, rows),
+        )
+    return written
+
+
+def sync_replica(db, full=False, path=None, collections=None):
+    """Sync every replicated collection; returns {collection: documents written}."""
+    conn = connect(path)
+    try:
+        return {name: sync_collection(db, conn, name, full=full) for name in (collections or COLUMNS)}
+    finally:
+        conn.close()
+
+
+def sync_status(path=None):
+    if not os.path.exists(path or replica_path()):
+        return None
+    conn = connect(path)
+    try:
+        return {row['collection']: dict(row) for row in conn.execute('SELECT * FROM sync_state')}
+    finally:
+        conn.close()
+
+
+def _range(args, default_days=30):
+    end = _day(args.get('end')) or (date.today() + timedelta(days=1)).isoformat()
+    start = _day(args.get('start')) or (date.fromisoformat(end) - timedelta(days=default_days)).isoformat()
+    return start, end
+
+
+def _sales_by_category(conn, args):
+    start, end = _range(args)
+    rows = conn.execute(
+        """
+        SELECT COALESCE(i.category, m.category, 'Uncategorized') AS category,
+               COUNT(DISTINCT o.id) AS orders,
+               SUM(oi.quantity) AS units,
+               ROUND(SUM(oi.quantity * COALESCE(i.price, m.price, 0)), 2) AS amount
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        LEFT JOIN inventory i ON i.id = oi.item_id
+        LEFT JOIN medicines m ON m.id = oi.item_id
+        WHERE o.date >= ? AND o.date < ? AND COALESCE(o.status, '') NOT IN ('cancelled', 'ملغي')
+        GROUP BY 1 ORDER BY amount DESC
+        """, (start, end)).fetchall()
+    return {'start': start, 'end': end, 'rows': [dict(r) for r in rows]}
+
+
+def _expiring_by_supplier(conn, args):
+    days = _int(args.get('days')) or 30
+    today = date.today().isoformat()
+    horizon = (date.today() + timedelta(days=days)).isoformat()
+    rows = conn.execute(
+        """
+        SELECT COALESCE(supplier, 'Unknown') AS supplier, COUNT(*) AS items, SUM(COALESCE(stock, 0)) AS units,
+               MIN(expiry) AS first_expiry
+        FROM (SELECT supplier, stock, expiry FROM inventory WHERE expiry >= ? AND expiry <= ?
+              UNION ALL
+              -- A document in both collections is counted once, as its inventory row
+              SELECT supplier, stock, expiry FROM medicines m WHERE expiry >= ? AND expiry <= ?
+                AND NOT EXISTS (SELECT 1 FROM inventory i WHERE i.id = m.id))
+        GROUP BY 1 ORDER BY items DESC
+        """, (today, horizon, today, horizon)).fetchall()
+    return {'days': days, 'rows': [dict(r) for r in rows]}
+
+
+def _orders_by_month(conn, args):
+    start, end = _range(args, default_days=365)
+    rows = conn.execute(
+        """
+        SELECT substr(date, 1, 7) AS month, COUNT(*) AS orders, ROUND(SUM(COALESCE(total, 0)), 2) AS amount
+        FROM orders WHERE date >= ? AND date < ?
+        GROUP BY 1 ORDER BY 1
+        """, (start, end)).fetchall()
+    return {'start': start, 'end': end, 'rows': [dict(r) for r in rows]}
+
+
+QUERIES = {
+    'sales_by_category': _sales_by_category,
+    'expiring_by_supplier': _expiring_by_supplier,
+    'orders_by_month': _orders_by_month,
+}
+
+
+def run_query(name, args, path=None):
+    """Run a named analytics query; None when the replica has not been synced yet."""
+    if name not in QUERIES:
+        raise KeyError(name)
+    if not os.path.exists(path or replica_path()):
+        return None
+    conn = connect(path)
+    try:
+        return QUERIES[name](conn, args)
+    finally:
+        conn.close()
@@ -0,0 +1,164 @@
+"""
+Stale-while-revalidate cache for computed page statistics.
+
+The stats dicts behind the dashboard, inventory, orders and suppliers pages
+change slowly but cost whole-collection scans. ``StatsCache.get(key, compute)``
+returns a cached value while it is younger than ``ttl``. Past that, and up to
+``max_stale``, it still returns the cached value at once and recomputes it in a
+background thread. Only entries older than ``max_stale`` (or missing) make the
+request wait for ``compute``.
+
+``compute`` returns ``(value, complete)``. Incomplete results (a query failed
+or the request deadline ran out part-way) are returned to the caller but never
+cached, so one slow request cannot pin partial figures for everyone. The
+request is marked with ``g.partial_stats`` so its page is not given an ETag
+(watermarks.py).
+
+Concurrent misses and refreshes for the same key go through a ``SingleFlight``
+(singleflight.py), so they share one computation, across workers too when
+SINGLEFLIGHT_DIR is set.
+
+Write routes call ``invalidate(key, ...)`` after changing the data behind a
+key. ``metrics()`` reports hits, misses, stale hits, refreshes and entry ages.
+
+Environment:
+    STATS_CACHE_TTL         seconds a value is served without recomputing (default 60)
+    STATS_CACHE_MAX_STALE   seconds a stale value may still be served (default 600)
+    STATS_CACHE_SIZE        maximum number of entries, least recently used evicted (default 64)
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, has_request_context
+
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ('value', 'stored_at', 'hits')
+
+    def __init__(self, value):
+        self.value = value
+        self.stored_at = time.monotonic()
+        self.hits = 0
+
+
+class StatsCache:
+    def __init__(self, ttl=None, max_stale=None, max_entries=None, flight=None):
+        self.ttl = float(ttl if ttl is not None else os.environ.get('STATS_CACHE_TTL', '60'))
+        self.max_stale = float(max_stale if max_stale is not None else os.environ.get('STATS_CACHE_MAX_STALE', '600'))
+        self.max_entries = int(max_entries if max_entries is not None else os.environ.get('STATS_CACHE_SIZE', '64'))
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        # Bumped by invalidate(); a refresh that started before it must not store its result
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self.flight = flight if flight is not None else SingleFlight()
+        self._counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0,
+                          'refresh_errors': 0, 'partial': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key, compute, ttl=None):
+        """Cached value for ``key``; ``compute() -> (value, complete)`` fills or refreshes it."""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry.stored_at
+                if age < ttl:
+                    self._hit(key, entry, 'hits')
+                    return entry.value
+                if age < self.max_stale:
+                    self._hit(key, entry, 'stale_hits')
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._submit(key, compute)
+                    return entry.value
+            self._counters['misses'] += 1
+            generation = self._generation(key)
+
+        value, complete = self.flight.do(key, compute)
+        self._store(key, value, complete, generation)
+        if not complete and has_request_context():
+            g.partial_stats = True
+        return value
+
+    def _generation(self, key):
+        return (self._epoch, self._generations.get(key, 0))
+
+    def _hit(self, key, entry, counter):
+        entry.hits += 1
+        self._counters[counter] += 1
+        self._entries.move_to_end(key)
+
+    def _submit(self, key, compute):
+        # Created lazily so forking servers never inherit the pool's threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='stats-refresh')
+        self._executor.submit(self._refresh, key, compute, self._generation(key))
+
+    def _refresh(self, key, compute, generation):
+        try:
+            value, complete = self.flight.do(key, compute)
+            with self._lock:
+                self._counters['refreshes'] += 1
+            self._store(key, value, complete, generation)
+        except Exception as e:
+            with self._lock:
+                self._counters['refresh_errors'] += 1
+            logger.exception("Background refresh of %s failed", key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, value, complete, generation):
+        with self._lock:
+            if not complete:
+                self._counters['partial'] += 1
+                return
+            if self._generation(key) != generation:
+                # Invalidated while computing; the result may predate the write
+                return
+            self._entries[key] = _Entry(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def invalidate(self, *keys):
+        """Drop the given keys (all keys when none are given) so the next read recomputes."""
+        with self._lock:
+            if not keys:
+                self._entries.clear()
+                self._epoch += 1
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._counters['invalidations'] += 1
+
+    def metrics(self):
+        with self._lock:
+            now = time.monotonic()
+            lookups = self._counters['hits'] + self._counters['stale_hits'] + self._counters['misses']
+            return {
+                **self._counters,
+                'hit_ratio': round((self._counters['hits'] + self._counters['stale_hits']) / lookups, 3) if lookups else None,
+                'ttl': self.ttl,
+                'max_stale': self.max_stale,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'refreshing': sorted(self._refreshing),
+                'singleflight': self.flight.metrics(),
+                'entries': [
+                    {'key': key, 'age_seconds': round(now - e.stored_at, 1), 'hits': e.hits,
+                     'stale': now - e.stored_at >= self.ttl}
+                    for key, e in self._entries.items()
+                ],
+            }
@@ -0,0 +1,211 @@
+"""
+Bulk stock adjustments after a delivery or a stock-take.
+
+Each row names an inventory item and either a ``delta`` (units to add, or
+remove when negative) or a ``counted`` shelf quantity:
+
+    item_id,delta            item_id,counted
+    item000042,12            item000042,30
+    item000077,-3            item000077,0
+
+``parse_csv()`` / ``parse_json()`` turn an upload into rows and
+``validate()`` checks every row before anything is written; rows for the same
+item are merged (deltas add up, a count cannot be mixed with other rows).
+``apply_adjustments()`` then reads the items BATCH_SIZE at a time with one
+``get_all`` and writes each chunk in one batch: a ``firestore.Increment`` per
+item, plus a single update of the inventory counters (counters.py) and the
+inventory watermark (watermarks.py) for the whole chunk. Items with sharded
+stock (sharded_counter.py) are read as their summed total and the increment
+goes to one of their shards. A count is applied
+as the increment from the stock read just before, so units sold while the
+batch is in flight are still subtracted. Adjustments that change nothing are
+not written.
+
+The result is a diff report (before/after per item, unknown items, totals).
+A chunk that fails to commit stops the run; the report lists what was
+applied before it and what was not.
+
+    flask --app app adjust-stock counts.csv --dry-run
+    POST /inventory/adjust  {"rows": [{"item_id": "...", "delta": 5}], "dry_run": true}
+
+Environment:
+    STOCK_ADJUST_MAX_ROWS   rows accepted per upload (default 20000)
+"""
+import csv
+import io
+import logging
+import os
+
+import counters
+import sharded_counter
+import watermarks
+
+logger = logging.getLogger(__name__)
+
+# Item updates per batch; the counters and watermark writes keep it under Firestore's 500
+BATCH_SIZE = 400
+KINDS = ('delta', 'counted')
+
+
+class AdjustmentError(ValueError):
+    """The upload as a whole is unusable (no rows, too many rows, unreadable file)."""
+
+
+def max_rows():
+    return int(os.environ.get('STOCK_ADJUST_MAX_ROWS', '20000'))
+
+
+def parse_csv(text):
+    """Rows from CSV text with an ``item_id`` column and a ``delta`` and/or ``counted`` column."""
+    reader = csv.DictReader(io.StringIO(text.lstrip('\ufeff')))
+    columns = {(c or '').strip().lower() for c in (reader.fieldnames or [])}
+    if 'item_id' not in columns or not columns & set(KINDS):
+        raise AdjustmentError('The CSV needs an item_id column and a delta or counted column')
+    return [{(k or '').strip().lower(): (v or '').strip() for k, v in row.items()} for row in reader]
+
+
+def parse_json(payload):
+    """Rows from a JSON list, or from an object with a ``rows`` list."""
+    rows = payload.get('rows') if isinstance(payload, dict) else payload
+    if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+        raise AdjustmentError('Expected a list of {item_id, delta} or {item_id, counted} objects')
+    return rows
+
+
+def _int(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(value)
+        return int(value)
+    return int(value)
+
+
+def validate(rows):
+    """(adjustments, errors): ``{item_id: (kind, n)}`` in upload order, and ``[{row, error}]``."""
+    if not rows:
+        raise AdjustmentError('No rows to apply')
+    if len(rows) > max_rows():
+        raise AdjustmentError(f'Too many rows ({len(rows)}); the limit is {max_rows()}')
+    adjustments, errors = {}, []
+    for number, row in enumerate(rows, start=1):
+        item_id = str(row.get('item_id') or '').strip()
+        given = [k for k in KINDS if row.get(k) not in (None, '')]
+        if not item_id or '/' in item_id:
+            errors.append({'row': number, 'error': 'Missing or invalid item_id'})
+            continue
+        if len(given) != 1:
+            errors.append({'row': number, 'item_id': item_id, 'error': 'Give exactly one of delta or counted'})
+            continue
+        kind = given[0]
+        try:
+            n = _int(row[kind])
+        except (TypeError, ValueError):
+            errors.append({'row': number, 'item_id': item_id, 'error': f'{kind} must be a whole number'})
+            continue
+        if kind == 'counted' and n < 0:
+            errors.append({'row': number, 'item_id': item_id, 'error': 'counted cannot be negative'})
+            continue
+        previous = adjustments.get(item_id)
+        if previous is None:
+            adjustments[item_id] = (kind, n)
+        elif kind == 'delta' and previous[0] == 'delta':
+            adjustments[item_id] = ('delta', previous[1] + n)
+        else:
+            errors.append({'row': number, 'item_id': item_id,
+                           'error': 'A counted row cannot be combined with other rows for the same item'})
+    return adjustments, errors
+
+
+def _stock(data):
+    try:
+        return int(data.get('stock') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _direct(fn, *args, idempotent=True, **kwargs):
+    return fn(*args, **kwargs)
+
+
+def apply_adjustments(db, adjustments, dry_run=False, call=None):
+    """Apply validated ``adjustments`` in batches; returns the diff report.
+
+    ``call`` runs each Firestore read and commit (the connection manager's
+    ``call`` in the web app, so they get its retries and request deadline).
+    """
+    call = call or _direct
+    report = {
+        'dry_run': dry_run,
+        'requested': len(adjustments),
+        'changed': 0,
+        'unchanged': 0,
+        'missing': [],
+        'units_delta': 0,
+        'batches': 0,
+        'changes': [],
+        'error': None,
+        'not_applied': [],
+    }
+    coll = db.collection('inventory')
+    item_ids = list(adjustments)
+    for start in range(0, len(item_ids), BATCH_SIZE):
+        chunk = item_ids[start:start + BATCH_SIZE]
+        try:
+            snaps = call(lambda: list(db.get_all([coll.document(i) for i in chunk])))
+            found = {s.id: s.to_dict() or {} for s in snaps if s.exists}
+            sharded = [(i, sharded_counter.shard_count(d)) for i, d in found.items() if d.get('stock_shards')]
+            shard_sums = call(sharded_counter.shard_sums, db, sharded) if sharded else {}
+        except Exception as e:
+            if not report['batches']:
+                raise
+            # Earlier chunks are committed; report them instead of failing the whole run
+            logger.exception("Reading stock adjustment chunk %d failed", report['batches'] + 1)
+            report['error'] = str(e) or e.__class__.__name__
+            report['not_applied'] = item_ids[start:]
+            return report
+        changes = []
+        for item_id in chunk:
+            data = found.get(item_id)
+            if data is None:
+                report['missing'].append(item_id)
+                continue
+            kind, n = adjustments[item_id]
+            before = _stock(data) + shard_sums.get(item_id, 0)
+            delta = n if kind == 'delta' else n - before
+            if delta == 0:
+                report['unchanged'] += 1
+                continue
+            changes.append({'item_id': item_id, 'name': data.get('name'), 'kind': kind,
+                            'before': before, 'after': before + delta, 'delta': delta})
+        units = sum(c['delta'] for c in changes)
+
+        if changes and not dry_run:
+            batch = db.batch()
+            for change in changes:
+                sharded_counter.increment(batch, db, change['item_id'], found[change['item_id']], change['delta'])
+            counters.stock_adjusted(batch, db, units)
+            watermarks.bump(batch, db, 'inventory')
+            try:
+                call(batch.commit, idempotent=False)
+            except Exception as e:
+                logger.exception("Stock adjustment batch %d failed", report['batches'] + 1)
+                report['error'] = str(e) or e.__class__.__name__
+                report['not_applied'] = [c['item_id'] for c in changes] + item_ids[start + BATCH_SIZE:]
+                return report
+            report['batches'] += 1
+        report['changed'] += len(changes)
+        report['units_delta'] += units
+        report['changes'].extend(changes)
+    return report
+
+
+def report_csv(report):
+    """The report's per-item changes as CSV text."""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=['item_id', 'name', 'kind', 'before', 'delta', 'after'])
+    writer.writeheader()
+    for change in report['changes']:
+        writer.writerow(change)
+    return out.getvalue()
@@ -373,6 +373,47 @@ _translations = {
         'non_prescription': 'Non-prescription',
         'medical_supplies': 'Medical supplies',
         'equipment': 'Equipment',
+        'mark_as': 'Mark as',
+        'report_created_success': 'Report queued for generation',
+        'error_creating_report': 'An error occurred while creating the report',
+        'report_queue_busy': 'The report queue is busy; your report will be generated shortly',
+        'report_all_medicines_hint': 'Leave empty to include every medicine',
+        'report_status_queued': 'Queued',
+        'report_status_processing': 'Processing',
+        'report_status_ready': 'Ready',
+        'report_status_failed': 'Failed',
+        'no_alerts': 'No alerts',
+        'alert_expired': 'Expired',
+        'alert_expiring': 'Expiring soon',
+        'alert_out_of_stock': 'Out of stock',
+        'alert_critical': 'Critical stock',
+        'alert_low_stock': 'Low stock',
+        'stale_data_notice': 'Some figures could not be loaded in time and may be incomplete. Refresh to try again.',
+        'database_unavailable': 'The database is temporarily unavailable. Figures may be missing or out of date; please try again shortly.',
+        'sales_summary': 'Sales summary',
+        'units_sold': 'Units',
+        'top_categories': 'By category',
+        'top_suppliers': 'By supplier',
+        'no_sales_in_period': 'No sales in this period',
+        'stock_adjust_help': 'Correct stock after a delivery or a stock-take: upload or paste rows of item_id with delta or counted.',
+        'stock_adjust_file': 'CSV file',
+        'stock_adjust_format': 'Columns: item_id and delta (units to add or remove) or counted (units on the shelf).',
+        'stock_adjust_paste': 'Or paste CSV',
+        'stock_adjust_preview': 'Preview',
+        'stock_adjust_apply': 'Apply adjustments',
+        'stock_adjust_invalid_rows': 'Invalid rows, nothing was applied',
+        'stock_adjust_preview_title': 'Preview (not applied)',
+        'stock_adjust_applied_title': 'Applied',
+        'stock_adjust_changed': 'Changed',
+        'stock_adjust_unchanged': 'Unchanged',
+        'stock_adjust_units': 'Units',
+        'stock_adjust_missing': 'Unknown items',
+        'stock_adjust_failed': 'Stopped before finishing',
+        'stock_adjust_before': 'Before',
+        'stock_adjust_delta': 'Change',
+        'stock_adjust_after': 'After',
+        'stock_adjust_nothing': 'No stock changes',
+        'stock_adjust_truncated': 'Showing the first 500 changes',
     },
     'ar': {
         # Navigation
@@ -745,6 +786,49 @@ _translations = {
         'non_prescription': 'بدون وصفة طبية',
         'medical_supplies': 'المستلزمات الطبية',
         'equipment': 'المعدات',
+        'mark_as': 'تحديد كـ',
+        'report_created_success': 'تمت إضافة التقرير إلى قائمة الإنشاء',
+        'error_creating_report': 'حدث خطأ أثناء إنشاء التقرير',
+        'report_queue_busy': 'قائمة التقارير مشغولة؛ سيتم إنشاء تقريرك قريباً',
+        'report_all_medicines_hint': 'اتركه فارغاً لتضمين جميع الأدوية',
+        'report_status_queued': 'في الانتظار',
+        'report_status_processing': 'جاري المعالجة',
+        'report_status_ready': 'جاهز',
+        'report_status_failed': 'فشل',
+        'no_alerts': 'لا توجد تنبيهات',
+        'alert_expired': 'منتهي الصلاحية',
+        'alert_expiring': 'تنتهي صلاحيته قريباً',
+        'alert_out_of_stock': 'غير متوفر',
+        'alert_critical': 'مخزون حرج',
+        'alert_low_stock': 'مخزون منخفض',
+        'stale_data_notice': 'تعذر تحميل بعض الأرقام في الوقت المحدد وقد تكون غير مكتملة. حدّث الصفحة للمحاولة مجدداً.',
+        'database_unavailable': 'قاعدة البيانات غير متاحة مؤقتاً. قد تكون الأرقام ناقصة أو غير محدثة، يرجى المحاولة بعد قليل.',
+        'start_date': 'تاريخ البداية',
+        'end_date': 'تاريخ النهاية',
+        'sales_summary': 'ملخص المبيعات',
+        'units_sold': 'الوحدات',
+        'top_categories': 'حسب الفئة',
+        'top_suppliers': 'حسب المورد',
+        'no_sales_in_period': 'لا توجد مبيعات في هذه الفترة',
+        'stock_adjust_help': 'صحّح المخزون بعد التوريد أو الجرد: ارفع أو الصق صفوفاً تحتوي item_id مع delta أو counted.',
+        'stock_adjust_file': 'ملف CSV',
+        'stock_adjust_format': 'الأعمدة: item_id و delta (الوحدات المضافة أو المخصومة) أو counted (الوحدات على الرف).',
+        'stock_adjust_paste': 'أو الصق CSV',
+        'stock_adjust_preview': 'معاينة',
+        'stock_adjust_apply': 'تطبيق التعديلات',
+        'stock_adjust_invalid_rows': 'صفوف غير صالحة، لم يتم تطبيق أي شيء',
+        'stock_adjust_preview_title': 'معاينة (لم تُطبّق)',
+        'stock_adjust_applied_title': 'تم التطبيق',
+        'stock_adjust_changed': 'تم تغييرها',
+        'stock_adjust_unchanged': 'بدون تغيير',
+        'stock_adjust_units': 'الوحدات',
+        'stock_adjust_missing': 'أصناف غير معروفة',
+        'stock_adjust_failed': 'توقف قبل الانتهاء',
+        'stock_adjust_before': 'قبل',
+        'stock_adjust_delta': 'التغيير',
+        'stock_adjust_after': 'بعد',
+        'stock_adjust_nothing': 'لا توجد تغييرات في المخزون',
+        'stock_adjust_truncated': 'عرض أول 500 تغيير',
     }
 }
 
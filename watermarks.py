@@ -0,0 +1,237 @@
+"""
+Per-collection change watermarks and conditional GETs for the list pages.
+
+Every write to a watched collection also bumps ``watermarks/<collection>``
+(``version`` incremented, ``changed_at`` set to the server time) in the same
+batch or transaction, through ``bump(writer, db, 'medicines')``.
+
+``ConditionalPages.conditional('inventory', 'orders', stats_keys=('inventory',))``
+wraps a page view. It reads the watermarks of the collections the page shows
+(one ``get_all``), derives a weak ETag from them plus the user's language,
+role and uid, today's date, the deployed templates and code, and the shared
+page state (the header alert bell), and answers a matching ``If-None-Match``
+(or, without one, an ``If-Modified-Since`` not older than the newest
+``changed_at``) with a 304 before the view reads any data. Otherwise the view
+runs and its page is sent with the ETag and Last-Modified.
+
+The watermarks also keep other workers' caches honest: when a worker sees a
+version it has not seen before, it drops the ``stats_keys`` entries from its
+stats cache, so the page it renders matches the ETag it sends. While a
+mirrored collection (collection_mirror.py) changed less than
+WATERMARK_SETTLE_SECONDS ago, the mirror may not have caught up and pages are
+sent without validators.
+
+Requests with pending flash messages are never answered with a 304, and pages
+rendered from partial data get no validators: when the request deadline ran
+out (request_deadline.py), stats came back incomplete (``g.partial_stats``,
+stats_cache.py) or ``degraded()`` reports Firestore as unavailable. Otherwise
+a client would be told that degraded page is current until the next write. Writes
+made outside the app (console edits, imports) do not bump watermarks; run
+``flask bump-watermarks`` afterwards.
+
+Environment:
+    CONDITIONAL_PAGES          0 disables ETags and 304s on the list pages (default 1)
+    WATERMARK_SETTLE_SECONDS   seconds a mirrored collection is given to catch up after a change (default 5)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import g, make_response, request, session
+from werkzeug.http import is_resource_modified
+from werkzeug.wrappers import Response
+
+from lazy_imports import lazy_module
+
+firestore = lazy_module('firebase_admin.firestore')
+
+logger = logging.getLogger(__name__)
+
+WATERMARKS_COLLECTION = 'watermarks'
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def watermark_ref(db, collection):
+    return db.collection(WATERMARKS_COLLECTION).document(collection)
+
+
+def bump(writer, db, *collections):
+    """Stage a watermark bump for each of ``collections`` on a batch or transaction."""
+    for collection in collections:
+        writer.set(watermark_ref(db, collection), {
+            'version': firestore.Increment(1),
+            'changed_at': firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+
+
+def bump_now(db, *collections):
+    batch = db.batch()
+    bump(batch, db, *collections)
+    batch.commit()
+
+
+_release = None
+
+
+def release_token():
+    """Fingerprint of the templates, translations and code in this checkout; computed once per process."""
+    global _release
+    if _release is None:
+        digest = hashlib.sha1()
+        paths = [os.path.join(ROOT, n) for n in os.listdir(ROOT) if n.endswith('.py')]
+        for dirpath, _dirnames, filenames in os.walk(os.path.join(ROOT, 'templates')):
+            paths.extend(os.path.join(dirpath, n) for n in filenames)
+        paths.append(os.path.join(ROOT, 'static', 'dist', 'manifest.json'))
+        for path in sorted(paths):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            digest.update(f'{os.path.relpath(path, ROOT)}:{st.st_size}:{st.st_mtime_ns};'.encode())
+        _release = digest.hexdigest()[:16]
+    return _release
+
+
+def _aware(value):
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class ConditionalPages:
+    def __init__(self, get_db, read_many, stats_cache=None, mirror=None, page_state=None, settle_seconds=None,
+                 on_change=None, degraded=None):
+        """``read_many(refs)`` fetches snapshots (the connection manager's get_all);
+        ``page_state()`` returns JSON-able values every page shows besides its data;
+        ``on_change(collections)`` is called with the collections whose watermark moved;
+        ``degraded()`` is true while pages can only show partial data."""
+        self.get_db = get_db
+        self.read_many = read_many
+        self.stats_cache = stats_cache
+        self.mirror = mirror
+        self.page_state = page_state
+        self.on_change = on_change
+        self.degraded = degraded
+        self.settle_seconds = float(settle_seconds if settle_seconds is not None
+                                    else os.environ.get('WATERMARK_SETTLE_SECONDS', '5'))
+        self.enabled = os.environ.get('CONDITIONAL_PAGES', '1') != '0'
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._counters = {'not_modified': 0, 'rendered': 0, 'unsettled': 0, 'errors': 0, 'partial': 0}
+
+    def read(self, collections):
+        """{collection: (version, changed_at)}; (0, None) for collections never bumped."""
+        db = self.get_db()
+        if db is None:
+            raise RuntimeError('Firestore client is not initialized')
+        marks = {c: (0, None) for c in collections}
+        for snap in self.read_many([watermark_ref(db, c) for c in collections]):
+            if snap.exists:
+                data = snap.to_dict() or {}
+                marks[snap.id] = (int(data.get('version') or 0), _aware(data.get('changed_at')))
+        return marks
+
+    def _note(self, marks, stats_keys):
+        """Drop this worker's cached stats for the page when a watermark moved since it last looked."""
+        with self._lock:
+            moved = [c for c, mark in marks.items() if self._seen.get(c, mark) != mark]
+            self._seen.update(marks)
+        if moved and self.stats_cache is not None and stats_keys:
+            self.stats_cache.invalidate(*stats_keys)
+        if moved and self.on_change is not None:
+            self.on_change(moved)
+
+    def _unsettled(self, marks):
+        if self.mirror is None or not self.settle_seconds:
+            return False
+        now = datetime.now(timezone.utc)
+        return any(changed_at is not None and self.mirror.warm(c)
+                   and (now - changed_at).total_seconds() < self.settle_seconds
+                   for c, (_version, changed_at) in marks.items())
+
+    def _partial(self):
+        """Whether this request's page is (or would be) built from incomplete data."""
+        deadline = g.get('deadline')
+        if deadline is not None and deadline.exceeded:
+            return True
+        if g.get('partial_stats'):
+            return True
+        return bool(self.degraded and self.degraded())
+
+    def etag(self, marks):
+        user = session.get('user') or {}
+        parts = {
+            'marks': {c: [v, changed_at.isoformat() if changed_at else None] for c, (v, changed_at) in marks.items()},
+            'lang': g.get('lang'),
+            'role': user.get('role'),
+            'uid': user.get('uid'),
+            'day': datetime.now(timezone.utc).date().isoformat(),
+            'release': release_token(),
+            'state': self.page_state() if self.page_state else None,
+        }
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+    @staticmethod
+    def _validators(response, etag, last_modified):
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        # Cached by the browser only, and always revalidated
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
+
+    def conditional(self, *collections, stats_keys=()):
+        """Answer unchanged GETs of the wrapped page with 304 (see the module docstring)."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                    return view(*args, **kwargs)
+                try:
+                    marks = self.read(collections)
+                except Exception as e:
+                    logger.warning("Could not read watermarks for %s: %s", request.endpoint, e)
+                    with self._lock:
+                        self._counters['errors'] += 1
+                    return view(*args, **kwargs)
+                self._note(marks, stats_keys)
+                if self._unsettled(marks):
+                    with self._lock:
+                        self._counters['unsettled'] += 1
+                    return view(*args, **kwargs)
+                if self._partial():
+                    with self._lock:
+                        self._counters['partial'] += 1
+                    return view(*args, **kwargs)
+
+                etag = self.etag(marks)
+                changed = [changed_at for _v, changed_at in marks.values() if changed_at is not None]
+                last_modified = max(changed) if changed and len(changed) == len(marks) else None
+                if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                    with self._lock:
+                        self._counters['not_modified'] += 1
+                    return self._validators(Response(status=304), etag, last_modified)
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or '_flashes' in session:
+                    return response
+                if self._partial():
+                    with self._lock:
+                        self._counters['partial'] += 1
+                    return response
+                with self._lock:
+                    self._counters['rendered'] += 1
+                self._validators(response, etag, last_modified)
+                return response
+            return wrapper
+        return decorator
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._counters)